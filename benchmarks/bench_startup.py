@@ -0,0 +1,117 @@
+"""Measures cold start: import-time breakdown, headless start and time to first window.
+
+Run from the repo root (add --json to keep the numbers for comparing releases):
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --json startup.json
+
+The first-window measurement needs a display and customtkinter; it is skipped otherwise.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+def parse_importtime(stderr):
+    """Turns `-X importtime` output into a list of (module, self_us, cumulative_us, depth)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative), depth))
+    return rows
+
+def import_breakdown(code, top):
+    """Imports in a fresh interpreter and returns the total plus the slowest top-level imports."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    rows = parse_importtime(proc.stderr)
+    # Depth 0 rows are imported directly by the code; their cumulative times add up to the total
+    top_level = sorted((r for r in rows if r[3] == 0), key=lambda r: r[2], reverse=True)
+    return {
+        "total_ms": sum(r[2] for r in top_level) / 1000,
+        "modules": [{"module": r[0], "ms": r[2] / 1000} for r in top_level[:top]],
+    }
+
+def headless_start(runs):
+    """Median wall time of `main.py --help` (the CLI path) and whether Tk got imported."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", MAIN, "--help"], cwd=ROOT,
+                              capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+    loaded = {r[0] for r in parse_importtime(proc.stderr)}
+    timings.sort()
+    return {
+        "ok": proc.returncode == 0,
+        "median_ms": timings[len(timings) // 2] * 1000,
+        "imports_tk": any(m.split(".")[0] in ("tkinter", "_tkinter", "customtkinter") for m in loaded),
+    }
+
+def first_window(runs, timeout):
+    """Median time from process start until the main window has drawn its first frame."""
+    env = dict(os.environ, BOOTCFG_STARTUP_PROBE="1")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, MAIN], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            for line in proc.stdout:
+                if line.strip() == "first-window":
+                    timings.append(time.perf_counter() - start)
+                    break
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        if not timings:
+            return None  # No display or customtkinter missing
+    timings.sort()
+    return {"median_ms": timings[len(timings) // 2] * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0]}
+
+    results["gui_imports"] = import_breakdown("import main", args.top)
+    if results["gui_imports"]:
+        print(f"GUI module import: {results['gui_imports']['total_ms']:.1f} ms")
+        for row in results["gui_imports"]["modules"]:
+            print(f"  {row['module']:<30} {row['ms']:8.1f} ms")
+    else:
+        print("GUI module import: skipped (customtkinter not installed?)")
+
+    results["headless"] = headless_start(args.runs)
+    h = results["headless"]
+    print(f"Headless start (main.py --help): {h['median_ms']:.1f} ms, "
+          f"Tk imported: {'YES' if h['imports_tk'] else 'no'}{'' if h['ok'] else ' (FAILED)'}")
+
+    results["first_window"] = first_window(args.runs, args.timeout)
+    if results["first_window"]:
+        print(f"Time to first window: {results['first_window']['median_ms']:.1f} ms")
+    else:
+        print("Time to first window: skipped (needs a display and customtkinter)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if h["imports_tk"] or not h["ok"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
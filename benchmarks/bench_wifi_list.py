@@ -0,0 +1,54 @@
+"""Measures Wi-Fi dialog reorder latency for growing network lists.
+
+Needs a display (it creates real widgets). Run from the repo root:
+
+    python benchmarks/bench_wifi_list.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import customtkinter as ctk
+from main import NetworkListView
+
+SIZES = [10, 100, 1000]
+REORDERS = 50
+
+def measure(root, size):
+    networks = [{"ssid": f"Network {i}", "psk": "secret123"} for i in range(size)]
+
+    def move_up(index):
+        if index > 0:
+            networks[index], networks[index - 1] = networks[index - 1], networks[index]
+            view.ensure_visible(index - 1)
+
+    view = NetworkListView(root, networks, on_move_up=move_up, on_move_down=lambda i: None,
+                           on_edit=lambda n: None, on_remove=lambda n: None)
+    view.pack(fill="both", expand=True)
+    root.update()
+
+    timings = []
+    for i in range(REORDERS):
+        index = (i % (size - 1)) + 1
+        start = time.perf_counter()
+        move_up(index)
+        root.update_idletasks()
+        timings.append(time.perf_counter() - start)
+
+    view.destroy()
+    timings.sort()
+    return timings[len(timings) // 2], timings[-1]
+
+def main():
+    root = ctk.CTk()
+    root.geometry("600x400")
+    print(f"{'Networks':>8}  {'median ms':>9}  {'max ms':>7}")
+    for size in SIZES:
+        median, worst = measure(root, size)
+        print(f"{size:>8}  {median * 1000:>9.2f}  {worst * 1000:>7.2f}")
+    root.destroy()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Benchmark suite for the hot paths: boot file parsers/writers, status scans, hashing and netsh parsing.
+
+Run from the repo root:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json --threshold 0.25
+
+With --baseline, any benchmark whose median time got slower by more than the threshold (25% by
+default) is reported and the exit code is 1, so CI can fail on regressions.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_ops import BootConfigManager
+from utils.crypto import generate_password_hash, fastest_backend
+from utils.wifi_utils import parse_profile_names, parse_profile_key, parse_exported_profiles
+from utils.boot_txt import edits_key, render_config_txt
+
+NETWORK_COUNTS = [1, 10, 100, 1000]
+
+# --- Canned netsh output ---
+def netsh_profiles_output(count):
+    lines = ["", "Profiles on interface Wi-Fi:", "", "Group policy profiles (read only)",
+             "---------------------------------", "    <None>", "", "User profiles", "-------------"]
+    lines += [f"    All User Profile     : Network {i}" for i in range(count)]
+    return "\r\n".join(lines) + "\r\n"
+
+NETSH_PROFILE_OUTPUT = "\r\n".join([
+    "Profile HomeWifi on interface Wi-Fi:",
+    "=======================================================================",
+    "Applied: All User Profile",
+    "Profile information",
+    "-------------------",
+    "    Version                : 1",
+    "    Type                   : Wireless LAN",
+    "    Name                   : HomeWifi",
+    "Security settings",
+    "-----------------",
+    "    Authentication         : WPA2-Personal",
+    "    Cipher                 : CCMP",
+    "    Security key           : Present",
+    "    Key Content            : secret123",
+]) + "\r\n"
+
+WLAN_XML = """<?xml version="1.0"?>
+<WLANProfile xmlns="http://www.microsoft.com/networking/WLAN/profile/v1">
+    <name>Network {i}</name>
+    <SSIDConfig><SSID><name>Network {i}</name></SSID></SSIDConfig>
+    <MSM><security>
+        <authEncryption><authentication>WPA2PSK</authentication><encryption>AES</encryption></authEncryption>
+        <sharedKey><keyType>passPhrase</keyType><protected>false</protected><keyMaterial>secret{i:04d}</keyMaterial></sharedKey>
+    </security></MSM>
+</WLANProfile>
+"""
+
+# --- Cases ---
+def make_networks(count):
+    return [{"ssid": f"Network {i}", "psk": f"secret{i:04d}", "priority": str(100 - i)} for i in range(count)]
+
+def alternate(*calls):
+    """One call per run, cycling through calls: each write differs from what is on disk, so write elision can't skip it."""
+    cycle = itertools.cycle(calls)
+    return lambda: next(cycle)()
+
+def build_cases(workdir, quick):
+    """Returns [(name, fn)]; each fn does one unit of work on fixtures created under workdir."""
+    cases = []
+    counts = NETWORK_COUNTS[:3] if quick else NETWORK_COUNTS
+
+    for count in counts:
+        boot = os.path.join(workdir, f"wpa{count}")
+        os.makedirs(boot)
+        mgr = BootConfigManager(boot)
+        config = {"country": "US", "ctrl_interface_dir": "/var/run/wpa_supplicant", "ctrl_interface_group": "netdev"}
+        networks = make_networks(count)
+        mgr.write_wpa_supplicant(config, networks)
+
+        def parse(mgr=mgr):
+            mgr.invalidate_cache()  # measure the real read + parse
+            mgr.parse_wpa_supplicant()
+        cases.append((f"wpa_parse[{count}]", parse))
+        cases.append((f"wpa_parse_cached[{count}]", mgr.parse_wpa_supplicant))
+        changed = networks[:-1] + [dict(networks[-1], priority="0")]
+        cases.append((f"wpa_write[{count}]", alternate(
+            lambda mgr=mgr, networks=changed, config=config: mgr.write_wpa_supplicant(config, networks),
+            lambda mgr=mgr, networks=networks, config=config: mgr.write_wpa_supplicant(config, networks))))
+
+        # Re-writing what is already there: only the stat and digest compare of write elision
+        boot = os.path.join(workdir, f"wpa{count}_elided")
+        os.makedirs(boot)
+        elided_mgr = BootConfigManager(boot)
+        elided_mgr.write_wpa_supplicant(config, networks)
+        cases.append((f"wpa_write_elided[{count}]",
+                      lambda mgr=elided_mgr, networks=networks, config=config: mgr.write_wpa_supplicant(config, networks)))
+
+    boot = os.path.join(workdir, "user")
+    os.makedirs(boot)
+    mgr = BootConfigManager(boot)
+    pw_hash = generate_password_hash("raspberry")
+    mgr.write_userconf("pi", pw_hash)
+
+    def parse_user(mgr=mgr):
+        mgr.invalidate_cache()
+        mgr.parse_userconf()
+    cases.append(("userconf_parse", parse_user))
+    other_hash = generate_password_hash("raspberry")
+    cases.append(("userconf_write", alternate(lambda: mgr.write_userconf("pi", other_hash),
+                                              lambda: mgr.write_userconf("pi", pw_hash))))
+    boot = os.path.join(workdir, "user_elided")
+    os.makedirs(boot)
+    elided_mgr = BootConfigManager(boot)
+    elided_mgr.write_userconf("pi", pw_hash)
+    cases.append(("userconf_write_elided", lambda: elided_mgr.write_userconf("pi", pw_hash)))
+
+    # A realistic boot partition: firmware, overlays folder and the config files
+    boot = os.path.join(workdir, "status")
+    os.makedirs(os.path.join(boot, "overlays"))
+    for name in ["bootcode.bin", "start.elf", "start4.elf", "fixup.dat", "fixup4.dat", "kernel8.img",
+                 "config.txt", "cmdline.txt", "ssh", "userconf.txt", "wpa_supplicant.conf"] + \
+                [f"bcm27{i:02d}-rpi.dtb" for i in range(20)]:
+        open(os.path.join(boot, name), "wb").close()
+    status_mgr = BootConfigManager(boot)
+
+    def scan(mgr=status_mgr):
+        mgr.invalidate_cache()
+        mgr.check_files_status()
+    cases.append(("status_scan", scan))
+    cases.append(("status_scan_cached", status_mgr.check_files_status))
+
+    # config.txt edits: cold parse + serialize vs the memoised path every further card takes
+    lines = ["# Raspberry Pi config", "dtparam=audio=on", "camera_auto_detect=1", "display_auto_detect=1",
+             "[pi4]", "arm_boost=1", "[cm4]", "otg_mode=1", "[all]", "dtoverlay=vc4-kms-v3d"]
+    lines += [f"# option {i}\ndtparam=param{i}=on" for i in range(100)]
+    config_text = "\n".join(lines) + "\n"
+    config_edits = edits_key({"all": {"enable_uart": 1, "dtoverlay": "disable-bt"}, "pi4": {"arm_freq": 1800}})
+
+    def edit_cold():
+        render_config_txt.cache_clear()
+        render_config_txt(config_text, config_edits)
+    cases.append(("config_txt_edit", edit_cold))
+    cases.append(("config_txt_edit_memo", lambda: render_config_txt(config_text, config_edits)))
+
+    backend = fastest_backend()
+    cases.append((f"password_hash[{backend}]", lambda: generate_password_hash("raspberry", backend=backend)))
+
+    profiles_output = netsh_profiles_output(200)
+    cases.append(("netsh_profile_names[200]", lambda: parse_profile_names(profiles_output)))
+    cases.append(("netsh_profile_key", lambda: parse_profile_key(NETSH_PROFILE_OUTPUT)))
+    xml_dir = os.path.join(workdir, "netsh_export")
+    os.makedirs(xml_dir)
+    for i in range(50):
+        with open(os.path.join(xml_dir, f"Wi-Fi-Network {i}.xml"), "w", encoding="utf-8") as f:
+            f.write(WLAN_XML.format(i=i))
+    cases.append(("netsh_export_parse[50]", lambda: parse_exported_profiles(xml_dir)))
+    return cases
+
+# --- Runner ---
+def measure(fn, repeat, min_time):
+    """Median and best seconds per call over `repeat` rounds of an auto-sized loop."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    # autorange stops at 0.2 s; scale the loop to the requested round length
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    rounds = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    return {"median_s": rounds[len(rounds) // 2], "min_s": rounds[0], "loops": number, "rounds": repeat}
+
+def compare(results, baseline, threshold):
+    """Returns [(name, old, new, change)] for benchmarks that got slower than the threshold allows."""
+    regressions = []
+    for name, res in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = res["median_s"] / old["median_s"] - 1
+        if change > threshold:
+            regressions.append((name, old["median_s"], res["median_s"], change))
+    return regressions
+
+def fmt_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timing round")
+    parser.add_argument("--quick", action="store_true", help="Skip the 1000-network cases")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    workdir = tempfile.mkdtemp(prefix="bootcfg-bench-")
+    results = {}
+    try:
+        for name, fn in build_cases(workdir, args.quick):
+            if args.filter and args.filter not in name:
+                continue
+            res = measure(fn, args.repeat, args.min_time)
+            results[name] = res
+            note = ""
+            if baseline and name in baseline:
+                change = res["median_s"] / baseline[name]["median_s"] - 1
+                note = f"  {change:+.1%}"
+            print(f"{name:<28} {fmt_time(res['median_s']):>10}  (best {fmt_time(res['min_s'])}){note}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        data = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "hash_backend": fastest_backend(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {fmt_time(old)} -> {fmt_time(new)} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions above {args.threshold:.0%}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Simulates card readers on shared USB buses to compare fixed and adaptive write concurrency.
+
+No hardware needed: every fake card "writes" by sleeping for as long as its bus would take.
+A bus has a total bandwidth, each card a top write speed, and past `saturation` concurrent
+writers the bus thrashes and its total bandwidth drops. Every card also pays a fixed
+overhead (open, fsync, directory update) that doesn't use the bus.
+
+    python benchmarks/sim_io_scheduler.py
+    python benchmarks/sim_io_scheduler.py --cards 40 --json sim.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import metrics
+from utils.io_scheduler import AdaptiveScheduler, format_report
+
+CHUNK = 256 * 1024
+
+class FakeBus:
+    def __init__(self, name, bandwidth_mb_s, saturation, penalty):
+        self.name = name
+        self.bandwidth = bandwidth_mb_s * 1e6
+        self.saturation = saturation
+        self.penalty = penalty
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def per_writer(self, card_speed):
+        """Bytes/s one writer gets with the current number of active writers."""
+        n = max(1, self.active)
+        overload = max(0, n - self.saturation)
+        total = self.bandwidth * max(0.3, 1 - self.penalty * overload)
+        return min(card_speed, total / n)
+
+    def write(self, card, size):
+        with self._lock:
+            self.active += 1
+        try:
+            written = 0
+            while written < size:
+                chunk = min(CHUNK, size - written)
+                time.sleep(chunk / self.per_writer(card.speed))
+                written += chunk
+                metrics.add("bytes_written", chunk)  # what BootConfigManager reports for real writes
+        finally:
+            with self._lock:
+                self.active -= 1
+
+class FakeCard:
+    def __init__(self, name, bus, speed_mb_s, overhead_s, size):
+        self.name = name
+        self.bus = bus
+        self.speed = speed_mb_s * 1e6
+        self.overhead = overhead_s
+        self.size = size
+
+    def provision(self):
+        time.sleep(self.overhead)
+        self.bus.write(self, self.size)
+        return {"boot_path": self.name, "ok": True, "error": None}
+
+def make_fleet(cards_per_bus, size_mb):
+    buses = [
+        # A USB 2 hub: little bandwidth, thrashes beyond two writers
+        (FakeBus("usb1", 35, saturation=2, penalty=0.25), 20, 0.15),
+        # A USB 3 hub: room for several cards at once
+        (FakeBus("usb2", 320, saturation=6, penalty=0.1), 40, 0.15),
+    ]
+    cards = []
+    for bus, speed, overhead in buses:
+        for i in range(cards_per_bus):
+            cards.append(FakeCard(f"{bus.name}-card{i:02d}", bus, speed, overhead, int(size_mb * 1e6)))
+    return cards
+
+def run_policy(name, cards, initial, maximum, adaptive):
+    group_of = lambda card: (card.bus.name, card.name)
+    if adaptive:
+        scheduler = AdaptiveScheduler(group_of, initial=initial, max_per_group=maximum, min_window_s=0.3)
+    else:
+        # A fixed limit: the same scheduler with the controller pinned
+        scheduler = AdaptiveScheduler(group_of, initial=initial, max_per_group=initial, min_window_s=1e9)
+    start = time.perf_counter()
+    results = scheduler.run(cards, lambda card: card.provision())
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in results if r["ok"])
+    return {"policy": name, "cards": ok, "seconds": elapsed, "cards_per_hour": ok / elapsed * 3600,
+            "report": scheduler.report()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=24, help="Cards per bus")
+    parser.add_argument("--size-mb", type=float, default=4.0, help="Megabytes written per card")
+    parser.add_argument("--max", type=int, default=8, help="Highest concurrency per bus")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    policies = [
+        ("serial (1 per bus)", 1, False),
+        (f"all at once ({args.max} per bus)", args.max, False),
+        ("adaptive (AIMD)", 1, True),
+    ]
+    runs = []
+    for name, initial, adaptive in policies:
+        run = run_policy(name, make_fleet(args.cards, args.size_mb), initial, args.max, adaptive)
+        runs.append(run)
+        print(f"{name:<28} {run['seconds']:6.2f}s  {run['cards_per_hour']:8.0f} cards/hour", flush=True)
+        if adaptive:
+            print(format_report(run["report"]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(runs, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
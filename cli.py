@@ -0,0 +1,599 @@
+"""Headless command line entry point.
+
+Never imports customtkinter/tkinter so it can run on build boxes without a display.
+
+    python cli.py batch profile.json /media/card1/boot /media/card2/boot ...
+"""
+import argparse
+import sys
+import time
+
+def _boot_paths(args):
+    boot_paths = list(args.boot_paths)
+    if args.paths_file:
+        with open(args.paths_file, 'r', encoding='utf-8') as f:
+            boot_paths.extend(line.strip() for line in f if line.strip())
+    return boot_paths
+
+def _state_store(args):
+    if args.no_state:
+        return None
+    from utils.planner import StateStore
+    return StateStore(args.state)
+
+def _verify_results(args, results, elapsed):
+    """Reads written files back from the cards and prints both phases' throughput; True if all match."""
+    from utils.provision import verify_batch, throughput
+
+    # Read everything back from the cards as a second phase, so both phases get their own throughput
+    verified_ok = True
+    verify_start = time.perf_counter()
+    verifications = verify_batch(results, workers=args.workers, direct=args.direct,
+                                 use_processes=getattr(args, "processes", False))
+    verify_elapsed = time.perf_counter() - verify_start
+    for v in verifications:
+        if not v["ok"]:
+            verified_ok = False
+            print(f"READ-BACK FAILED {v['boot_path']}: {v['error'] or ', '.join(v['mismatches'])}")
+    if any(not v["bypassed"] for v in verifications):
+        print("Note: the page cache could not be bypassed here; read-back only proves the OS has the data.")
+    t = throughput(results, verifications, elapsed, verify_elapsed)
+    print(f"Write:  {t['write_bytes'] / 1e3:.1f} KB in {t['write_s']:.2f}s ({t['write_mb_s']:.2f} MB/s)")
+    print(f"Verify: {t['verify_bytes'] / 1e3:.1f} KB in {t['verify_s']:.2f}s ({t['verify_mb_s']:.2f} MB/s), "
+          f"{sum(1 for v in verifications if v['ok'])}/{len(verifications)} cards match")
+    return verified_ok
+
+def cmd_batch(args):
+    from utils.provision import load_profile, batch_provision, format_results
+
+    boot_paths = _boot_paths(args)
+    if not boot_paths:
+        print("No boot paths given.", file=sys.stderr)
+        return 2
+
+    profile = load_profile(args.profile)
+    state = None if args.processes else _state_store(args)
+    snapshots = None
+    if not args.no_snapshot:
+        from utils.snapshots import SnapshotStore
+        snapshots = SnapshotStore(args.snapshot_dir)
+    scheduler = None
+    if args.adaptive:
+        if args.processes:
+            print("--adaptive runs on threads; drop --processes.", file=sys.stderr)
+            return 2
+        from utils.io_scheduler import AdaptiveScheduler
+        scheduler = AdaptiveScheduler(max_per_group=args.max_per_bus)
+    start = time.perf_counter()
+    results = batch_provision(boot_paths, profile, workers=args.workers, use_processes=args.processes,
+                              state=state, snapshots=snapshots, scheduler=scheduler)
+    elapsed = time.perf_counter() - start
+    if state is not None:
+        state.save()
+
+    print(format_results(results))
+    if scheduler is not None:
+        from utils.io_scheduler import format_report
+        print(format_report(scheduler.report()))
+    written = sum(1 for r in results for action in r["plan"].values() if action != "unchanged")
+    print(f"Wall time: {elapsed:.2f}s, {written} file(s) written")
+    if snapshots is not None and written:
+        print("Previous files saved; undo with: python cli.py rollback <boot path>")
+
+    verified_ok = args.no_verify or _verify_results(args, results, elapsed)
+    return 0 if all(r["ok"] for r in results) and verified_ok else 1
+
+def cmd_plan(args):
+    """plan: show what batch would change; check: the same, exiting 1 if any card drifted."""
+    from utils.provision import load_profile
+    from utils.planner import check_drift, format_plan, has_drift
+
+    boot_paths = _boot_paths(args)
+    if not boot_paths:
+        print("No boot paths given.", file=sys.stderr)
+        return 2
+
+    state = _state_store(args)
+    start = time.perf_counter()
+    results = check_drift(boot_paths, load_profile(args.profile), workers=args.workers, state=state)
+    elapsed = time.perf_counter() - start
+    if state is not None:
+        state.save()
+
+    if args.command == "check":
+        results_shown = [r for r in results if has_drift(r)]
+        print(format_plan(results_shown) if results_shown else "All cards match the profile.")
+    else:
+        print(format_plan(results))
+    skipped = f", {state.hits} file(s) vouched for by stat" if state is not None else ""
+    print(f"Checked {len(results)} card(s) in {elapsed:.2f}s{skipped}")
+    if args.command == "check":
+        return 1 if any(has_drift(r) for r in results) else 0
+    return 0 if all(r["ok"] for r in results) else 1
+
+def cmd_manifest(args):
+    import json
+    import os
+    from utils.manifest import run_manifest
+    from utils.provision import load_profile
+
+    base = load_profile(args.profile) if args.profile else {}
+    checkpoint = args.checkpoint or f"{args.manifest}.checkpoint.json"
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    snapshots = None
+    if not args.no_snapshot and not args.golden:
+        from utils.snapshots import SnapshotStore
+        snapshots = SnapshotStore(args.snapshot_dir)
+
+    log = open(args.log, "a", encoding="utf-8") if args.log else None
+    progress = {"n": 0, "last": time.perf_counter()}
+
+    def on_result(res):
+        progress["n"] += 1
+        if log:
+            log.write(json.dumps(res) + "\n")
+        if not res["ok"]:
+            print(f"row {res['row']} ({res['boot_path']}): FAILED: {res['error']}", file=sys.stderr)
+        now = time.perf_counter()
+        if now - progress["last"] >= 5:
+            progress["last"] = now
+            print(f"... {progress['n']} devices done", flush=True)
+
+    try:
+        counts = run_manifest(args.manifest, base, checkpoint, workers=args.workers, window=args.window,
+                              golden=args.golden, snapshots=snapshots, verify=not args.no_verify,
+                              retry_failed=args.retry_failed, on_result=on_result)
+    except KeyboardInterrupt:
+        print(f"Interrupted; progress saved to {checkpoint}. Run the same command again to resume.")
+        return 130
+    finally:
+        if log:
+            log.close()
+    done = counts["ok"] + counts["failed"]
+    rate = done / counts["seconds"] if counts["seconds"] else 0.0
+    print(f"{counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} skipped (already done) "
+          f"in {counts['seconds']:.1f}s ({rate:.1f} devices/s)")
+    if counts["failed"]:
+        print("Retry the failed rows with --retry-failed.")
+    return 0 if not counts["failed"] else 1
+
+def cmd_serve(args):
+    import asyncio
+    from utils.job_server import load_token, save_token, serve
+
+    def on_ready(server):
+        token_path = save_token(server.token)
+        print(f"Job server on http://{server.host}:{server.port} ({server.workers} workers). Ctrl+C to stop.", flush=True)
+        print(f"Access token: {server.token} (saved to {token_path} for 'cli.py submit')", flush=True)
+
+    token = load_token() if args.keep_token else None
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_queue, on_ready=on_ready, token=token))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def cmd_submit(args):
+    from urllib.error import HTTPError, URLError
+    from utils.job_server import submit_job, follow_job
+    from utils.provision import load_profile
+
+    profile = load_profile(args.profile)
+    try:
+        jobs = [submit_job(args.url, path, profile, verify=not args.no_verify, token=args.token)
+                for path in args.boot_paths]
+    except HTTPError as e:
+        print(f"Job server refused the job: {e.code} {e.reason}", file=sys.stderr)
+        return 2
+    except URLError as e:
+        print(f"Job server not reachable at {args.url}: {e}", file=sys.stderr)
+        return 2
+    for job in jobs:
+        print(f"job {job['id']}: {job['boot_path']} queued")
+    if not args.follow:
+        return 0
+    status = 0
+    for job in jobs:
+        for event in follow_job(args.url, job["id"], token=args.token):
+            detail = f": {event['error']}" if event["error"] else ""
+            print(f"job {event['id']} {event['boot_path']}: {event['stage']}{detail}", flush=True)
+            if event["state"] in ("failed", "cancelled"):
+                status = 1
+    return status
+
+def cmd_rollback(args):
+    from utils.file_ops import BootConfigManager
+    from utils.snapshots import SnapshotStore
+
+    store = SnapshotStore(args.snapshot_dir)
+    status = 0
+    for boot_path in args.boot_paths:
+        mgr = BootConfigManager(boot_path)
+        mgr.snapshots = store  # the rollback is itself snapshotted, so it can be undone
+        try:
+            manifest = store.rollback(mgr, args.id, force=args.force)
+        except (KeyError, OSError, ValueError) as e:
+            print(f"{boot_path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        changed = sorted(k for k, v in mgr.last_plan.items() if v != "unchanged")
+        print(f"{boot_path}: restored snapshot {manifest['id']} ({', '.join(changed) or 'already identical'})")
+    return status
+
+def cmd_snapshots(args):
+    from utils.snapshots import SnapshotStore, format_snapshots, format_stats
+
+    store = SnapshotStore(args.snapshot_dir)
+    if args.stats:
+        print(format_stats(store.stats()))
+    else:
+        print(format_snapshots(store.list_snapshots(args.boot_path)))
+    return 0
+
+def cmd_snapshot_gc(args):
+    from utils.snapshots import SnapshotStore
+
+    res = SnapshotStore(args.snapshot_dir).gc(keep=args.keep, max_age_days=args.max_age_days, dry_run=args.dry_run)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {res['manifests_removed']} snapshot(s) and {res['blobs_removed']} blob(s), "
+          f"{res['bytes_freed'] / 1024:.1f} KB")
+    return 0
+
+def cmd_bundle_export(args):
+    from utils.bundle import export_bundle, format_bundle
+
+    try:
+        manifest = export_bundle(args.boot_path, args.output)
+    except (OSError, ValueError) as e:
+        print(f"{args.boot_path}: {e}", file=sys.stderr)
+        return 1
+    print(format_bundle(manifest))
+    print(f"Saved to {args.output}")
+    return 0
+
+def cmd_bundle_apply(args):
+    from utils.bundle import load_bundle, apply_bundle_batch, format_bundle
+    from utils.provision import format_results
+
+    boot_paths = _boot_paths(args)
+    try:
+        bundle = load_bundle(args.bundle)
+    except (OSError, ValueError) as e:
+        print(f"{args.bundle}: {e}", file=sys.stderr)
+        return 2
+    if not boot_paths:
+        # Nothing to apply to: just show what the bundle holds
+        print(format_bundle(bundle["manifest"]))
+        return 0
+    snapshots = None
+    if not args.no_snapshot:
+        from utils.snapshots import SnapshotStore
+        snapshots = SnapshotStore(args.snapshot_dir)
+
+    start = time.perf_counter()
+    results = apply_bundle_batch(boot_paths, bundle, workers=args.workers, snapshots=snapshots, prune=args.prune)
+    elapsed = time.perf_counter() - start
+    print(format_results(results))
+    written = sum(1 for r in results for action in r["plan"].values() if action != "unchanged")
+    print(f"Wall time: {elapsed:.2f}s, {written} file(s) written")
+    if snapshots is not None and written:
+        print("Previous files saved; undo with: python cli.py rollback <boot path>")
+    verified_ok = args.no_verify or _verify_results(args, results, elapsed)
+    return 0 if all(r["ok"] for r in results) and verified_ok else 1
+
+def cmd_bench_hash(args):
+    from utils.crypto import benchmark_backends, hash_passwords, fastest_backend
+
+    print(f"Single-thread SHA-512 crypt, rounds={args.rounds or 'default'}:")
+    for name, rate in benchmark_backends(rounds=args.rounds, count=args.count).items():
+        print(f"  {name:<8} {rate:10.1f} hashes/sec")
+
+    start = time.perf_counter()
+    hash_passwords([f"password{i}" for i in range(args.batch)], rounds=args.rounds, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Batch of {args.batch} with '{fastest_backend()}' on a process pool: {args.batch / elapsed:.1f} hashes/sec")
+    return 0
+
+def cmd_clone(args):
+    import os
+    from utils.provision import load_profile, format_results
+    from utils.image_clone import clone_images, baseline_copy
+
+    profile = load_profile(args.profile)
+    os.makedirs(args.out_dir, exist_ok=True)
+    targets = [(os.path.join(args.out_dir, args.pattern.format(n=n)), profile) for n in range(1, args.count + 1)]
+
+    try:
+        results, stats = clone_images(args.golden, targets, workers=args.workers)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(format_results(results))
+    methods = sorted({r.get("clone_method", "-") for r in results})
+    print(f"Clone method: {', '.join(methods)}")
+    print(f"{stats['images']} images in {stats['seconds']:.2f}s: "
+          f"{stats['mb_per_sec']:.1f} MB/s, {stats['images_per_min']:.1f} images/min")
+
+    if args.compare:
+        baseline_path = os.path.join(args.out_dir, ".baseline-copy.img")
+        try:
+            base = baseline_copy(args.golden, baseline_path)
+        finally:
+            if os.path.exists(baseline_path):
+                os.remove(baseline_path)
+        print(f"shutil.copy baseline: {base['mb_per_sec']:.1f} MB/s, {base['images_per_min']:.1f} images/min")
+    return 0 if all(r["ok"] for r in results) else 1
+
+def cmd_watch(args):
+    from utils.provision import load_profile
+    from utils.hotplug import HotplugDaemon, print_event
+
+    daemon = HotplugDaemon(
+        load_profile(args.profile),
+        on_event=print_event,
+        poll_interval=args.interval,
+        workers=args.workers,
+        media_dirs=args.media_dir or None,
+        include_existing=args.include_existing,
+        on_done_cmd=args.on_done,
+    )
+    print("Waiting for boot partitions... (Ctrl+C to stop)", flush=True)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    return 0
+
+def cmd_bench_psk(args):
+    from utils.crypto import precompute_psks, clear_psk_cache
+
+    pairs = [(f"site-{i % args.ssids}", f"passphrase-{i:06d}") for i in range(args.networks)]
+    for workers in (1, args.workers):
+        clear_psk_cache()
+        start = time.perf_counter()
+        precompute_psks(pairs, workers=workers)
+        elapsed = time.perf_counter() - start
+        label = "1 process" if workers == 1 else f"{workers or 'all'} processes"
+        print(f"{args.networks} PSKs, {label}: {args.networks / elapsed:.1f} PSKs/sec")
+
+    # A fleet where every device shares the same networks: only the first device pays
+    start = time.perf_counter()
+    precompute_psks(pairs * args.devices)
+    elapsed = time.perf_counter() - start
+    print(f"{args.devices} devices x {args.networks} networks from the memo cache: {elapsed * 1000:.1f} ms")
+    return 0
+
+def cmd_net_assign(args):
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.network_config import IPPool, render_fleet
+    from utils.provision import apply_profile, format_results
+
+    devices = list(args.boot_paths) or [args.pattern.format(n=n) for n in range(1, args.count + 1)]
+    if not devices:
+        print("Give boot paths or --count.", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    try:
+        pool = IPPool(args.subnet, gateway=args.gateway, exclude=args.exclude or ())
+        for address in args.reserve or ():
+            pool.reserve(address)
+        leases = pool.allocate_many(devices)
+    except ValueError as e:
+        print(f"net-assign: {e}", file=sys.stderr)
+        return 2
+    configs = render_fleet(leases, gateway=args.gateway, dns=args.dns or (), interface=args.interface)
+    elapsed = time.perf_counter() - start
+
+    width = max(len(d) for d in devices)
+    for device, address in leases.items():
+        print(f"{device.ljust(width)}  {address}")
+    stats = pool.stats()
+    print(f"{len(leases)} addresses allocated and rendered in {elapsed * 1000:.1f} ms "
+          f"({stats['free']} of {stats['size']} still free)")
+
+    if args.boot_paths:
+        # Each card gets its own config, so apply one single-section profile per card
+        with ThreadPoolExecutor(max_workers=args.workers or min(32, len(devices))) as executor:
+            results = list(executor.map(lambda path: apply_profile(path, {"network_config": configs[path]}), devices))
+        print(format_results(results))
+        return 0 if all(r["ok"] for r in results) else 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for device, content in configs.items():
+        with open(os.path.join(args.out_dir, f"{device}.network-config"), 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+    print(f"Configs written to {args.out_dir}")
+    return 0
+
+def _add_state_args(parser):
+    parser.add_argument("--state", metavar="FILE", help="Fingerprint file (default: ~/.cache/bootcfg/fingerprints.json)")
+    parser.add_argument("--no-state", action="store_true", help="Ignore the fingerprint file and compare every file's content")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Raspberry Pi Boot Configurer (headless)")
+    parser.add_argument("--trace", metavar="FILE", help="Append one JSON line per timed operation to FILE")
+    parser.add_argument("--metrics", metavar="FILE", help="Write Prometheus text-format metrics to FILE")
+    parser.add_argument("--metrics-interval", type=float, default=15.0, help="Seconds between metrics file updates")
+    parser.add_argument("--op-summary", action="store_true", help="Print per-operation timings at the end")
+    parser.add_argument("--cprofile", action="store_true", help="Run the command under cProfile and print the hot spots")
+    parser.add_argument("--cprofile-out", metavar="FILE", help="With --cprofile: also save the stats to FILE (for snakeviz etc.)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="Apply one profile to many boot folders in parallel")
+    batch.add_argument("profile", help="Profile JSON file")
+    batch.add_argument("boot_paths", nargs="*", help="Boot folders to provision")
+    batch.add_argument("--paths-file", help="File with one boot folder per line")
+    batch.add_argument("--workers", type=int, default=None, help="Number of parallel workers")
+    batch.add_argument("--processes", action="store_true", help="Use a process pool instead of threads (disables the state file)")
+    _add_state_args(batch)
+    batch.add_argument("--adaptive", action="store_true", help="Group cards by USB bus and tune each bus's concurrency (AIMD)")
+    batch.add_argument("--max-per-bus", type=int, default=8, help="With --adaptive: most cards written at once on one bus")
+    batch.add_argument("--no-verify", action="store_true", help="Skip reading the written files back from the cards")
+    batch.add_argument("--direct", action="store_true", help="Read back with O_DIRECT instead of dropping cached pages")
+    batch.add_argument("--no-snapshot", action="store_true", help="Don't back up files before overwriting them")
+    batch.add_argument("--snapshot-dir", help="Snapshot store folder (default: ~/.cache/bootcfg/snapshots)")
+    batch.set_defaults(func=cmd_batch)
+
+    man = sub.add_parser("manifest", help="Provision every device listed in a CSV/JSONL manifest (resumable)")
+    man.add_argument("manifest", help="CSV or JSONL file, one device per row")
+    man.add_argument("--profile", help="Base profile JSON shared by every device (may define wifi_sets and defaults)")
+    man.add_argument("--checkpoint", help="Checkpoint file (default: <manifest>.checkpoint.json)")
+    man.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first row")
+    man.add_argument("--retry-failed", action="store_true", help="Only redo the rows that failed last time")
+    man.add_argument("--golden", help="Clone this image to each row's boot_path before provisioning it")
+    man.add_argument("--workers", type=int, default=8, help="Devices provisioned in parallel")
+    man.add_argument("--window", type=int, default=None, help="Rows read ahead of the finished ones (default 4 x workers)")
+    man.add_argument("--log", help="Append one JSON line per device result to this file")
+    man.add_argument("--no-verify", action="store_true", help="Skip reading the written files back")
+    man.add_argument("--no-snapshot", action="store_true", help="Don't back up files before overwriting them")
+    man.add_argument("--snapshot-dir", help="Snapshot store folder")
+    man.set_defaults(func=cmd_manifest)
+
+    srv = sub.add_parser("serve", help="Run the localhost HTTP/JSON job server for provisioning stations")
+    srv.add_argument("--host", default="127.0.0.1", help="Loopback address to listen on")
+    srv.add_argument("--port", type=int, default=8787, help="TCP port (0 picks a free one)")
+    srv.add_argument("--workers", type=int, default=4, help="Cards provisioned at the same time")
+    srv.add_argument("--max-queue", type=int, default=1000, help="Queued jobs before new ones are refused")
+    srv.add_argument("--keep-token", action="store_true", help="Reuse the saved access token instead of making a new one")
+    srv.set_defaults(func=cmd_serve)
+
+    submit = sub.add_parser("submit", help="Queue jobs on a running job server and return immediately")
+    submit.add_argument("profile", help="Profile JSON file")
+    submit.add_argument("boot_paths", nargs="+", help="Boot folders/images, one job each")
+    submit.add_argument("--url", default="http://127.0.0.1:8787", help="Job server address")
+    submit.add_argument("--token", help="Access token (default: $BOOTCFG_JOB_TOKEN or the one serve saved)")
+    submit.add_argument("--follow", action="store_true", help="Stream the jobs' progress until they finish")
+    submit.add_argument("--no-verify", action="store_true", help="Skip the read-back after writing")
+    submit.set_defaults(func=cmd_submit)
+
+    rollback = sub.add_parser("rollback", help="Restore cards' boot files from a snapshot taken before a write")
+    rollback.add_argument("boot_paths", nargs="+", help="Boot folders/images to restore")
+    rollback.add_argument("--id", help="Snapshot id (default: the newest for each card)")
+    rollback.add_argument("--force", action="store_true", help="Restore even if the card no longer holds what was written")
+    rollback.add_argument("--snapshot-dir", help="Snapshot store folder")
+    rollback.set_defaults(func=cmd_rollback)
+
+    snaps = sub.add_parser("snapshots", help="List snapshots, or show deduplication stats")
+    snaps.add_argument("boot_path", nargs="?", help="Only this card's snapshots")
+    snaps.add_argument("--stats", action="store_true", help="Show space used and saved by deduplication")
+    snaps.add_argument("--snapshot-dir", help="Snapshot store folder")
+    snaps.set_defaults(func=cmd_snapshots)
+
+    gc = sub.add_parser("snapshot-gc", help="Apply the retention policy and delete unreferenced blobs")
+    gc.add_argument("--keep", type=int, default=10, help="Snapshots kept per card")
+    gc.add_argument("--max-age-days", type=float, default=None, help="Also keep every snapshot younger than this")
+    gc.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    gc.add_argument("--snapshot-dir", help="Snapshot store folder")
+    gc.set_defaults(func=cmd_snapshot_gc)
+
+    bexport = sub.add_parser("bundle-export", help="Save a boot folder's configuration as a single-file bundle")
+    bexport.add_argument("boot_path", help="Boot folder or image to export")
+    bexport.add_argument("output", help="Bundle file to write (e.g. lab.bcfg)")
+    bexport.set_defaults(func=cmd_bundle_export)
+
+    bapply = sub.add_parser("bundle-apply", help="Copy a bundle onto many boot folders (no boot paths: show it)")
+    bapply.add_argument("bundle", help="Bundle file from bundle-export")
+    bapply.add_argument("boot_paths", nargs="*", help="Boot folders/images to write")
+    bapply.add_argument("--paths-file", help="File with one boot folder per line")
+    bapply.add_argument("--workers", type=int, default=None, help="Number of parallel workers")
+    bapply.add_argument("--prune", action="store_true", help="Also delete files the source card didn't have (e.g. ssh)")
+    bapply.add_argument("--no-verify", action="store_true", help="Skip reading the written files back from the cards")
+    bapply.add_argument("--direct", action="store_true", help="Read back with O_DIRECT instead of dropping cached pages")
+    bapply.add_argument("--no-snapshot", action="store_true", help="Don't back up files before overwriting them")
+    bapply.add_argument("--snapshot-dir", help="Snapshot store folder")
+    bapply.set_defaults(func=cmd_bundle_apply)
+
+    for name, help_text in [("plan", "Show what batch would change on each card, without writing"),
+                            ("check", "Report cards that drifted from a profile (exit code 1 if any)")]:
+        plan = sub.add_parser(name, help=help_text)
+        plan.add_argument("profile", help="Profile JSON file")
+        plan.add_argument("boot_paths", nargs="*", help="Boot folders/images to check")
+        plan.add_argument("--paths-file", help="File with one boot folder per line")
+        plan.add_argument("--workers", type=int, default=None, help="Cards checked in parallel")
+        _add_state_args(plan)
+        plan.set_defaults(func=cmd_plan)
+
+    clone = sub.add_parser("clone", help="Build per-device images from a golden image")
+    clone.add_argument("golden", help="Golden .img file")
+    clone.add_argument("profile", help="Profile JSON file applied to every clone")
+    clone.add_argument("--count", type=int, default=1, help="Number of images to build")
+    clone.add_argument("--out-dir", default=".", help="Output folder")
+    clone.add_argument("--pattern", default="device-{n:03d}.img", help="Output file name pattern")
+    clone.add_argument("--workers", type=int, default=None, help="Number of parallel workers")
+    clone.add_argument("--compare", action="store_true", help="Also time a plain shutil.copy of the image")
+    clone.set_defaults(func=cmd_clone)
+
+    watch = sub.add_parser("watch", help="Provision every Pi boot partition that gets mounted")
+    watch.add_argument("profile", help="Profile JSON file")
+    watch.add_argument("--media-dir", action="append", help="Watch sub-folders of this directory instead of the mount table (repeatable)")
+    watch.add_argument("--interval", type=float, default=1.0, help="Polling interval in seconds")
+    watch.add_argument("--workers", type=int, default=8, help="Cards provisioned at the same time")
+    watch.add_argument("--include-existing", action="store_true", help="Also provision cards already mounted at start")
+    watch.add_argument("--on-done", help="Command run with the mount point after a card is verified (e.g. an eject script)")
+    watch.set_defaults(func=cmd_watch)
+
+    bench = sub.add_parser("bench-hash", help="Report password hashing speed per backend")
+    bench.add_argument("--rounds", type=int, default=None, help="SHA-512 crypt rounds")
+    bench.add_argument("--count", type=int, default=20, help="Hashes per backend for the single-thread test")
+    bench.add_argument("--batch", type=int, default=500, help="Passwords in the parallel batch test")
+    bench.add_argument("--workers", type=int, default=None, help="Process pool size")
+    bench.set_defaults(func=cmd_bench_hash)
+
+    bench_psk = sub.add_parser("bench-psk", help="Report WPA PSK pre-computation speed")
+    bench_psk.add_argument("--networks", type=int, default=200, help="Distinct (ssid, passphrase) pairs")
+    bench_psk.add_argument("--ssids", type=int, default=50, help="Distinct SSIDs among them")
+    bench_psk.add_argument("--devices", type=int, default=100, help="Devices sharing the network list")
+    bench_psk.add_argument("--workers", type=int, default=None, help="Process pool size")
+    bench_psk.set_defaults(func=cmd_bench_psk)
+
+    net = sub.add_parser("net-assign", help="Give each device a static IP and render its network-config")
+    net.add_argument("boot_paths", nargs="*", help="Boot folders/images to write (one address each)")
+    net.add_argument("--subnet", required=True, help="e.g. 192.168.10.0/24")
+    net.add_argument("--gateway", help="Default gateway (never handed out)")
+    net.add_argument("--dns", action="append", help="DNS server (repeatable)")
+    net.add_argument("--exclude", action="append", help="Address, CIDR or first-last range to skip (repeatable)")
+    net.add_argument("--reserve", action="append", help="Single address already in use (repeatable)")
+    net.add_argument("--interface", default="eth0", help="Interface to configure")
+    net.add_argument("--count", type=int, default=0, help="Without boot paths: number of devices to render")
+    net.add_argument("--pattern", default="device-{n:03d}", help="Without boot paths: device name pattern")
+    net.add_argument("--out-dir", default=".", help="Without boot paths: folder for the rendered configs")
+    net.add_argument("--workers", type=int, default=None, help="Cards written in parallel")
+    net.set_defaults(func=cmd_net_assign)
+
+    return parser
+
+def _write_metrics_periodically(path, interval):
+    """Keeps the Prometheus file fresh while long-running commands (watch) are up."""
+    import threading
+    from utils import metrics
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            metrics.write_prometheus(path)
+    threading.Thread(target=loop, name="metrics-writer", daemon=True).start()
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from utils import metrics
+
+    if args.trace:
+        metrics.set_trace_file(args.trace)
+    if args.metrics:
+        _write_metrics_periodically(args.metrics, args.metrics_interval)
+    try:
+        if args.cprofile:
+            with metrics.profiled(args.cprofile_out):
+                return args.func(args)
+        return args.func(args)
+    finally:
+        if args.metrics:
+            metrics.write_prometheus(args.metrics)
+        if args.op_summary:
+            print(metrics.format_summary(), file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,24 @@
-import customtkinter as ctk
 import os
+import sys
+
+# Any arguments mean a headless command (batch, clone, watch...): hand over to the CLI
+# before customtkinter/Tk are ever imported, so the same exe starts fast on build boxes.
+if __name__ == "__main__" and len(sys.argv) > 1:
+    from cli import main as cli_main
+    sys.exit(cli_main())
+
+import customtkinter as ctk
 from tkinter import filedialog, messagebox
 from utils.file_ops import BootConfigManager
-from utils.crypto import generate_password_hash
-from utils.wifi_utils import get_windows_wifi_profiles
-
-ctk.set_appearance_mode("Dark")
-ctk.set_default_color_theme("blue")
+from utils.tasks import TaskExecutor
+from utils.snapshots import SnapshotStore
+# Hashing (passlib), netsh import and the watcher are imported on first use to keep startup short
 
 class App(ctk.CTk):
     def __init__(self):
+        # Theme is loaded when the first window is built, not at import
+        ctk.set_appearance_mode("Dark")
+        ctk.set_default_color_theme("blue")
         super().__init__()
 
         # Set App User Model ID
@@ -32,7 +41,12 @@ class App(ctk.CTk):
             print(f"Icon error: {e}")
 
         self.boot_manager = BootConfigManager()
+        # Every save backs up the files it overwrites (python cli.py rollback <boot path> restores them)
+        self.boot_manager.snapshots = SnapshotStore()
         self.current_boot_path = None
+        self.file_status = {}
+        self.watcher = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Grid layout
         self.grid_columnconfigure(0, weight=1)
@@ -48,6 +62,17 @@ class App(ctk.CTk):
         self.select_btn = ctk.CTkButton(self.header_frame, text="Select Boot Folder", command=self.select_folder)
         self.select_btn.pack(side="right", padx=20, pady=10)
 
+        self.image_btn = ctk.CTkButton(self.header_frame, text="Open Image", width=100, command=self.select_image)
+        self.image_btn.pack(side="right", pady=10)
+
+        # Busy indicator, shown while background tasks run
+        self.busy_bar = ctk.CTkProgressBar(self.header_frame, mode="indeterminate", width=80)
+
+        # Card I/O and hashing run here so the window never freezes
+        self.tasks = TaskExecutor(self, on_busy_change=self.set_busy, on_error=self.show_error)
+        # Keep the snapshot store bounded: the default retention policy, once per start
+        self.tasks.submit(self.boot_manager.snapshots.gc, on_error=self.show_error)
+
         # Dashboard Frame
         self.dashboard_frame = ctk.CTkScrollableFrame(self, label_text="Configuration Dashboard")
         self.dashboard_frame.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
@@ -77,10 +102,49 @@ class App(ctk.CTk):
     def select_folder(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
-            self.current_boot_path = folder_selected
-            self.path_label.configure(text=folder_selected)
-            self.boot_manager.boot_path = folder_selected  # Update manager path
-            self.refresh_dashboard()
+            self.set_boot_path(folder_selected)
+
+    def select_image(self):
+        """Edits the boot partition of a Raspberry Pi .img file directly, without mounting it."""
+        image_selected = filedialog.askopenfilename(filetypes=[("Disk Images", "*.img"), ("All Files", "*.*")])
+        if image_selected:
+            self.set_boot_path(image_selected)
+
+    def set_boot_path(self, path):
+        self.current_boot_path = path
+        self.path_label.configure(text=path)
+        self.boot_manager.boot_path = path  # Update manager path
+        self.refresh_dashboard()
+        self.start_watcher()
+
+    def start_watcher(self):
+        """Keeps the dashboard in sync with changes made to the card by other tools."""
+        from utils.watcher import BootFolderWatcher
+        if self.watcher:
+            self.watcher.stop()
+        # The watcher calls back on its own thread; hand the status to the Tk loop
+        self.watcher = BootFolderWatcher(
+            self.current_boot_path,
+            lambda status: self.after(0, lambda: self.update_dashboard(status))
+        )
+        self.watcher.start()
+
+    def set_busy(self, busy):
+        if busy:
+            self.busy_bar.pack(side="right", padx=10)
+            self.busy_bar.start()
+        else:
+            self.busy_bar.stop()
+            self.busy_bar.pack_forget()
+
+    def on_close(self):
+        if self.watcher:
+            self.watcher.stop()
+        self.tasks.shutdown()
+        if os.environ.get("BOOTCFG_METRICS"):
+            from utils import metrics
+            metrics.write_prometheus(os.environ["BOOTCFG_METRICS"])
+        self.destroy()
 
     def create_dashboard_items(self):
         """Creates the initial dashboard rows."""
@@ -109,8 +173,14 @@ class App(ctk.CTk):
         if not self.current_boot_path:
             return
 
-        status = self.boot_manager.check_files_status()
-        
+        self.tasks.submit(self.boot_manager.check_files_status, on_done=self.update_dashboard, on_error=self.show_error)
+
+    def show_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def update_dashboard(self, status):
+        """Updates the dashboard rows from a check_files_status() result."""
+        self.file_status = status
         for key, exists in status.items():
             widgets = self.status_widgets.get(key)
             if not widgets:
@@ -174,7 +244,7 @@ class SSHDialog(ctk.CTkToplevel):
         self.label = ctk.CTkLabel(self, text="Enable SSH on Boot", font=("Arial", 16))
         self.label.pack(pady=20)
 
-        self.ssh_var = ctk.BooleanVar(value=self.boot_manager.check_files_status().get('ssh', False))
+        self.ssh_var = ctk.BooleanVar(value=parent.file_status.get('ssh', False))
         
         self.switch = ctk.CTkSwitch(self, text="Enable SSH", variable=self.ssh_var, onvalue=True, offvalue=False)
         self.switch.pack(pady=10)
@@ -196,15 +266,20 @@ class SSHDialog(ctk.CTkToplevel):
             self.after(200, lambda: self.iconbitmap(icon_path))
 
     def save(self):
-        if self.ssh_var.get():
-            self.boot_manager.create_ssh()
-            messagebox.showinfo("Success", "SSH Enabled!")
-        else:
-            self.boot_manager.remove_ssh()
-            messagebox.showinfo("Success", "SSH Disabled!")
+        enable = self.ssh_var.get()
+        self.save_btn.configure(state="disabled")
+        action = self.boot_manager.create_ssh if enable else self.boot_manager.remove_ssh
+        self.master.tasks.submit(action, on_done=lambda _: self.on_saved(enable), on_error=self.on_error, owner=self)
+
+    def on_saved(self, enable):
+        messagebox.showinfo("Success", "SSH Enabled!" if enable else "SSH Disabled!")
         self.master.refresh_dashboard()
         self.destroy()
 
+    def on_error(self, error):
+        self.save_btn.configure(state="normal")
+        messagebox.showerror("Error", str(error))
+
 
 class UserDialog(ctk.CTkToplevel):
     def __init__(self, parent, boot_manager):
@@ -216,6 +291,14 @@ class UserDialog(ctk.CTkToplevel):
         self.center_window(400, 400)
         self.set_dialog_icon()
 
+        self.loading_lbl = ctk.CTkLabel(self, text="Reading card...", text_color="gray")
+        self.loading_lbl.pack(expand=True)
+        parent.tasks.submit(self.boot_manager.parse_userconf, on_done=self.build_ui, on_error=self.on_load_error, owner=self)
+
+    def on_load_error(self, error):
+        messagebox.showerror("Error", str(error))
+        self.destroy()
+
     def set_dialog_icon(self):
         icon_path = os.path.join(os.path.dirname(__file__), "assets", "icon.ico")
         if os.path.exists(icon_path):
@@ -229,7 +312,9 @@ class UserDialog(ctk.CTkToplevel):
         y = (screen_height - height) // 2
         self.geometry(f"{width}x{height}+{x}+{y}")
 
-        self.current_user, self.current_hash = self.boot_manager.parse_userconf()
+    def build_ui(self, userconf):
+        self.loading_lbl.destroy()
+        self.current_user, self.current_hash = userconf
         self.is_new = self.current_user is None
 
         ctk.CTkLabel(self, text="Username:").pack(pady=(20, 5))
@@ -294,19 +379,147 @@ class UserDialog(ctk.CTkToplevel):
 
         # If locked/disabled, use existing hash
         if self.current_hash and (self.pass_entry.cget("state") == "disabled" or password == "********"):
-             self.boot_manager.write_userconf(username, self.current_hash)
-             messagebox.showinfo("Success", f"User updated (Password unchanged)!")
+             job = lambda: self.boot_manager.write_userconf(username, self.current_hash)
+             message = "User updated (Password unchanged)!"
         else:
              if not password:
                  messagebox.showerror("Error", "Password is required!")
                  return
-             hashed_pw = generate_password_hash(password)
-             self.boot_manager.write_userconf(username, hashed_pw)
-             messagebox.showinfo("Success", f"User '{username}' configured!")
-        
+             # Hashing takes a noticeable moment, so it runs in the background with the write
+             from utils.crypto import generate_password_hash
+             job = lambda: self.boot_manager.write_userconf(username, generate_password_hash(password))
+             message = f"User '{username}' configured!"
+
+        self.save_btn.configure(state="disabled", text="Saving...")
+        self.master.tasks.submit(job, on_done=lambda _: self.on_saved(message), on_error=self.on_error, owner=self)
+
+    def on_saved(self, message):
+        messagebox.showinfo("Success", message)
         self.master.refresh_dashboard()
         self.destroy()
 
+    def on_error(self, error):
+        self.save_btn.configure(state="normal", text="Save User")
+        messagebox.showerror("Error", str(error))
+
+
+class NetworkListView(ctk.CTkFrame):
+    """Virtualized network list: only the rows that fit on screen exist as widgets.
+
+    Rows are a fixed pool that gets re-bound to whichever networks are scrolled into view.
+    A refresh only reconfigures rows whose network, position or neighbours changed, so
+    reordering costs the same with 10 networks as with 1000.
+    """
+    ROW_HEIGHT = 40
+
+    def __init__(self, parent, networks, on_move_up, on_move_down, on_edit, on_remove):
+        super().__init__(parent)
+        self.networks = networks
+        self.on_move_up = on_move_up
+        self.on_move_down = on_move_down
+        self.on_edit = on_edit
+        self.on_remove = on_remove
+        self.first = 0      # index of the network shown in the top row
+        self.rows = []      # pooled row widgets
+
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent")
+        self.viewport.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.viewport.bind("<Configure>", lambda e: self.refresh())
+        for widget in (self.viewport, self):
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_by(-1))
+            widget.bind("<Button-5>", lambda e: self.scroll_by(1))
+
+    def visible_count(self):
+        height = max(self.viewport.winfo_height(), self.ROW_HEIGHT)
+        return height // self.ROW_HEIGHT + 1
+
+    def make_row(self):
+        f = ctk.CTkFrame(self.viewport, height=self.ROW_HEIGHT - 4)
+        f.pack_propagate(False)  # Fixed row height keeps slot positions simple
+        label = ctk.CTkLabel(f, text="", anchor="w")
+        label.pack(side="left", padx=10, fill="x", expand=True)
+
+        btn_box = ctk.CTkFrame(f, fg_color="transparent")
+        btn_box.pack(side="right", padx=5)
+        row = {"frame": f, "label": label, "bound": None, "index": None}
+
+        # Buttons look up the row's current index when clicked, so they never need rebinding
+        row["up"] = ctk.CTkButton(btn_box, text="⬆", width=30, command=lambda: self.on_move_up(row["index"]))
+        row["up"].pack(side="left", padx=2)
+        row["down"] = ctk.CTkButton(btn_box, text="⬇", width=30, command=lambda: self.on_move_down(row["index"]))
+        row["down"].pack(side="left", padx=2)
+        ctk.CTkButton(btn_box, text="Edit", width=60, command=lambda: self.on_edit(self.networks[row["index"]])).pack(side="left", padx=2)
+        ctk.CTkButton(btn_box, text="X", width=30, fg_color="red", command=lambda: self.on_remove(self.networks[row["index"]])).pack(side="left", padx=2)
+
+        for widget in (f, label):
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_by(-1))
+            widget.bind("<Button-5>", lambda e: self.scroll_by(1))
+        return row
+
+    def refresh(self):
+        """Re-binds the visible rows to the data, touching only rows that changed."""
+        total = len(self.networks)
+        visible = self.visible_count()
+        self.first = max(0, min(self.first, total - visible + 1))
+
+        while len(self.rows) < min(visible, total):
+            self.rows.append(self.make_row())
+
+        for slot, row in enumerate(self.rows):
+            index = self.first + slot
+            if slot >= visible or index >= total:
+                if row["bound"] is not None:
+                    row["frame"].place_forget()
+                    row["bound"] = None
+                continue
+
+            net = self.networks[index]
+            # Priority is implicit by order (Top = Highest)
+            key = (id(net), index, net['ssid'], index == 0, index == total - 1)
+            if row["bound"] == key:
+                continue
+            if row["bound"] is None:
+                row["frame"].place(x=0, y=slot * self.ROW_HEIGHT, relwidth=1.0)
+            row["label"].configure(text=f"{index+1}. SSID: {net['ssid']}")
+            row["up"].configure(state="disabled" if index == 0 else "normal")
+            row["down"].configure(state="disabled" if index == total - 1 else "normal")
+            row["index"] = index
+            row["bound"] = key
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + visible - 1) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_by(self, rows):
+        self.first += rows
+        self.refresh()
+
+    def ensure_visible(self, index):
+        visible = self.visible_count() - 1
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + visible:
+            self.first = index - visible + 1
+        self.refresh()
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-1 if event.delta > 0 else 1)
+
+    def on_scrollbar(self, action, *args):
+        total = len(self.networks)
+        if action == "moveto":
+            self.first = int(float(args[0]) * total)
+        elif action == "scroll":
+            amount = int(args[0])
+            self.first += amount * (self.visible_count() - 1 if args[1] == "pages" else 1)
+        self.refresh()
+
 
 class WiFiDialog(ctk.CTkToplevel):
     def __init__(self, parent, boot_manager):
@@ -318,6 +531,14 @@ class WiFiDialog(ctk.CTkToplevel):
         self.center_window(600, 600)
         self.set_dialog_icon()
 
+        self.loading_lbl = ctk.CTkLabel(self, text="Reading card...", text_color="gray")
+        self.loading_lbl.pack(expand=True)
+        parent.tasks.submit(self.boot_manager.parse_wpa_supplicant, on_done=self.build_ui, on_error=self.on_load_error, owner=self)
+
+    def on_load_error(self, error):
+        messagebox.showerror("Error", str(error))
+        self.destroy()
+
     def set_dialog_icon(self):
         icon_path = os.path.join(os.path.dirname(__file__), "assets", "icon.ico")
         if os.path.exists(icon_path):
@@ -331,7 +552,9 @@ class WiFiDialog(ctk.CTkToplevel):
         y = (screen_height - height) // 2
         self.geometry(f"{width}x{height}+{x}+{y}")
 
-        self.global_config, self.networks = self.boot_manager.parse_wpa_supplicant()
+    def build_ui(self, parsed):
+        self.loading_lbl.destroy()
+        self.global_config, self.networks = parsed
         
         # --- Global Configuration ---
         self.global_frame = ctk.CTkFrame(self)
@@ -371,56 +594,42 @@ class WiFiDialog(ctk.CTkToplevel):
         ctk.CTkButton(self.btn_frame, text="+ Add", width=80, command=self.add_network_dialog).pack(side="left", padx=5)
 
         # Network List
-        self.net_frame = ctk.CTkScrollableFrame(self)
-        self.net_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.net_list = NetworkListView(
+            self, self.networks,
+            on_move_up=self.move_up, on_move_down=self.move_down,
+            on_edit=self.edit_network_dialog, on_remove=self.remove_network
+        )
+        self.net_list.pack(fill="both", expand=True, padx=10, pady=5)
         
         self.refresh_list()
 
+        # Store the derived PSK instead of the plain-text password
+        self.precompute_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self, text="Store pre-computed PSK (hides passwords, faster first connect)", variable=self.precompute_var).pack(pady=(5, 0))
+
         # Save Button
         self.save_btn = ctk.CTkButton(self, text="Save Configuration", command=self.save)
         self.save_btn.pack(pady=10)
 
     def refresh_list(self):
-        for widget in self.net_frame.winfo_children():
-            widget.destroy()
-
-        # Sort by priority (descending if possible, but just listing is fine. User interprets priority)
-        # However, to be helpful, let's sort purely for display? 
-        # Actually user wants to change priority, so showing it is important.
-        
-        for i, net in enumerate(self.networks):
-            f = ctk.CTkFrame(self.net_frame)
-            f.pack(fill="x", pady=2)
-            
-            # Priority is now implicit by order (Top = Highest)
-            # We can still show it if it exists in the dict, but we will overwrite it on save
-            ctk.CTkLabel(f, text=f"{i+1}. SSID: {net['ssid']}").pack(side="left", padx=10)
-            
-            # Action Buttons
-            btn_box = ctk.CTkFrame(f, fg_color="transparent")
-            btn_box.pack(side="right", padx=5)
-            
-            # Reorder Buttons
-            if i > 0:
-                ctk.CTkButton(btn_box, text="⬆", width=30, command=lambda idx=i: self.move_up(idx)).pack(side="left", padx=2)
-            if i < len(self.networks) - 1:
-                ctk.CTkButton(btn_box, text="⬇", width=30, command=lambda idx=i: self.move_down(idx)).pack(side="left", padx=2)
-
-            ctk.CTkButton(btn_box, text="Edit", width=60, command=lambda n=net: self.edit_network_dialog(n)).pack(side="left", padx=2)
-            ctk.CTkButton(btn_box, text="X", width=30, fg_color="red", command=lambda n=net: self.remove_network(n)).pack(side="left", padx=2)
+        self.net_list.refresh()
 
     def move_up(self, index):
         if index > 0:
             self.networks[index], self.networks[index-1] = self.networks[index-1], self.networks[index]
-            self.refresh_list()
+            self.net_list.ensure_visible(index - 1)
 
     def move_down(self, index):
         if index < len(self.networks) - 1:
             self.networks[index], self.networks[index+1] = self.networks[index+1], self.networks[index]
-            self.refresh_list()
+            self.net_list.ensure_visible(index + 1)
 
     def remove_network(self, network):
-        self.networks.remove(network)
+        # Remove by identity: two networks can hold equal values
+        for i, net in enumerate(self.networks):
+            if net is network:
+                del self.networks[i]
+                break
         self.refresh_list()
 
     def import_windows_wifi(self):
@@ -441,18 +650,22 @@ class WiFiDialog(ctk.CTkToplevel):
         center_loading(300, 100)
 
         ctk.CTkLabel(loading_dialog, text="Fetching Wi-Fi Profiles...", font=("Arial", 14)).pack(expand=True)
-        
-        # Function to run in thread
-        def fetch_profiles():
-            try:
-                profiles = get_windows_wifi_profiles()
-                # Schedule GUI update on main thread
-                self.after(0, lambda: self.on_profiles_fetched(profiles, loading_dialog))
-            except Exception as e:
-                self.after(0, lambda: self.on_import_error(e, loading_dialog))
-
-        import threading
-        threading.Thread(target=fetch_profiles, daemon=True).start()
+
+        # netsh runs in the background; Cancel drops the result when it arrives
+        from utils.wifi_utils import get_windows_wifi_profiles
+        task = self.master.tasks.submit(
+            get_windows_wifi_profiles,
+            on_done=lambda profiles: self.on_profiles_fetched(profiles, loading_dialog),
+            on_error=lambda e: self.on_import_error(e, loading_dialog),
+            owner=loading_dialog,
+        )
+
+        def cancel():
+            task.cancel()
+            loading_dialog.destroy()
+
+        ctk.CTkButton(loading_dialog, text="Cancel", width=80, command=cancel).pack(pady=(0, 10))
+        loading_dialog.protocol("WM_DELETE_WINDOW", cancel)
 
     def on_import_error(self, error, loading_dialog):
         loading_dialog.destroy()
@@ -556,10 +769,10 @@ class WiFiDialog(ctk.CTkToplevel):
         ssid_entry.pack(pady=5)
         if network: ssid_entry.insert(0, network['ssid'])
         
-        ctk.CTkLabel(dialog, text="Password:").pack(pady=5)
+        ctk.CTkLabel(dialog, text="Password (empty for open network):").pack(pady=5)
         psk_entry = ctk.CTkEntry(dialog, show="*") 
         psk_entry.pack(pady=5)
-        if network: psk_entry.insert(0, network['psk'])
+        if network: psk_entry.insert(0, network.get('psk', ''))
 
         # Show Password toggle
         def toggle_pw():
@@ -573,17 +786,25 @@ class WiFiDialog(ctk.CTkToplevel):
             ssid = ssid_entry.get()
             psk = psk_entry.get()
             
-            if ssid and psk:
-                net_data = {"ssid": ssid, "psk": psk}
+            if ssid:
+                # An empty password means an open network
+                net_data = {"ssid": ssid}
+                if psk:
+                    net_data["psk"] = psk
                 
                 if network: 
+                    if psk:
+                        if network.get("key_mgmt") == "NONE":
+                            network.pop("key_mgmt")
+                    else:
+                        network.pop("psk", None)
                     network.update(net_data)
                 else:
                     self.networks.append(net_data)
                 self.refresh_list()
                 dialog.destroy()
             else:
-                messagebox.showerror("Error", "SSID and Password required")
+                messagebox.showerror("Error", "SSID required")
 
         ctk.CTkButton(dialog, text="Save", command=save_current).pack(pady=10)
 
@@ -602,11 +823,23 @@ class WiFiDialog(ctk.CTkToplevel):
         for i, net in enumerate(self.networks):
             net["priority"] = str(base_priority - i)
 
-        self.boot_manager.write_wpa_supplicant(self.global_config, self.networks)
+        # PSK derivation and the write run in the background; snapshot the list so edits can't race it
+        networks = [dict(net) for net in self.networks]
+        self.save_btn.configure(state="disabled", text="Saving...")
+        self.master.tasks.submit(
+            self.boot_manager.write_wpa_supplicant, dict(self.global_config), networks, self.precompute_var.get(),
+            on_done=self.on_saved, on_error=self.on_save_error, owner=self,
+        )
+
+    def on_saved(self, _):
         messagebox.showinfo("Success", "Wi-Fi Configuration Saved!")
         self.master.refresh_dashboard()
         self.destroy()
 
+    def on_save_error(self, error):
+        self.save_btn.configure(state="normal", text="Save Configuration")
+        messagebox.showerror("Error", str(error))
+
 
 class NetworkConfigDialog(ctk.CTkToplevel):
     def __init__(self, parent, boot_manager):
@@ -618,6 +851,25 @@ class NetworkConfigDialog(ctk.CTkToplevel):
         self.center_window(600, 500)
         self.set_dialog_icon()
 
+        ctk.CTkLabel(self, text="Edit network-config (YAML)", font=("Arial", 14)).pack(pady=10)
+
+        self.text_area = ctk.CTkTextbox(self, width=550, height=350)
+        self.text_area.pack(pady=10)
+
+        self.save_btn = ctk.CTkButton(self, text="Save Config", command=self.save, state="disabled")
+        self.save_btn.pack(pady=10)
+
+        parent.tasks.submit(self.boot_manager.read_network_config, on_done=self.on_loaded, on_error=self.on_load_error, owner=self)
+
+    def on_loaded(self, content):
+        self.text_area.insert("0.0", content)
+        self.save_btn.configure(state="normal")
+
+    def on_load_error(self, error):
+        # Never leave an empty editor with Save enabled: saving it would wipe network-config
+        messagebox.showerror("Error", str(error))
+        self.destroy()
+
     def set_dialog_icon(self):
         icon_path = os.path.join(os.path.dirname(__file__), "assets", "icon.ico")
         if os.path.exists(icon_path):
@@ -631,26 +883,31 @@ class NetworkConfigDialog(ctk.CTkToplevel):
         y = (screen_height - height) // 2
         self.geometry(f"{width}x{height}+{x}+{y}")
 
-        ctk.CTkLabel(self, text="Edit network-config (YAML)", font=("Arial", 14)).pack(pady=10)
-
-        self.text_area = ctk.CTkTextbox(self, width=550, height=350)
-        self.text_area.pack(pady=10)
-
-        content = self.boot_manager.read_network_config()
-        self.text_area.insert("0.0", content)
-
-        self.save_btn = ctk.CTkButton(self, text="Save Config", command=self.save)
-        self.save_btn.pack(pady=10)
-
     def save(self):
         content = self.text_area.get("0.0", "end-1c")
+        self.save_btn.configure(state="disabled")
+        self.master.tasks.submit(self.validate_and_write, content, on_done=self.on_saved, on_error=self.on_error, owner=self)
+
+    def validate_and_write(self, content):
+        """Runs on the task worker: refuses YAML that cloud-init couldn't read."""
+        from utils.network_config import parse_network_config
+        parse_network_config(content)
         self.boot_manager.write_network_config(content)
+
+    def on_saved(self, _):
         messagebox.showinfo("Success", "Network Config Saved!")
         self.master.refresh_dashboard()
         self.destroy()
 
+    def on_error(self, error):
+        self.save_btn.configure(state="normal")
+        messagebox.showerror("Error", str(error))
+
 
 
 if __name__ == "__main__":
     app = App()
+    if os.environ.get("BOOTCFG_STARTUP_PROBE"):
+        # Used by benchmarks/bench_startup.py: report once the first frame is drawn, then exit
+        app.after(0, lambda: (print("first-window", flush=True), app.on_close()))
     app.mainloop()
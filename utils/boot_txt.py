@@ -0,0 +1,319 @@
+import json
+import re
+from functools import lru_cache
+
+# config.txt keys that may appear many times in one section (each line adds another value)
+REPEATABLE_KEYS = {"dtoverlay", "dtparam", "include", "gpio"}
+# cmdline.txt keys that may appear more than once
+REPEATABLE_ARGS = {"console"}
+
+SECTION_HEADER = re.compile(r'^\s*\[([^\]]*)\]\s*$')
+
+# --- config.txt ---
+class _Line:
+    """One line of config.txt. Lines keep their raw text until changed; new lines have raw None.
+
+    Lines added to the file hang off an existing line's `after` list, so inserting never shifts
+    the rest of the file and costs O(1).
+    """
+    __slots__ = ("raw", "key", "value", "sep", "section", "removed", "after")
+
+    def __init__(self, raw=None, key=None, value=None, sep="=", section=None):
+        self.raw = raw
+        self.key = key
+        self.value = value
+        self.sep = sep
+        self.section = section
+        self.removed = False
+        self.after = None
+
+    def render(self, newline):
+        if self.raw is not None:
+            return self.raw
+        if self.key is None:
+            return f"[{self.section}]{newline}"  # generated section header
+        return f"{self.key}{self.sep}{self.value}{newline}"
+
+class ConfigTxt:
+    """Lossless config.txt model with a per-section index of keys.
+
+    Sections are the conditional filters ([pi4], [all], [cm4], ...); lines before the first
+    filter belong to "all". get/set/remove are dictionary lookups on (section, key), and
+    serialize() re-renders only lines that were changed or added.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.index = {}    # {(section, key): [_Line, ...]} in file order
+        self.anchors = {}  # {section: line new keys of that section are inserted after}
+        self.newline = "\n"
+        self.dirty = False
+        self._head = _Line(raw="")  # anchor for "all" keys when the file has none yet
+        self._tail = _Line(raw="")  # anchor for new sections at the end of the file
+
+    @classmethod
+    def parse(cls, text):
+        conf = cls()
+        if "\r\n" in text:
+            conf.newline = "\r\n"
+        conf.lines.append(conf._head)
+        conf.anchors["all"] = conf._head
+        section = "all"
+        for raw in text.splitlines(keepends=True):
+            stripped = raw.strip()
+            match = SECTION_HEADER.match(raw)
+            if match:
+                section = match.group(1).strip()
+                line = _Line(raw=raw, section=section)
+                conf.anchors.setdefault(section, line)
+            elif not stripped or stripped.startswith("#"):
+                line = _Line(raw=raw, section=section)
+            else:
+                line = _parse_setting(raw, stripped, section)
+                conf.index.setdefault((section, line.key), []).append(line)
+                conf.anchors[section] = line
+            conf.lines.append(line)
+        conf.lines.append(conf._tail)
+        return conf
+
+    def get(self, key, section="all"):
+        """Value of key in section (the last one wins, as in the firmware), or None."""
+        lines = self.index.get((section, key))
+        return lines[-1].value if lines else None
+
+    def get_all(self, key, section="all"):
+        """Every value of a repeatable key (e.g. each dtoverlay line) in section."""
+        return [line.value for line in self.index.get((section, key), [])]
+
+    def sections(self):
+        return sorted({section for section, _ in self.index})
+
+    def set(self, key, value, section="all"):
+        """Sets key in section. None removes it; a list makes a repeatable key hold exactly those values.
+
+        A single value for a repeatable key (dtoverlay, dtparam...) is added alongside the others.
+        """
+        if value is None:
+            self.remove(key, section)
+            return
+        if isinstance(value, (list, tuple)):
+            self._set_values(key, [_config_value(v) for v in value], section)
+            return
+        if key in REPEATABLE_KEYS:
+            self.add(key, value, section)
+            return
+        value = _config_value(value)
+        lines = self.index.get((section, key))
+        if lines:
+            last = lines[-1]
+            if last.value != value:
+                last.value = value
+                last.raw = None
+                self.dirty = True
+            return
+        self._insert(key, value, section)
+
+    def add(self, key, value, section="all"):
+        """Adds another line for a repeatable key unless that exact value is already there."""
+        value = _config_value(value)
+        if value not in self.get_all(key, section):
+            self._insert(key, value, section)
+
+    def remove(self, key, section="all", value=None):
+        """Removes key from section (only the line with that value, when given)."""
+        lines = self.index.get((section, key), [])
+        keep = []
+        for line in lines:
+            if value is None or line.value == str(value):
+                line.removed = True
+                self.dirty = True
+            else:
+                keep.append(line)
+        if keep:
+            self.index[(section, key)] = keep
+        else:
+            self.index.pop((section, key), None)
+
+    def _set_values(self, key, values, section):
+        current = self.get_all(key, section)
+        for value in current:
+            if value not in values:
+                self.remove(key, section, value)
+        for value in values:
+            if value not in current:
+                self._insert(key, value, section)
+
+    def _insert(self, key, value, section):
+        line = _Line(key=key, value=value, section=section)
+        anchor = self.anchors.get(section)
+        if anchor is None:
+            # New conditional section at the end of the file
+            anchor = _Line(section=section)
+            self._after(self._tail).append(anchor)
+            self.anchors[section] = anchor
+        self._after(anchor).append(line)
+        self.index.setdefault((section, key), []).append(line)
+        self.dirty = True
+
+    @staticmethod
+    def _after(line):
+        if line.after is None:
+            line.after = []
+        return line.after
+
+    def apply(self, edits):
+        """Applies {section: {key: value}} in one pass over the index (see set())."""
+        for section, values in edits.items():
+            for key, value in values.items():
+                self.set(key, value, section)
+
+    def serialize(self):
+        out = []
+        for line in self.lines:
+            if not line.removed:
+                out.append(line.render(self.newline))
+            if line.after:
+                self._render_after(line.after, out)
+        return "".join(out)
+
+    def _render_after(self, lines, out):
+        for line in lines:
+            if not line.removed:
+                # The original last line may lack a newline; don't glue a new line onto it
+                if out and not out[-1].endswith("\n"):
+                    out.append(self.newline)
+                out.append(line.render(self.newline))
+            if line.after:
+                self._render_after(line.after, out)
+
+def _config_value(value):
+    """config.txt spelling of a profile value: JSON true/false become 1/0, as the firmware expects."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+def _parse_setting(raw, stripped, section):
+    eq = stripped.find("=")
+    space = stripped.find(" ")
+    if eq > 0 and (space < 0 or eq < space):
+        key, value, sep = stripped[:eq].strip(), stripped[eq + 1:].strip(), "="
+    elif space > 0:
+        key, value, sep = stripped[:space], stripped[space + 1:].strip(), " "  # e.g. initramfs, include
+    else:
+        key, value, sep = stripped, "", "="
+    return _Line(raw=raw, key=key, value=value, sep=sep, section=section)
+
+# --- cmdline.txt ---
+class CmdlineTxt:
+    """cmdline.txt: one line of space-separated kernel arguments (key=value or bare flags).
+
+    Arguments are indexed by key and untouched arguments keep their text. A bare flag has the
+    value True.
+    """
+
+    def __init__(self, tokens=None, trailing=""):
+        self.tokens = tokens or []  # [[key, value, raw or None]]; removed tokens become None
+        self.trailing = trailing
+        self.index = {}
+        self.dirty = False
+        for token in self.tokens:
+            self.index.setdefault(token[0], []).append(token)
+
+    @classmethod
+    def parse(cls, text):
+        body = text.rstrip("\r\n")
+        trailing = text[len(body):]
+        tokens = []
+        for raw in body.split():
+            key, eq, value = raw.partition("=")
+            tokens.append([key, value if eq else True, raw])
+        return cls(tokens, trailing)
+
+    def get(self, key):
+        tokens = self.index.get(key)
+        return tokens[-1][1] if tokens else None
+
+    def get_all(self, key):
+        return [token[1] for token in self.index.get(key, [])]
+
+    def set(self, key, value):
+        """Sets an argument. True makes a bare flag, None removes it, a list sets a repeatable key
+        (console=...) to exactly those values; a single value for one is added alongside the others."""
+        if value is None:
+            self.remove(key)
+            return
+        if isinstance(value, (list, tuple)):
+            current = self.index.get(key, [])
+            if [t[1] for t in current] == list(value):
+                return
+            self.remove(key)
+            for v in value:
+                self._append(key, v)
+            return
+        if value is False:
+            raise ValueError(f"cmdline.txt argument {key}: false isn't a value; use null to remove it")
+        if value is not True:
+            value = str(value)
+        if key in REPEATABLE_ARGS:
+            if value not in self.get_all(key):
+                self._append(key, value)
+            return
+        tokens = self.index.get(key)
+        if tokens:
+            token = tokens[-1]
+            if token[1] != value:
+                token[1] = value
+                token[2] = None
+                self.dirty = True
+            return
+        self._append(key, value)
+
+    def remove(self, key):
+        for token in self.index.pop(key, []):
+            token[0] = None
+            self.dirty = True
+
+    def _append(self, key, value):
+        token = [key, value, None]
+        self.tokens.append(token)
+        self.index.setdefault(key, []).append(token)
+        self.dirty = True
+
+    def apply(self, edits):
+        for key, value in edits.items():
+            self.set(key, value)
+
+    def serialize(self):
+        parts = []
+        for key, value, raw in self.tokens:
+            if key is None:
+                continue
+            if raw is not None:
+                parts.append(raw)
+            else:
+                parts.append(key if value is True else f"{key}={value}")
+        # cmdline.txt must stay a single line
+        return " ".join(parts) + (self.trailing or "\n")
+
+# --- Fleet edits ---
+def edits_key(edits):
+    """Hashable form of an edit set for the memo (key order kept: new lines go in that order)."""
+    return json.dumps(edits)
+
+@lru_cache(maxsize=64)
+def render_config_txt(text, edits_json):
+    """Returns config.txt text with the edits applied, or None when nothing changes.
+
+    Memoised on (text, edits): cards cloned from one image have identical files, so a fleet
+    parses and serializes config.txt once and every other card reuses the bytes.
+    """
+    conf = ConfigTxt.parse(text)
+    conf.apply(json.loads(edits_json))
+    return conf.serialize() if conf.dirty else None
+
+@lru_cache(maxsize=64)
+def render_cmdline_txt(text, edits_json):
+    """cmdline.txt counterpart of render_config_txt."""
+    cmdline = CmdlineTxt.parse(text)
+    cmdline.apply(json.loads(edits_json))
+    return cmdline.serialize() if cmdline.dirty else None
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from utils.file_ops import BootConfigManager
+from utils.boot_txt import REPEATABLE_ARGS, REPEATABLE_KEYS
+
+BUNDLE_FORMAT = "bootcfg-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "bundle.json"
+FILES_DIR = "files/"
+
+# Boot files carried byte for byte. config.txt and cmdline.txt are carried as edits instead:
+# they hold image-specific settings that must not be copied onto another card.
+COPIED_FILES = ("ssh", "wpa_supplicant", "userconf", "network_config")
+
+# cmdline.txt arguments tied to the source card's partitions or image
+DEVICE_ARGS = {"root", "rootfstype", "init", "resume"}
+
+# --- Export ---
+def _model(mgr, contents):
+    """The parsed configuration, for reading a bundle without applying it."""
+    config, networks = mgr.parse_wpa_supplicant()
+    username, password_hash = mgr.parse_userconf()
+    return {
+        "ssh": contents.get("ssh") is not None,
+        "wifi": {"config": config, "networks": networks},
+        "user": {"username": username, "password_hash": password_hash} if username else None,
+        "network_config": mgr.read_network_config() or None,
+    }
+
+def config_txt_edits(conf):
+    """update_config_txt edits that set every key of a ConfigTxt to its current value(s)."""
+    edits = {}
+    for line in conf.lines:
+        # Space-separated settings (initramfs, include) name image files; leave them alone
+        if line.key is None or line.removed or line.sep != "=":
+            continue
+        values = conf.get_all(line.key, line.section)
+        section = edits.setdefault(line.section, {})
+        section[line.key] = values if line.key in REPEATABLE_KEYS or len(values) > 1 else values[-1]
+    return {section: values for section, values in edits.items() if values}
+
+def cmdline_txt_edits(cmdline):
+    """update_cmdline_txt edits for every argument except the ones tied to the source card."""
+    edits = {}
+    for key, _, _ in cmdline.tokens:
+        if key is None or key in DEVICE_ARGS:
+            continue
+        values = cmdline.get_all(key)
+        edits[key] = values if key in REPEATABLE_ARGS or len(values) > 1 else values[-1]
+    return edits
+
+def export_bundle(boot_path, out_path):
+    """Writes the configuration of boot_path into a single-file bundle and returns its manifest.
+
+    Only files present on the source are bundled; the others are listed under "absent" and
+    are only removed from a target when apply_bundle is asked to prune.
+    """
+    if not os.path.exists(boot_path):
+        raise FileNotFoundError(f"Boot folder or image not found: {boot_path}")
+    mgr = BootConfigManager(boot_path)
+    contents = {key: mgr.read_file(key) for key in COPIED_FILES}
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "created": time.time(),
+        "source": os.path.abspath(boot_path),
+        "model": _model(mgr, contents),
+        "files": {},
+        "absent": sorted(key for key, data in contents.items() if data is None),
+        "edits": {
+            "config_txt": config_txt_edits(mgr.load_config_txt()),
+            "cmdline_txt": cmdline_txt_edits(mgr.load_cmdline_txt()),
+        },
+    }
+    for key, data in contents.items():
+        if data is not None:
+            manifest["files"][key] = {"name": mgr.files[key], "sha256": hashlib.sha256(data).hexdigest(),
+                                      "size": len(data)}
+
+    tmp_path = f"{out_path}.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+            for key, data in contents.items():
+                if data is not None:
+                    zf.writestr(FILES_DIR + key, data)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return manifest
+
+# --- Load ---
+def load_bundle(path):
+    """Loads a bundle and checks it once. Returns {"manifest", "files", "digests"}.
+
+    files is {key: bytes} and digests {key: sha256}, ready for BootConfigManager.restore_files;
+    the copied files are not parsed or hashed again per card.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            try:
+                manifest = json.loads(zf.read(MANIFEST_NAME))
+            except KeyError:
+                raise ValueError(f"Not a bundle: no {MANIFEST_NAME}") from None
+            if manifest.get("format") != BUNDLE_FORMAT:
+                raise ValueError("Not a bundle")
+            if manifest.get("version") != BUNDLE_VERSION:
+                raise ValueError(f"Unsupported bundle version {manifest.get('version')} (expected {BUNDLE_VERSION})")
+
+            files, digests = {}, {}
+            for key, entry in manifest["files"].items():
+                if key not in COPIED_FILES:
+                    raise ValueError(f"Bundle entry {key} is not a copyable boot file")
+                try:
+                    data = zf.read(FILES_DIR + key)
+                except KeyError:
+                    raise ValueError(f"Bundle is missing {key}") from None
+                if len(data) != entry["size"] or hashlib.sha256(data).hexdigest() != entry["sha256"]:
+                    raise ValueError(f"Bundle entry {key} is corrupt")
+                files[key] = data
+                digests[key] = entry["sha256"]
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a bundle: {e}") from e
+    return {"manifest": manifest, "files": files, "digests": digests}
+
+# --- Apply ---
+def apply_bundle(boot_path, bundle, snapshots=None, prune=False):
+    """Copies a loaded bundle onto one boot folder or image in a single transaction.
+
+    The bundled files are copied, config.txt/cmdline.txt get the bundled edits and other
+    files are left alone; with prune, files absent from the source are removed too. Returns a
+    result dict shaped like provision.apply_profile's, so format_results and verify_batch work on it.
+    """
+    result = {"boot_path": boot_path, "ok": True, "error": None, "timings": {}, "total": 0.0, "plan": {},
+              "snapshot": None, "written": {}}
+    start = time.perf_counter()
+    try:
+        if not os.path.exists(boot_path):
+            raise FileNotFoundError(f"Boot folder or image not found: {boot_path}")
+        mgr = BootConfigManager(boot_path)
+        mgr.snapshots = snapshots
+        edits = bundle["manifest"]["edits"]
+        with mgr.transaction():
+            contents = dict(bundle["files"])
+            if prune:
+                contents.update((key, None) for key in bundle["manifest"]["absent"])
+            mgr.restore_files(contents, bundle["digests"])
+            if edits["config_txt"]:
+                mgr.update_config_txt(edits["config_txt"])
+            if edits["cmdline_txt"]:
+                mgr.update_cmdline_txt(edits["cmdline_txt"])
+        result["timings"]["commit"] = time.perf_counter() - start
+        result["plan"] = mgr.last_plan
+        result["snapshot"] = mgr.last_snapshot
+        result["written"] = mgr.last_written
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["total"] = time.perf_counter() - start
+    return result
+
+def apply_bundle_batch(boot_paths, bundle, workers=None, snapshots=None, prune=False):
+    """Applies one loaded bundle to many boot folders in parallel; results follow boot_paths order."""
+    if not boot_paths:
+        return []
+    workers = workers or min(32, len(boot_paths))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(apply_bundle, path, bundle, snapshots, prune) for path in boot_paths]
+        return [f.result() for f in futures]
+
+def format_bundle(manifest):
+    """One-screen summary of a bundle's manifest."""
+    model = manifest["model"]
+    lines = [f"Bundle v{manifest['version']} from {manifest['source']}"]
+    lines.append(f"  SSH:      {'enabled' if model['ssh'] else 'disabled'}")
+    ssids = [net.get("ssid", "?") for net in model["wifi"]["networks"]]
+    lines.append(f"  Wi-Fi:    {', '.join(ssids) if ssids else '(none)'}")
+    lines.append(f"  User:     {model['user']['username'] if model['user'] else '(none)'}")
+    for key, entry in sorted(manifest["files"].items()):
+        lines.append(f"  {key:<15} {entry['size']:>7} B  sha256 {entry['sha256'][:12]}")
+    for key in manifest["absent"]:
+        lines.append(f"  {key:<15} absent (removed only with --prune)")
+    for key, edits in sorted(manifest["edits"].items()):
+        count = sum(len(values) for values in edits.values()) if key == "config_txt" else len(edits)
+        lines.append(f"  {key:<15} {count} setting(s), applied as edits")
+    return "\n".join(lines)
@@ -1,5 +1,285 @@
-from passlib.hash import sha512_crypt
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from utils import metrics
 
-def generate_password_hash(password: str) -> str:
+# rounds=5000 is the crypt(3) default, so it is left out of the hash string.
+# Deployments can override it with the BOOTCFG_HASH_ROUNDS environment variable.
+IMPLICIT_ROUNDS = 5000
+ROUNDS_ENV = "BOOTCFG_HASH_ROUNDS"
+# The range SHA-crypt accepts; crypt(3) would silently clamp anything outside it
+MIN_ROUNDS = 1000
+MAX_ROUNDS = 999999999
+
+ITOA64 = "./0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Below this many passwords a process pool costs more than it saves
+MIN_PARALLEL_BATCH = 8
+
+# WPA2 PSK derivation: PBKDF2-HMAC-SHA1, SSID as salt, 4096 iterations, 256-bit key
+WPA_PSK_ITERATIONS = 4096
+# Derived PSKs, least recently used first. Keyed by a digest of (ssid, passphrase) so no
+# passphrase stays in memory after its batch, and bounded so a long-running server doesn't grow.
+PSK_CACHE_SIZE = 256
+_psk_cache = OrderedDict()
+_psk_lock = threading.Lock()
+
+# --- Backends ---
+def _make_salt() -> str:
+    return "".join(secrets.choice(ITOA64) for _ in range(16))
+
+def _setting(rounds: int, salt: str) -> str:
+    if rounds == IMPLICIT_ROUNDS:
+        return f"$6${salt}"
+    return f"$6$rounds={rounds}${salt}"
+
+def _hash_passlib(password: str, rounds: int, salt: str) -> str:
+    from passlib.hash import sha512_crypt
+    return sha512_crypt.using(rounds=rounds, salt=salt).hash(password)
+
+def _hash_crypt(password: str, rounds: int, salt: str) -> str:
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import crypt
+    result = crypt.crypt(password, _setting(rounds, salt))
+    if not result or not result.startswith("$6$"):
+        raise RuntimeError("System crypt() does not support SHA-512")
+    return result
+
+def _b64_from_24bit(b2: int, b1: int, b0: int, n: int) -> str:
+    w = (b2 << 16) | (b1 << 8) | b0
+    out = []
+    for _ in range(n):
+        out.append(ITOA64[w & 0x3f])
+        w >>= 6
+    return "".join(out)
+
+def _repeat_to(data: bytes, length: int) -> bytes:
+    return (data * (length // len(data) + 1))[:length]
+
+# Byte order used by SHA-512 crypt when encoding the final digest
+_ENCODE_ORDER = [
+    (0, 21, 42), (22, 43, 1), (44, 2, 23), (3, 24, 45), (25, 46, 4), (47, 5, 26), (6, 27, 48),
+    (28, 49, 7), (50, 8, 29), (9, 30, 51), (31, 52, 10), (53, 11, 32), (12, 33, 54), (34, 55, 13),
+    (56, 14, 35), (15, 36, 57), (37, 58, 16), (59, 17, 38), (18, 39, 60), (40, 61, 19), (62, 20, 41),
+]
+
+def _hash_hashlib(password: str, rounds: int, salt: str) -> str:
+    """Pure-Python SHA-512 crypt (Drepper's specification) on top of hashlib."""
+    p = password.encode("utf-8")
+    s = salt.encode("ascii")[:16]
+    sha512 = hashlib.sha512
+
+    b = sha512(p + s + p).digest()
+    a = sha512(p + s)
+    a.update(_repeat_to(b, len(p)) if p else b"")
+    i = len(p)
+    while i > 0:
+        a.update(b if i & 1 else p)
+        i >>= 1
+    c = a.digest()
+
+    p_bytes = _repeat_to(sha512(p * len(p)).digest(), len(p)) if p else b""
+    s_bytes = _repeat_to(sha512(s * (16 + c[0])).digest(), len(s))
+
+    for r in range(rounds):
+        h = sha512(p_bytes if r & 1 else c)
+        if r % 3:
+            h.update(s_bytes)
+        if r % 7:
+            h.update(p_bytes)
+        h.update(c if r & 1 else p_bytes)
+        c = h.digest()
+
+    encoded = "".join(_b64_from_24bit(c[x], c[y], c[z], 4) for x, y, z in _ENCODE_ORDER)
+    encoded += _b64_from_24bit(0, 0, c[63], 2)
+    return f"{_setting(rounds, s.decode('ascii'))}${encoded}"
+
+BACKENDS = {
+    "passlib": _hash_passlib,
+    "crypt": _hash_crypt,
+    "hashlib": _hash_hashlib,
+}
+
+def available_backends() -> list:
+    """Returns the names of the hashing backends usable in this environment."""
+    names = []
+    for name, fn in BACKENDS.items():
+        try:
+            fn("probe", 1000, "probesalt")
+        except Exception:
+            continue
+        names.append(name)
+    return names
+
+@lru_cache(maxsize=None)
+def fastest_backend() -> str:
+    """Picks the fastest available backend with a quick one-off measurement."""
+    timings = {}
+    for name in available_backends():
+        start = time.perf_counter()
+        BACKENDS[name]("probe", 1000, "probesalt")
+        timings[name] = time.perf_counter() - start
+    if not timings:
+        raise RuntimeError("No SHA-512 crypt backend available")
+    return min(timings, key=timings.get)
+
+# --- Public API ---
+def check_rounds(rounds) -> int:
+    """Returns rounds as an int, or raises ValueError if SHA-512 crypt can't use it as given."""
+    if isinstance(rounds, bool) or not isinstance(rounds, (int, str)):
+        raise ValueError(f"Hash rounds must be an integer, not {rounds!r}")
+    try:
+        value = int(rounds)
+    except ValueError:
+        raise ValueError(f"Hash rounds must be an integer, not {rounds!r}") from None
+    if not MIN_ROUNDS <= value <= MAX_ROUNDS:
+        raise ValueError(f"Hash rounds must be between {MIN_ROUNDS} and {MAX_ROUNDS}, not {value}")
+    return value
+
+def default_rounds() -> int:
+    """Rounds from $BOOTCFG_HASH_ROUNDS, else the crypt(3) default. Raises ValueError if it is invalid."""
+    value = os.environ.get(ROUNDS_ENV)
+    if not value:
+        return IMPLICIT_ROUNDS
+    try:
+        return check_rounds(value.strip())
+    except ValueError as e:
+        raise ValueError(f"{ROUNDS_ENV}: {e}") from None
+
+def generate_password_hash(password: str, rounds: int = None, backend: str = None) -> str:
     """Generates a SHA-512 crypt hash for the given password."""
-    return sha512_crypt.using(rounds=5000).hash(password)
+    rounds = check_rounds(rounds) if rounds is not None else default_rounds()
+    backend = backend or fastest_backend()
+    with metrics.span(f"generate_password_hash[{backend}]"):
+        return BACKENDS[backend](password, rounds, _make_salt())
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """True if password_hash is the SHA-512 crypt hash of password (salt and rounds taken from it)."""
+    parts = (password_hash or "").split("$")
+    if len(parts) < 4 or parts[1] != "6":
+        return False
+    rounds = IMPLICIT_ROUNDS
+    if parts[2].startswith("rounds="):
+        if len(parts) < 5:
+            return False
+        try:
+            rounds = int(parts[2][len("rounds="):])
+        except ValueError:
+            return False
+        salt = parts[3]
+    else:
+        salt = parts[2]
+    with metrics.span("verify_password"):
+        candidate = BACKENDS[fastest_backend()](password, rounds, salt)
+    # Compare only the digest: the settings part may spell the default rounds differently
+    return hmac.compare_digest(candidate.rsplit("$", 1)[-1], parts[-1])
+
+def _hash_one(args):
+    password, rounds, backend = args
+    return generate_password_hash(password, rounds, backend)
+
+def hash_passwords(passwords, rounds: int = None, backend: str = None, workers: int = None, executor=None) -> list:
+    """Hashes many passwords across a process pool. Results keep the input order.
+
+    Pass a ProcessPoolExecutor as executor to reuse one pool across many batches.
+    """
+    passwords = list(passwords)
+    rounds = check_rounds(rounds) if rounds is not None else default_rounds()
+    backend = backend or fastest_backend()
+    jobs = [(pw, rounds, backend) for pw in passwords]
+
+    if len(jobs) < MIN_PARALLEL_BATCH or workers == 1:
+        return [_hash_one(job) for job in jobs]
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    if executor is not None:
+        return list(executor.map(_hash_one, jobs, chunksize=chunksize))
+    # Imported here: pulling in multiprocessing costs more at startup than the GUI ever needs
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_hash_one, jobs, chunksize=chunksize))
+
+def benchmark_backends(rounds: int = None, count: int = 20) -> dict:
+    """Measures single-thread hashes/sec for every available backend."""
+    rounds = check_rounds(rounds) if rounds is not None else default_rounds()
+    results = {}
+    for name in available_backends():
+        fn = BACKENDS[name]
+        start = time.perf_counter()
+        for i in range(count):
+            fn(f"password{i}", rounds, _make_salt())
+        elapsed = time.perf_counter() - start
+        results[name] = count / elapsed if elapsed else float("inf")
+    return results
+
+# --- WPA PSK ---
+def is_hex_psk(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdefABCDEF" for c in value)
+
+def _derive_psk(args):
+    ssid, passphrase = args
+    raw = hashlib.pbkdf2_hmac("sha1", passphrase.encode("utf-8"), ssid.encode("utf-8"), WPA_PSK_ITERATIONS, 32)
+    return raw.hex()
+
+def _psk_key(pair) -> bytes:
+    ssid, passphrase = pair
+    return hashlib.sha256(f"{len(ssid)}:{ssid}{passphrase}".encode("utf-8")).digest()
+
+def wpa_psk(ssid: str, passphrase: str) -> str:
+    """Returns the 64-hex pre-computed PSK for a network (what wpa_passphrase prints)."""
+    return precompute_psks([(ssid, passphrase)])[0]
+
+def precompute_psks(pairs, workers: int = None) -> list:
+    """Derives PSKs for many (ssid, passphrase) pairs. Results keep the input order.
+
+    Each distinct pair is computed once and kept in a small LRU cache, so a fleet sharing one
+    SSID costs a single PBKDF2 run. Larger batches of new pairs are spread over a process pool.
+    """
+    pairs = [(ssid, passphrase) for ssid, passphrase in pairs]
+    for ssid, passphrase in pairs:
+        if is_hex_psk(passphrase):
+            continue
+        if not 8 <= len(passphrase) <= 63:
+            raise ValueError(f"Wi-Fi passphrase for '{ssid}' must be 8 to 63 characters")
+
+    found = {}
+    with _psk_lock:
+        for pair in pairs:
+            if is_hex_psk(pair[1]) or pair in found:
+                continue
+            key = _psk_key(pair)
+            if key in _psk_cache:
+                _psk_cache.move_to_end(key)
+                found[pair] = _psk_cache[key]
+    missing = list(dict.fromkeys(p for p in pairs if p not in found and not is_hex_psk(p[1])))
+
+    if missing:
+        with metrics.span("precompute_psks"):
+            if len(missing) < MIN_PARALLEL_BATCH or workers == 1:
+                derived = [_derive_psk(p) for p in missing]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                workers = workers or os.cpu_count() or 1
+                chunksize = max(1, len(missing) // (workers * 4))
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    derived = list(executor.map(_derive_psk, missing, chunksize=chunksize))
+        found.update(zip(missing, derived))
+        with _psk_lock:
+            for pair, psk in zip(missing, derived):
+                _psk_cache[_psk_key(pair)] = psk
+            while len(_psk_cache) > PSK_CACHE_SIZE:
+                _psk_cache.popitem(last=False)
+
+    return [p[1].lower() if is_hex_psk(p[1]) else found[p] for p in pairs]
+
+def clear_psk_cache():
+    with _psk_lock:
+        _psk_cache.clear()
@@ -0,0 +1,510 @@
+"""Read and patch files in the FAT boot partition of a raw disk image, without mounting it.
+
+The image is accessed through mmap, so only the sectors that are actually modified (directory
+entries, FAT entries and the file's clusters) are written back.
+"""
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+SECTOR = 512
+
+# MBR partition types that hold a FAT filesystem
+MBR_FAT_TYPES = {0x01, 0x04, 0x06, 0x0B, 0x0C, 0x0E}
+MBR_GPT_PROTECTIVE = 0xEE
+
+ATTR_READ_ONLY = 0x01
+ATTR_HIDDEN = 0x02
+ATTR_SYSTEM = 0x04
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_ARCHIVE = 0x20
+ATTR_LFN = 0x0F
+
+DELETED = 0xE5
+DIR_ENTRY_SIZE = 32
+LFN_CHARS = 13
+
+# Characters allowed in an 8.3 short name besides letters and digits
+SHORT_NAME_EXTRA = set("$%'-_@~`!(){}^#&")
+
+# NT reserved byte flags: base / extension stored in lower case
+NT_LOWER_BASE = 0x08
+NT_LOWER_EXT = 0x10
+
+class FatError(Exception):
+    pass
+
+def _looks_like_fat(mm, offset):
+    """Checks for a plausible FAT boot sector (BPB) at offset."""
+    if offset + SECTOR > len(mm):
+        return False
+    sector = mm[offset:offset + SECTOR]
+    if sector[510:512] != b"\x55\xaa" or sector[0] not in (0xEB, 0xE9):
+        return False
+    bytes_per_sector = struct.unpack_from("<H", sector, 11)[0]
+    sectors_per_cluster = sector[13]
+    return (bytes_per_sector in (512, 1024, 2048, 4096)
+            and sectors_per_cluster in (1, 2, 4, 8, 16, 32, 64, 128)
+            and sector[16] in (1, 2))
+
+def find_boot_partition(mm):
+    """Returns (offset, size) in bytes of the first FAT partition in an MBR or GPT image."""
+    if len(mm) < SECTOR or mm[510:512] != b"\x55\xaa":
+        raise FatError("No partition table found")
+
+    entries = []
+    for i in range(4):
+        entry = mm[446 + i * 16:446 + (i + 1) * 16]
+        ptype = entry[4]
+        start, count = struct.unpack_from("<II", entry, 8)
+        if ptype:
+            entries.append((ptype, start, count))
+
+    if any(ptype == MBR_GPT_PROTECTIVE for ptype, _, _ in entries):
+        return _find_gpt_partition(mm)
+
+    for ptype, start, count in entries:
+        if ptype in MBR_FAT_TYPES and _looks_like_fat(mm, start * SECTOR):
+            return start * SECTOR, count * SECTOR
+
+    # No usable partition table: maybe the image is a bare FAT filesystem
+    if _looks_like_fat(mm, 0):
+        return 0, len(mm)
+    raise FatError("No FAT partition found in image")
+
+def _find_gpt_partition(mm):
+    header = mm[SECTOR:2 * SECTOR]
+    if header[0:8] != b"EFI PART":
+        raise FatError("Protective MBR without a GPT header")
+    entries_lba, num_entries, entry_size = struct.unpack_from("<QII", header, 72)
+    base = entries_lba * SECTOR
+    for i in range(num_entries):
+        entry = mm[base + i * entry_size:base + (i + 1) * entry_size]
+        if entry[0:16] == b"\x00" * 16:
+            continue
+        first_lba, last_lba = struct.unpack_from("<QQ", entry, 32)
+        if _looks_like_fat(mm, first_lba * SECTOR):
+            return first_lba * SECTOR, (last_lba - first_lba + 1) * SECTOR
+    raise FatError("No FAT partition found in GPT")
+
+def _lfn_checksum(short_name):
+    total = 0
+    for c in short_name:
+        total = (((total & 1) << 7) + (total >> 1) + c) & 0xFF
+    return total
+
+def _fat_timestamp(t=None):
+    lt = time.localtime(t)
+    fat_time = (lt.tm_hour << 11) | (lt.tm_min << 5) | (lt.tm_sec // 2)
+    fat_date = (max(lt.tm_year - 1980, 0) << 9) | (lt.tm_mon << 5) | lt.tm_mday
+    return fat_time, fat_date
+
+def _short_name_parts(name):
+    base, dot, ext = name.rpartition(".")
+    if not dot:
+        base, ext = name, ""
+    return base, ext
+
+def _is_short_char(c):
+    return c.isascii() and (c.isalnum() or c in SHORT_NAME_EXTRA)
+
+def _plain_short_name(name):
+    """Returns (11-byte name, NT case flags) if name fits 8.3 without a long name entry, else None."""
+    base, ext = _short_name_parts(name)
+    if not base or len(base) > 8 or len(ext) > 3:
+        return None
+    if not all(_is_short_char(c) for c in base + ext):
+        return None
+    flags = 0
+    for part, flag in ((base, NT_LOWER_BASE), (ext, NT_LOWER_EXT)):
+        if part.islower():
+            flags |= flag
+        elif part != part.upper():
+            return None  # Mixed case needs a long name
+    raw = base.upper().ljust(8).encode("ascii") + ext.upper().ljust(3).encode("ascii")
+    return raw, flags
+
+class DirEntry:
+    """A file in the root directory: its name and where its 32-byte slots live in the image."""
+    __slots__ = ("name", "short_name", "attr", "cluster", "size", "slots")
+
+    def __init__(self, name, short_name, attr, cluster, size, slots):
+        self.name = name
+        self.short_name = short_name
+        self.attr = attr
+        self.cluster = cluster
+        self.size = size
+        self.slots = slots  # byte offsets of the LFN entries followed by the short entry
+
+    @property
+    def short_offset(self):
+        return self.slots[-1]
+
+class FatVolume:
+    """A FAT12/16/32 filesystem inside a mmap'd image, limited to files in the root directory."""
+
+    def __init__(self, mm, offset=0):
+        self.mm = mm
+        self.offset = offset
+        bpb = mm[offset:offset + 90]
+        (self.bytes_per_sector,) = struct.unpack_from("<H", bpb, 11)
+        self.sectors_per_cluster = bpb[13]
+        (self.reserved_sectors,) = struct.unpack_from("<H", bpb, 14)
+        self.num_fats = bpb[16]
+        (self.root_entries, total16, _, fat_size16) = struct.unpack_from("<HHBH", bpb, 17)
+        (total32,) = struct.unpack_from("<I", bpb, 32)
+        (fat_size32,) = struct.unpack_from("<I", bpb, 36)
+
+        self.fat_size = fat_size16 or fat_size32
+        total_sectors = total16 or total32
+        self.cluster_size = self.bytes_per_sector * self.sectors_per_cluster
+        root_dir_sectors = (self.root_entries * DIR_ENTRY_SIZE + self.bytes_per_sector - 1) // self.bytes_per_sector
+        self.fat_offset = offset + self.reserved_sectors * self.bytes_per_sector
+        self.root_offset = self.fat_offset + self.num_fats * self.fat_size * self.bytes_per_sector
+        self.data_offset = self.root_offset + root_dir_sectors * self.bytes_per_sector
+        data_sectors = total_sectors - (self.reserved_sectors + self.num_fats * self.fat_size + root_dir_sectors)
+        self.cluster_count = data_sectors // self.sectors_per_cluster
+
+        if self.cluster_count < 4085:
+            self.fat_type = 12
+            self.eoc = 0xFFF
+        elif self.cluster_count < 65525:
+            self.fat_type = 16
+            self.eoc = 0xFFFF
+        else:
+            self.fat_type = 32
+            self.eoc = 0x0FFFFFFF
+        self.root_cluster = struct.unpack_from("<I", bpb, 44)[0] if self.fat_type == 32 else 0
+        self.fsinfo_sector = struct.unpack_from("<H", bpb, 48)[0] if self.fat_type == 32 else 0
+        self._free_hint = 2
+
+    # --- FAT table ---
+    def _fat_get(self, cluster):
+        base = self.fat_offset
+        if self.fat_type == 32:
+            return struct.unpack_from("<I", self.mm, base + cluster * 4)[0] & 0x0FFFFFFF
+        if self.fat_type == 16:
+            return struct.unpack_from("<H", self.mm, base + cluster * 2)[0]
+        value = struct.unpack_from("<H", self.mm, base + cluster + cluster // 2)[0]
+        return value >> 4 if cluster & 1 else value & 0xFFF
+
+    def _fat_set(self, cluster, value):
+        fat_bytes = self.fat_size * self.bytes_per_sector
+        for n in range(self.num_fats):
+            base = self.fat_offset + n * fat_bytes
+            if self.fat_type == 32:
+                pos = base + cluster * 4
+                old = struct.unpack_from("<I", self.mm, pos)[0]
+                struct.pack_into("<I", self.mm, pos, (old & 0xF0000000) | (value & 0x0FFFFFFF))
+            elif self.fat_type == 16:
+                struct.pack_into("<H", self.mm, base + cluster * 2, value)
+            else:
+                pos = base + cluster + cluster // 2
+                old = struct.unpack_from("<H", self.mm, pos)[0]
+                if cluster & 1:
+                    new = (old & 0x000F) | ((value & 0xFFF) << 4)
+                else:
+                    new = (old & 0xF000) | (value & 0xFFF)
+                struct.pack_into("<H", self.mm, pos, new)
+
+    def _is_eoc(self, value):
+        return value >= (self.eoc & ~7)
+
+    def _chain(self, start):
+        chain = []
+        cluster = start
+        while 2 <= cluster < self.cluster_count + 2 and not self._is_eoc(cluster):
+            chain.append(cluster)
+            if len(chain) > self.cluster_count:
+                raise FatError("Cluster chain loop detected")
+            cluster = self._fat_get(cluster)
+        return chain
+
+    def _allocate(self, count):
+        """Finds count free clusters (not yet linked)."""
+        found = []
+        last = self.cluster_count + 2
+        cluster = self._free_hint
+        for _ in range(self.cluster_count):
+            if cluster >= last:
+                cluster = 2
+            if self._fat_get(cluster) == 0:
+                found.append(cluster)
+                if len(found) == count:
+                    self._free_hint = cluster + 1
+                    return found
+            cluster += 1
+        raise FatError("Not enough free space in the boot partition")
+
+    def _link(self, chain):
+        for a, b in zip(chain, chain[1:]):
+            self._fat_set(a, b)
+        if chain:
+            self._fat_set(chain[-1], self.eoc)
+
+    def _free(self, clusters):
+        for cluster in clusters:
+            self._fat_set(cluster, 0)
+
+    def _cluster_offset(self, cluster):
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def _invalidate_fsinfo(self):
+        """Marks the FAT32 free-cluster count as unknown so it is recomputed by the next fsck/mount."""
+        if self.fat_type != 32 or not self.fsinfo_sector:
+            return
+        pos = self.offset + self.fsinfo_sector * self.bytes_per_sector
+        if self.mm[pos:pos + 4] == b"RRaA":
+            struct.pack_into("<I", self.mm, pos + 488, 0xFFFFFFFF)
+
+    # --- Root directory ---
+    def _root_slots(self):
+        """Yields the byte offset of every 32-byte slot in the root directory."""
+        if self.fat_type == 32:
+            for cluster in self._chain(self.root_cluster):
+                base = self._cluster_offset(cluster)
+                for i in range(self.cluster_size // DIR_ENTRY_SIZE):
+                    yield base + i * DIR_ENTRY_SIZE
+        else:
+            for i in range(self.root_entries):
+                yield self.root_offset + i * DIR_ENTRY_SIZE
+
+    def list_root(self):
+        """Returns the files (not directories or labels) in the root directory."""
+        entries = []
+        lfn_parts, lfn_slots, lfn_sum = {}, [], None
+        for pos in self._root_slots():
+            raw = self.mm[pos:pos + DIR_ENTRY_SIZE]
+            first = raw[0]
+            if first == 0x00:
+                break
+            if first == DELETED:
+                lfn_parts, lfn_slots = {}, []
+                continue
+            attr = raw[11]
+            if attr == ATTR_LFN:
+                seq = first & 0x1F
+                if first & 0x40:
+                    lfn_parts, lfn_slots = {}, []
+                lfn_sum = raw[13]
+                chars = raw[1:11] + raw[14:26] + raw[28:32]
+                lfn_parts[seq] = chars.decode("utf-16-le", errors="replace")
+                lfn_slots.append(pos)
+                continue
+            if attr & (ATTR_VOLUME_ID | ATTR_DIRECTORY):
+                lfn_parts, lfn_slots = {}, []
+                continue
+
+            short_name = bytes(raw[0:11])
+            name = None
+            if lfn_parts and lfn_sum == _lfn_checksum(short_name):
+                name = "".join(lfn_parts[k] for k in sorted(lfn_parts)).split("\x00", 1)[0]
+                slots = lfn_slots + [pos]
+            else:
+                slots = [pos]
+            if name is None:
+                base = short_name[0:8].decode("ascii", errors="replace").rstrip()
+                ext = short_name[8:11].decode("ascii", errors="replace").rstrip()
+                if raw[12] & NT_LOWER_BASE:
+                    base = base.lower()
+                if raw[12] & NT_LOWER_EXT:
+                    ext = ext.lower()
+                name = f"{base}.{ext}" if ext else base
+            hi, = struct.unpack_from("<H", raw, 20)
+            lo, = struct.unpack_from("<H", raw, 26)
+            size, = struct.unpack_from("<I", raw, 28)
+            cluster = (hi << 16) | lo if self.fat_type == 32 else lo
+            entries.append(DirEntry(name, short_name, attr, cluster, size, slots))
+            lfn_parts, lfn_slots = {}, []
+        return entries
+
+    def find(self, name):
+        lower = name.lower()
+        for entry in self.list_root():
+            if entry.name.lower() == lower:
+                return entry
+        return None
+
+    def volume_label(self):
+        """Returns the volume label from the root directory (falling back to the BPB)."""
+        for pos in self._root_slots():
+            raw = self.mm[pos:pos + DIR_ENTRY_SIZE]
+            if raw[0] == 0x00:
+                break
+            if raw[0] != DELETED and raw[11] != ATTR_LFN and raw[11] & ATTR_VOLUME_ID:
+                return raw[0:11].decode("ascii", errors="replace").rstrip()
+        pos = self.offset + (71 if self.fat_type == 32 else 43)
+        return self.mm[pos:pos + 11].decode("ascii", errors="replace").rstrip()
+
+    def volume_serial(self):
+        """Returns the volume serial from the BPB as shown by Windows and blkid (e.g. "1A2B-3C4D")."""
+        (serial,) = struct.unpack_from("<I", self.mm, self.offset + (67 if self.fat_type == 32 else 39))
+        return f"{serial >> 16:04X}-{serial & 0xFFFF:04X}"
+
+    def _free_slot_run(self, count):
+        """Returns offsets of count consecutive free directory slots, growing a FAT32 root if needed."""
+        run = []
+        for pos in self._root_slots():
+            if self.mm[pos] in (0x00, DELETED):
+                run.append(pos)
+                if len(run) == count:
+                    return run
+            else:
+                run = []
+        if self.fat_type != 32:
+            raise FatError("Root directory is full")
+        # Extend the root directory by one zeroed cluster
+        chain = self._chain(self.root_cluster)
+        new = self._allocate(1)[0]
+        self._fat_set(chain[-1], new)
+        self._fat_set(new, self.eoc)
+        base = self._cluster_offset(new)
+        self.mm[base:base + self.cluster_size] = bytes(self.cluster_size)
+        self._invalidate_fsinfo()
+        return self._free_slot_run(count)
+
+    def _make_short_name(self, name, existing):
+        base, ext = _short_name_parts(name)
+        clean = lambda s: "".join(c for c in s.upper() if _is_short_char(c))
+        base, ext = clean(base.replace(".", "")) or "FILE", clean(ext)[:3]
+        for n in range(1, 1000000):
+            tail = f"~{n}"
+            candidate = (base[:8 - len(tail)] + tail).ljust(8) + ext.ljust(3)
+            raw = candidate.encode("ascii")
+            if raw not in existing:
+                return raw
+        raise FatError("Could not generate a unique short name")
+
+    # --- Files ---
+    def read_file(self, name):
+        entry = self.find(name)
+        if entry is None:
+            return None
+        remaining = entry.size
+        parts = []
+        for cluster in self._chain(entry.cluster):
+            if remaining <= 0:
+                break
+            pos = self._cluster_offset(cluster)
+            chunk = min(remaining, self.cluster_size)
+            parts.append(self.mm[pos:pos + chunk])
+            remaining -= chunk
+        return b"".join(parts)
+
+    def write_file(self, name, data):
+        """Creates or rewrites a root directory file, reusing its existing clusters where possible."""
+        entries = self.list_root()
+        entry = next((e for e in entries if e.name.lower() == name.lower()), None)
+        needed = (len(data) + self.cluster_size - 1) // self.cluster_size
+
+        chain = self._chain(entry.cluster) if entry and entry.cluster else []
+        if len(chain) > needed:
+            self._free(chain[needed:])
+            chain = chain[:needed]
+        elif len(chain) < needed:
+            chain = chain + self._allocate(needed - len(chain))
+        self._link(chain)
+        if needed or chain:
+            self._invalidate_fsinfo()
+
+        for i, cluster in enumerate(chain):
+            pos = self._cluster_offset(cluster)
+            chunk = data[i * self.cluster_size:(i + 1) * self.cluster_size]
+            self.mm[pos:pos + len(chunk)] = chunk
+
+        first_cluster = chain[0] if chain else 0
+        fat_time, fat_date = _fat_timestamp()
+        if entry is None:
+            self._create_entry(name, entries, first_cluster, len(data), fat_time, fat_date)
+        else:
+            pos = entry.short_offset
+            struct.pack_into("<H", self.mm, pos + 20, (first_cluster >> 16) if self.fat_type == 32 else 0)
+            struct.pack_into("<HH", self.mm, pos + 22, fat_time, fat_date)
+            struct.pack_into("<H", self.mm, pos + 26, first_cluster & 0xFFFF)
+            struct.pack_into("<I", self.mm, pos + 28, len(data))
+            self.mm[pos + 11] = self.mm[pos + 11] | ATTR_ARCHIVE
+            struct.pack_into("<H", self.mm, pos + 18, fat_date)
+
+    def _create_entry(self, name, entries, cluster, size, fat_time, fat_date):
+        plain = _plain_short_name(name)
+        if plain is not None and plain[0] not in {e.short_name for e in entries}:
+            short_name, nt_flags = plain
+            lfn_entries = []
+        else:
+            short_name = self._make_short_name(name, {e.short_name for e in entries})
+            nt_flags = 0
+            lfn_entries = self._lfn_entries(name, short_name)
+
+        slots = self._free_slot_run(len(lfn_entries) + 1)
+        for pos, raw in zip(slots, lfn_entries):
+            self.mm[pos:pos + DIR_ENTRY_SIZE] = raw
+
+        short = bytearray(DIR_ENTRY_SIZE)
+        short[0:11] = short_name
+        short[11] = ATTR_ARCHIVE
+        short[12] = nt_flags
+        struct.pack_into("<HH", short, 14, fat_time, fat_date)
+        struct.pack_into("<H", short, 18, fat_date)
+        struct.pack_into("<H", short, 20, (cluster >> 16) if self.fat_type == 32 else 0)
+        struct.pack_into("<HH", short, 22, fat_time, fat_date)
+        struct.pack_into("<H", short, 26, cluster & 0xFFFF)
+        struct.pack_into("<I", short, 28, size)
+        pos = slots[-1]
+        self.mm[pos:pos + DIR_ENTRY_SIZE] = bytes(short)
+
+    def _lfn_entries(self, name, short_name):
+        """Builds the long file name entries, in on-disk order (last part first)."""
+        checksum = _lfn_checksum(short_name)
+        encoded = name.encode("utf-16-le")
+        chars = [encoded[i:i + 2] for i in range(0, len(encoded), 2)]
+        count = (len(chars) + LFN_CHARS - 1) // LFN_CHARS
+        padded = chars + [b"\x00\x00"]
+        padded += [b"\xff\xff"] * (count * LFN_CHARS - len(padded))
+        padded = padded[:count * LFN_CHARS]
+
+        result = []
+        for seq in range(count, 0, -1):
+            part = b"".join(padded[(seq - 1) * LFN_CHARS:seq * LFN_CHARS])
+            raw = bytearray(DIR_ENTRY_SIZE)
+            raw[0] = seq | (0x40 if seq == count else 0)
+            raw[1:11] = part[0:10]
+            raw[11] = ATTR_LFN
+            raw[13] = checksum
+            raw[14:26] = part[10:22]
+            raw[28:32] = part[22:26]
+            result.append(bytes(raw))
+        return result
+
+    def delete_file(self, name):
+        entry = self.find(name)
+        if entry is None:
+            return False
+        if entry.cluster:
+            self._free(self._chain(entry.cluster))
+            self._invalidate_fsinfo()
+        for pos in entry.slots:
+            self.mm[pos] = DELETED
+        return True
+
+    def flush(self):
+        self.mm.flush()
+
+@contextmanager
+def open_image(path, writable=False):
+    """Opens an image file and yields the FatVolume of its boot partition."""
+    with open(path, "r+b" if writable else "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise FatError("Image file is empty")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        try:
+            offset, _ = find_boot_partition(mm)
+            volume = FatVolume(mm, offset)
+            yield volume
+            if writable:
+                volume.flush()
+        finally:
+            mm.close()
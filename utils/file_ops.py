@@ -1,5 +1,40 @@
+import copy
+import hashlib
 import os
-import re
+import threading
+import time
+from contextlib import contextmanager
+from utils.wpa_supplicant import WpaSupplicantConf
+from utils.boot_txt import ConfigTxt, CmdlineTxt, edits_key, render_config_txt, render_cmdline_txt
+from utils.fat_image import FatError, open_image
+from utils.crypto import precompute_psks
+from utils import metrics, readback
+from utils.metrics import traced
+
+# Boot files are written as UTF-8; surrogateescape keeps any other bytes intact on a round-trip
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+
+# FAT keeps modification times to 2 s: a change within that window can leave a file's stamp as it was
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+def _settled(stamp):
+    """True once a stamp's mtime is old enough that any later change would give a different stamp."""
+    mtime = stamp[2]
+    return mtime is None or time.time_ns() - mtime >= MTIME_GRANULARITY_NS
+
+def _fsync_dir(path):
+    """Flushes directory metadata (renames) to disk. Not supported on Windows, where it's a no-op."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 class BootConfigManager:
     def __init__(self, boot_path=None):
@@ -8,134 +43,451 @@ class BootConfigManager:
             "ssh": "ssh",
             "wpa_supplicant": "wpa_supplicant.conf",
             "userconf": "userconf.txt",
-            "network_config": "network-config"
+            "network_config": "network-config",
+            "config_txt": "config.txt",
+            "cmdline_txt": "cmdline.txt"
         }
+        self._staged = None  # {key: bytes or None (delete)} while a transaction is open
+
+        # Parsed files keyed by a stat stamp: reopening a dialog costs a stat, not a read + parse
+        self._cache = {}  # {(key, kind): (stamp, value)}
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # sha256 of each file as last seen on disk, keyed by the same stamp: lets a stat stand in for a read
+        self._fingerprints = {}  # {key: (stamp, sha256 hex or None if missing)}
+        self.last_plan = {}      # {key: "create" / "modify" / "delete" / "unchanged"} of the last commit
+        self.last_written = {}   # {key: {"sha256", "size"} or None (deleted)} of the files the last commit wrote
+        self.snapshots = None    # snapshots.SnapshotStore: backs up files before a commit changes them
+        self.last_snapshot = None
+        self._known_digests = {}  # {key: sha256} of contents being restored, trusted instead of re-hashing
 
     def set_boot_path(self, path):
         self.boot_path = path
 
+    @traced
     def check_files_status(self):
-        """Checks if key files exist in the boot directory."""
-        status = {}
-        if not self.boot_path or not os.path.exists(self.boot_path):
+        """Checks if key files exist in the boot directory (a single directory listing)."""
+        if not self.boot_path:
             return {k: False for k in self.files}
-        
-        for key, filename in self.files.items():
-            file_path = os.path.join(self.boot_path, filename)
-            status[key] = os.path.exists(file_path)
-        return status
+        return self._cached(None, "status", self._list_status)
+
+    def _list_status(self):
+        try:
+            if self.is_image():
+                with open_image(self.boot_path) as volume:
+                    names = {entry.name.lower() for entry in volume.list_root()}
+            else:
+                with os.scandir(self.boot_path) as it:
+                    # FAT is case-insensitive, so compare names the same way
+                    names = {entry.name.lower() for entry in it}
+        except (OSError, FatError):
+            return {k: False for k in self.files}
+        return {key: filename.lower() in names for key, filename in self.files.items()}
+
+    def is_image(self):
+        """True when boot_path is a raw disk image (.img) rather than a mounted folder."""
+        return bool(self.boot_path) and os.path.isfile(self.boot_path)
 
     def get_file_path(self, key):
         return os.path.join(self.boot_path, self.files[key])
 
+    # --- Parse Cache ---
+    def _stamp(self, key):
+        """Identifies the on-disk state of a file: (path, size, mtime_ns, inode), None fields if missing.
+
+        key=None stamps the boot folder itself, whose mtime changes when files are added or removed.
+        An image is stamped as a whole, since every file lives inside it.
+        """
+        path = self.boot_path if key is None or self.is_image() else self.get_file_path(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return (path, None, None, None)
+        return (path, st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def _cached(self, key, kind, load):
+        """Returns load() for a file, reusing the last result while the file's stamp is unchanged.
+
+        A stamp younger than the mtime granularity isn't trusted yet, since a change within the
+        same tick would not show in it.
+
+        Callers get a deep copy, so editing the result never touches the cached snapshot.
+        """
+        if self._staged is not None and key in self._staged:
+            return load()  # Staged content isn't on disk yet
+        # Stamp before reading: a change that lands mid-read gives a newer stamp next time
+        stamp = self._stamp(key)
+        with self._cache_lock:
+            entry = self._cache.get((key, kind))
+            if entry and entry[0] == stamp and _settled(stamp):
+                self.cache_hits += 1
+                return copy.deepcopy(entry[1])
+            self.cache_misses += 1
+        value = load()
+        with self._cache_lock:
+            self._cache[(key, kind)] = (stamp, value)
+        return copy.deepcopy(value)
+
+    def invalidate_cache(self, keys=None):
+        """Drops cached parses for the given file keys (and the folder status), or everything."""
+        with self._cache_lock:
+            if keys is None:
+                self._cache.clear()
+                self._fingerprints.clear()
+                return
+            keys = set(keys) | {None}
+            for cache_key in [k for k in self._cache if k[0] in keys]:
+                del self._cache[cache_key]
+
+    def file_stamp(self, key):
+        """Public form of the stat stamp, for callers that remember file state between runs."""
+        return self._stamp(key)
+
+    def cache_stats(self):
+        with self._cache_lock:
+            return {"hits": self.cache_hits, "misses": self.cache_misses, "entries": len(self._cache)}
+
+    # --- File Layer ---
+    @contextmanager
+    def transaction(self, dry_run=False):
+        """Stages every write made inside the with-block and commits them together on exit.
+
+        Each file is written to a temp file, fsynced and moved into place with os.replace, then
+        the boot directory is fsynced once. If the block raises, nothing is written. With
+        dry_run, nothing is written either way and last_plan tells what a commit would do.
+        """
+        if self._staged is not None:
+            yield self  # Nested: the outer transaction commits
+            return
+        self._staged = {}
+        try:
+            try:
+                yield self
+                staged = self._staged
+            finally:
+                self._staged = None
+            if dry_run:
+                self.last_plan = self.plan_changes(staged)
+            else:
+                self._commit(staged)
+        finally:
+            self._known_digests = {}
+
+    # --- Write Elision ---
+    def _content_hash(self, key, stamp):
+        """sha256 of the file on disk (None if missing), read only when the stamp is new."""
+        with self._cache_lock:
+            entry = self._fingerprints.get(key)
+        if entry and entry[0] == stamp and _settled(stamp):
+            return entry[1]
+        data = self._read_bytes(key)
+        digest = hashlib.sha256(data).hexdigest() if data is not None else None
+        with self._cache_lock:
+            self._fingerprints[key] = (stamp, digest)
+        return digest
+
+    def _digest(self, key, data):
+        known = self._known_digests.get(key)
+        return known if known is not None else hashlib.sha256(data).hexdigest()
+
+    def classify(self, key, data):
+        """Compares desired content (bytes, or None for absent) with the card without writing.
+
+        Returns "create", "modify", "delete" or "unchanged". A missing file or a size mismatch
+        is decided from the stat alone; otherwise content hashes are compared.
+        """
+        stamp = self._stamp(key)
+        if not self.is_image():
+            exists = stamp[1] is not None
+            if data is None:
+                return "delete" if exists else "unchanged"
+            if not exists:
+                return "create"
+            if stamp[1] != len(data):
+                return "modify"
+        current = self._content_hash(key, stamp)
+        if data is None:
+            return "unchanged" if current is None else "delete"
+        if current is None:
+            return "create"
+        return "unchanged" if current == self._digest(key, data) else "modify"
+
+    def plan_changes(self, changes):
+        """Classifies every {key: bytes or None} change (see classify)."""
+        return {key: self.classify(key, data) for key, data in changes.items()}
+
+    def _read_bytes(self, key):
+        """Returns the current content of a boot file (including staged writes), or None if missing."""
+        if self._staged is not None and key in self._staged:
+            return self._staged[key]
+        if self.is_image():
+            with open_image(self.boot_path) as volume:
+                data = volume.read_file(self.files[key])
+        else:
+            path = self.get_file_path(key)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        if data is not None:
+            metrics.add("bytes_read", len(data))
+        return data
+
+    def read_file(self, key):
+        """Raw bytes of a boot file, or None if it is missing."""
+        return self._read_bytes(key)
+
+    def read_back(self, key, direct=False):
+        """Re-reads a file from the card rather than the page cache. Returns (data or None, bypassed).
+
+        bypassed is False where the OS can't drop cached pages, so the read proves less.
+        """
+        if self.is_image():
+            bypassed = readback.drop_cached_pages(self.boot_path)
+            return self._read_bytes(key), bypassed
+        path = self.get_file_path(key)
+        if not os.path.exists(path):
+            return None, True
+        data, bypassed = readback.read_uncached(path, direct)
+        metrics.add("bytes_read", len(data))
+        return data, bypassed
+
+    def _read_text(self, key, newline=None):
+        """Like _read_bytes but decoded. newline=None translates line endings to \\n, '' keeps them."""
+        data = self._read_bytes(key)
+        if data is None:
+            return None
+        text = data.decode(ENCODING, ERRORS)
+        if newline is None:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def _write_text(self, key, content):
+        self._write_bytes(key, content.encode(ENCODING, ERRORS))
+
+    def _write_bytes(self, key, data):
+        self._known_digests.pop(key, None)
+        if self._staged is not None:
+            self._staged[key] = data
+        else:
+            self._commit({key: data})
+
+    def _remove_file(self, key):
+        if self._staged is not None:
+            self._staged[key] = None
+        else:
+            self._commit({key: None})
+
+    def _commit(self, changes):
+        """Atomically applies {key: bytes or None} to the boot folder with a single directory fsync.
+
+        When boot_path is an image file, the changes are patched into its boot partition instead.
+        """
+        if not changes:
+            return
+        with metrics.span("commit", self.boot_path):
+            # Files that already hold the desired bytes aren't rewritten (saves I/O and SD wear)
+            self.last_plan = self.plan_changes(changes)
+            pending = {key: data for key, data in changes.items() if self.last_plan[key] != "unchanged"}
+            self.last_written = {}
+            if not pending:
+                return
+            if self.snapshots is not None:
+                # Back up what is about to be overwritten; if that fails, nothing is written
+                before = {key: self._read_bytes(key) for key in pending}
+                after = {key: self._digest(key, data) if data is not None else None for key, data in pending.items()}
+                self.last_snapshot = self.snapshots.save(self.boot_path, before, {key: self.files[key] for key in pending}, after)
+            try:
+                self._write_changes(pending)
+            finally:
+                # Same-size rewrites can land within the filesystem's mtime granularity, so drop the stamps
+                self.invalidate_cache(pending)
+            # We know what we just wrote: the next plan can trust a stat instead of re-reading
+            with self._cache_lock:
+                for key, data in pending.items():
+                    digest = self._digest(key, data) if data is not None else None
+                    self._fingerprints[key] = (self._stamp(key), digest)
+                    self.last_written[key] = {"sha256": digest, "size": len(data)} if data is not None else None
+
+    def _write_changes(self, changes):
+        if self.is_image():
+            self._commit_image(changes)
+            return
+        for key, data in changes.items():
+            path = self.get_file_path(key)
+            if data is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            tmp_path = os.path.join(self.boot_path, f".{self.files[key]}.tmp")
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    with metrics.timed("fsync_s"):
+                        os.fsync(f.fileno())
+                metrics.add("bytes_written", len(data))
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        with metrics.timed("fsync_s"):
+            _fsync_dir(self.boot_path)
+
+    def _commit_image(self, changes):
+        """Patches the files inside the image's FAT boot partition; only touched sectors are written."""
+        with open_image(self.boot_path, writable=True) as volume:
+            for key, data in changes.items():
+                if data is None:
+                    volume.delete_file(self.files[key])
+                else:
+                    volume.write_file(self.files[key], data)
+                    metrics.add("bytes_written", len(data))
+            with metrics.timed("fsync_s"):
+                volume.flush()
+
+    @traced
+    def restore_files(self, contents, digests=None):
+        """Writes raw {key: bytes or None (delete)} contents in one transaction (rollback, bundles).
+
+        digests is an optional {key: sha256} of those contents, used instead of hashing them again.
+        """
+        with self.transaction():
+            for key, data in contents.items():
+                if data is None:
+                    self._remove_file(key)
+                else:
+                    self._write_bytes(key, data)
+                    if digests and key in digests:
+                        self._known_digests[key] = digests[key]
+
     # --- SSH ---
+    @traced
     def create_ssh(self):
         """Creates an empty ssh file."""
-        with open(self.get_file_path("ssh"), 'w') as f:
-            pass
+        self._write_bytes("ssh", b"")
 
+    @traced
     def remove_ssh(self):
         """Removes the ssh file."""
-        path = self.get_file_path("ssh")
-        if os.path.exists(path):
-            os.remove(path)
+        self._remove_file("ssh")
 
     # --- WPA Supplicant ---
+    @traced
+    def load_wpa_supplicant(self):
+        """Loads wpa_supplicant.conf into a lossless WpaSupplicantConf model."""
+        content = self._read_text("wpa_supplicant", newline='')
+        if content is None:
+            return WpaSupplicantConf()
+        return WpaSupplicantConf.parse(content)
+
+    @traced
     def parse_wpa_supplicant(self):
         """Parses wpa_supplicant.conf and returns (global_config, networks)."""
-        path = self.get_file_path("wpa_supplicant")
-        defaults = {
-            "country": "US",
-            "ctrl_interface_dir": "/var/run/wpa_supplicant",
-            "ctrl_interface_group": "netdev",
-            "update_config": "1"
-        }
-        networks = []
-        
-        if not os.path.exists(path):
-            return defaults, networks
-
-        with open(path, 'r') as f:
-            content = f.read()
-
-        # Parse Globals
-        country_match = re.search(r'^country=(.*)$', content, re.MULTILINE)
-        if country_match: defaults["country"] = country_match.group(1).strip()
-
-        ctrl_match = re.search(r'^ctrl_interface=(.*)$', content, re.MULTILINE)
-        if ctrl_match:
-            line = ctrl_match.group(1).strip()
-            # Try to extract DIR and GROUP
-            dir_match = re.search(r'DIR=(.*?)\s', line + ' ') # Add space to help regex
-            group_match = re.search(r'GROUP=(.*?)$', line)
-            
-            if dir_match: defaults["ctrl_interface_dir"] = dir_match.group(1).strip()
-            if group_match: defaults["ctrl_interface_group"] = group_match.group(1).strip()
-
-        # Regex to find network blocks
-        network_blocks = re.findall(r'network\s*=\s*{(.*?)}', content, re.DOTALL)
-        
-        for block in network_blocks:
-            ssid_match = re.search(r'ssid\s*=\s*"(.*?)"', block)
-            psk_match = re.search(r'psk\s*=\s*"(.*?)"', block)
-            priority_match = re.search(r'priority\s*=\s*(\d+)', block)
-            
-            if ssid_match and psk_match:
-                net = {
-                    "ssid": ssid_match.group(1),
-                    "psk": psk_match.group(1)
-                }
-                if priority_match:
-                    net["priority"] = priority_match.group(1)
-                networks.append(net)
-        return defaults, networks
-
-    def write_wpa_supplicant(self, config, networks):
-        """Writes wpa_supplicant.conf with given config and networks."""
-        content = f"""country={config.get('country', 'US')}
-ctrl_interface=DIR={config.get('ctrl_interface_dir', '/var/run/wpa_supplicant')} GROUP={config.get('ctrl_interface_group', 'netdev')}
-update_config={config.get('update_config', '1')}
-"""
-        for net in networks:
-            priority_line = f"\n    priority={net['priority']}" if 'priority' in net else ""
-            content += f"""
-network={{
-    ssid="{net['ssid']}"
-    psk="{net['psk']}"{priority_line}
-}}
-"""
-        with open(self.get_file_path("wpa_supplicant"), 'w', newline='\n') as f:
-            f.write(content)
+        return self._cached("wpa_supplicant", "parsed", self._parse_wpa_supplicant)
+
+    def _parse_wpa_supplicant(self):
+        conf = self.load_wpa_supplicant()
+        return conf.get_globals(), conf.get_networks()
+
+    @traced
+    def write_wpa_supplicant(self, config, networks, precompute_psk=False):
+        """Writes wpa_supplicant.conf with given config and networks.
+
+        The existing file is updated in place: comments, unknown keys and formatting of
+        networks that are kept survive the write. With precompute_psk, passphrases are stored
+        as the 64-hex PSK so the Pi skips PBKDF2 and the plain text never reaches the card.
+        """
+        if precompute_psk:
+            networks = [dict(net) for net in networks]
+            with_psk = [net for net in networks if net.get("psk")]
+            psks = precompute_psks([(net["ssid"], net["psk"]) for net in with_psk])
+            for net, psk in zip(with_psk, psks):
+                net["psk"] = psk
+        conf = self.load_wpa_supplicant()
+        conf.update(config, networks)
+        self._write_text("wpa_supplicant", conf.serialize())
 
     # --- User Conf ---
+    @traced
     def parse_userconf(self):
         """Parses userconf.txt and returns (username, password_hash)."""
-        path = self.get_file_path("userconf")
-        if not os.path.exists(path):
+        return self._cached("userconf", "parsed", self._parse_userconf)
+
+    def _parse_userconf(self):
+        content = self._read_text("userconf")
+        if content is None:
             return None, None
         
-        with open(path, 'r') as f:
-            line = f.readline().strip()
-            if ':' in line:
-                parts = line.split(':')
-                return parts[0], parts[1] if len(parts) > 1 else ""
+        line = content.split("\n", 1)[0].strip()
+        if ':' in line:
+            parts = line.split(':')
+            return parts[0], parts[1] if len(parts) > 1 else ""
         return None, None
 
+    @traced
     def write_userconf(self, username, password_hash):
         """Writes userconf.txt."""
-        with open(self.get_file_path("userconf"), 'w', newline='\n') as f:
-            f.write(f"{username}:{password_hash}\n")
+        self._write_text("userconf", f"{username}:{password_hash}\n")
 
     # --- Network Config ---
+    @traced
     def read_network_config(self):
         """Reads network-config content."""
-        path = self.get_file_path("network_config")
-        if not os.path.exists(path):
-            return ""
-        with open(path, 'r') as f:
-            return f.read()
+        return self._cached("network_config", "text", self._read_network_config)
 
+    def _read_network_config(self):
+        content = self._read_text("network_config")
+        return content if content is not None else ""
+
+    @traced
     def write_network_config(self, content):
         """Writes network-config content."""
-        with open(self.get_file_path("network_config"), 'w', newline='\n') as f:
-            f.write(content)
+        self._write_text("network_config", content)
+
+    @traced
+    def parse_network_config(self):
+        """Parses network-config YAML into a dict (netplan v2 model). Raises ValueError on bad YAML."""
+        from utils.network_config import parse_network_config
+        return self._cached("network_config", "parsed", lambda: parse_network_config(self._read_network_config()))
+
+    @traced
+    def write_network_config_model(self, model):
+        """Writes a network-config dict as YAML."""
+        from utils.network_config import dump_network_config
+        self._write_text("network_config", dump_network_config(model))
+
+    # --- config.txt / cmdline.txt ---
+    @traced
+    def load_config_txt(self):
+        """Loads config.txt into a ConfigTxt model indexed by (section, key)."""
+        return self._cached("config_txt", "model", lambda: ConfigTxt.parse(self._read_text("config_txt", newline='') or ""))
+
+    @traced
+    def update_config_txt(self, edits):
+        """Applies {section: {key: value}} to config.txt; only changed lines are rewritten.
+
+        Returns False (and writes nothing) when the file already matches.
+        """
+        return self._update_txt("config_txt", render_config_txt, edits)
+
+    @traced
+    def load_cmdline_txt(self):
+        """Loads cmdline.txt into a CmdlineTxt model."""
+        return self._cached("cmdline_txt", "model", lambda: CmdlineTxt.parse(self._read_text("cmdline_txt", newline='') or ""))
+
+    @traced
+    def update_cmdline_txt(self, edits):
+        """Applies {arg: value} to cmdline.txt (True = flag, None = remove). Returns whether it changed."""
+        return self._update_txt("cmdline_txt", render_cmdline_txt, edits)
+
+    def _update_txt(self, key, render, edits):
+        # render() is memoised on (content, edits), so identical cards are only parsed once
+        content = render(self._read_text(key, newline='') or "", edits_key(edits))
+        if content is None:
+            return False
+        self._write_text(key, content)
+        return True
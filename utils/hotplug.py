@@ -0,0 +1,185 @@
+import os
+import shlex
+import string
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.provision import apply_profile, prepare_profile, verify_profile, verify_written
+
+MOUNTINFO = "/proc/self/mountinfo"
+
+# Files that only a Raspberry Pi boot partition has
+BOOT_MARKERS = {"config.txt", "cmdline.txt", "bootcode.bin", "start.elf", "start4.elf", "fixup.dat", "fixup4.dat"}
+BOOT_LABELS = {"boot", "bootfs", "system-boot"}
+FAT_TYPES = {"vfat", "msdos", "fat", "exfat"}
+
+def _unescape(field):
+    """Decodes the octal escapes (\\040 for space etc.) used in mountinfo."""
+    if "\\" not in field:
+        return field
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == "\\" and field[i + 1:i + 4].isdigit():
+            out.append(chr(int(field[i + 1:i + 4], 8)))
+            i += 4
+        else:
+            out.append(field[i])
+            i += 1
+    return "".join(out)
+
+def read_mountinfo(path=MOUNTINFO):
+    """Returns {mount_point: (source_device, fstype)} from /proc/self/mountinfo."""
+    mounts = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = line.split()
+            if "-" not in fields:
+                continue
+            sep = fields.index("-")
+            mount_point = _unescape(fields[4])
+            fstype = fields[sep + 1]
+            source = _unescape(fields[sep + 2]) if len(fields) > sep + 2 else ""
+            mounts[mount_point] = (source, fstype)
+    return mounts
+
+def list_candidate_mounts(media_dirs=None):
+    """Returns {mount_point: (source, fstype)} for everything that could be an SD card.
+
+    Linux reads mountinfo (FAT filesystems only). Elsewhere, or when media_dirs is given, the
+    sub-folders of those directories (or the drive letters on Windows) are listed instead.
+    """
+    if media_dirs:
+        mounts = {}
+        for media in media_dirs:
+            try:
+                with os.scandir(media) as it:
+                    for entry in it:
+                        if entry.is_dir():
+                            mounts[entry.path] = ("", "")
+            except OSError:
+                continue
+        return mounts
+    if os.path.exists(MOUNTINFO):
+        return {mp: info for mp, info in read_mountinfo().items() if info[1] in FAT_TYPES}
+    if sys.platform == "win32":
+        return {f"{letter}:\\": ("", "") for letter in string.ascii_uppercase[2:] if os.path.exists(f"{letter}:\\")}
+    return {}
+
+def volume_label(device):
+    """Looks up the FAT volume label of a block device via /dev/disk/by-label (Linux only)."""
+    by_label = "/dev/disk/by-label"
+    if not device.startswith("/dev/") or not os.path.isdir(by_label):
+        return None
+    real = os.path.realpath(device)
+    for name in os.listdir(by_label):
+        if os.path.realpath(os.path.join(by_label, name)) == real:
+            return _unescape(name.replace("\\x20", " "))
+    return None
+
+def is_boot_partition(mount_point, device=""):
+    """Recognises a Pi boot partition by its files, or failing that by its volume label."""
+    try:
+        with os.scandir(mount_point) as it:
+            names = {entry.name.lower() for entry in it}
+    except OSError:
+        return False
+    if names & BOOT_MARKERS or any(n.startswith("kernel") and n.endswith(".img") for n in names):
+        return True
+    label = volume_label(device) if device else None
+    return bool(label) and label.lower() in BOOT_LABELS
+
+class HotplugDaemon:
+    """Watches for newly mounted boot partitions and provisions each one with a profile.
+
+    Cards are handled on a thread pool, so one slot being written never holds up the others.
+    on_event(kind, mount_point, detail) is called for "detected", "done", "failed" and "removed".
+    """
+
+    def __init__(self, profile, on_event=None, poll_interval=1.0, workers=8, media_dirs=None,
+                 include_existing=False, on_done_cmd=None):
+        self.profile = prepare_profile(profile)
+        self.on_event = on_event or (lambda kind, mount_point, detail: None)
+        self.poll_interval = poll_interval
+        self.media_dirs = media_dirs
+        self.include_existing = include_existing
+        self.on_done_cmd = on_done_cmd
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.known = set()
+        self.in_progress = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Polls the mount table until stop() is called."""
+        if not self.include_existing:
+            mounts = list_candidate_mounts(self.media_dirs)
+            self.known = {mp for mp, (source, _) in mounts.items() if is_boot_partition(mp, source)}
+        try:
+            while not self._stop.is_set():
+                self.poll()
+                self._stop.wait(self.poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def poll(self):
+        mounts = list_candidate_mounts(self.media_dirs)
+        current = set(mounts)
+        # Mounts that aren't (yet) recognised stay out of known so they're checked again next poll
+        for mount_point in sorted(current - self.known):
+            source, _ = mounts[mount_point]
+            if not is_boot_partition(mount_point, source):
+                continue
+            self.known.add(mount_point)
+            with self._lock:
+                if mount_point in self.in_progress:
+                    continue
+                self.in_progress.add(mount_point)
+            self.on_event("detected", mount_point, source)
+            self.executor.submit(self._provision, mount_point)
+        for mount_point in self.known - current:
+            self.on_event("removed", mount_point, "")
+        self.known &= current
+
+    def _provision(self, mount_point):
+        try:
+            result = apply_profile(mount_point, self.profile)
+            if result["ok"]:
+                # Counterfeit cards and flaky readers can accept a write and lose it: read it back from the device
+                check = verify_written(mount_point, result["written"])
+                if not check["ok"]:
+                    result["ok"] = False
+                    result["error"] = "read-back failed: " + (check["error"] or ", ".join(check["mismatches"]))
+            if result["ok"]:
+                problems = verify_profile(mount_point, self.profile)
+                if problems:
+                    result["ok"] = False
+                    result["error"] = "verification failed: " + ", ".join(problems)
+            if result["ok"]:
+                self.on_event("done", mount_point, f"{result['total'] * 1000:.0f} ms")
+                self._signal_done(mount_point)
+            else:
+                self.on_event("failed", mount_point, result["error"])
+        except Exception as e:
+            self.on_event("failed", mount_point, str(e))
+        finally:
+            with self._lock:
+                self.in_progress.discard(mount_point)
+
+    def _signal_done(self, mount_point):
+        if not self.on_done_cmd:
+            return
+        try:
+            subprocess.run(shlex.split(self.on_done_cmd) + [mount_point], check=False, timeout=60)
+        except (OSError, subprocess.SubprocessError) as e:
+            self.on_event("failed", mount_point, f"on-done command: {e}")
+
+def print_event(kind, mount_point, detail):
+    """Default console reporter; rings the terminal bell when a card is finished."""
+    stamp = time.strftime("%H:%M:%S")
+    bell = "\a" if kind == "done" else ""
+    print(f"{stamp} [{kind.upper()}] {mount_point} {detail}{bell}".rstrip(), flush=True)
@@ -0,0 +1,144 @@
+import errno
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.provision import apply_profile, prepare_profile
+
+# ioctl number of FICLONE from <linux/fs.h>
+FICLONE = 0x40049409
+CHUNK = 1024 * 1024
+
+def _reflink(src_fd, dst_fd):
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+def _data_ranges(fd, size):
+    """Yields (start, end) of the allocated regions of a file, skipping holes."""
+    pos = 0
+    while pos < size:
+        try:
+            start = os.lseek(fd, pos, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # only a hole left
+            raise
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        yield start, end
+        pos = end
+
+def _copy_ranges(src_fd, dst_fd, size):
+    """Copies only the data regions with copy_file_range, so holes stay holes."""
+    for start, end in _data_ranges(src_fd, size):
+        pos = start
+        while pos < end:
+            copied = os.copy_file_range(src_fd, dst_fd, end - pos, pos, pos)
+            if copied == 0:
+                break
+            pos += copied
+
+def _copy_sparse(src_fd, dst_fd, size):
+    """Portable fallback: copies in chunks and seeks over all-zero chunks instead of writing them."""
+    zero = bytes(CHUNK)
+    pos = 0
+    while pos < size:
+        chunk = os.pread(src_fd, CHUNK, pos) if hasattr(os, "pread") else _read_at(src_fd, pos)
+        if not chunk:
+            break
+        if chunk != zero[:len(chunk)]:
+            os.lseek(dst_fd, pos, os.SEEK_SET)
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(dst_fd, view):]
+        pos += len(chunk)
+
+def _read_at(fd, pos):
+    os.lseek(fd, pos, os.SEEK_SET)
+    return os.read(fd, CHUNK)
+
+def clone_file(src, dst):
+    """Clones src to dst with the cheapest method the filesystem supports.
+
+    Tries a reflink (FICLONE, shares blocks copy-on-write), then copy_file_range over the
+    data regions only, then a chunked copy that skips zero blocks. Returns the method used.
+    Raises ValueError if dst is src (same path, symlink or hard link): it is never truncated.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        src_st = os.fstat(src_fd)
+        size = src_st.st_size
+        # Opened without O_TRUNC and compared by inode, so no path trick can truncate the source
+        dst_fd = os.open(dst, flags, 0o644)
+        try:
+            dst_st = os.fstat(dst_fd)
+            if (dst_st.st_dev, dst_st.st_ino) == (src_st.st_dev, src_st.st_ino):
+                raise ValueError(f"Destination {dst} is the golden image itself")
+            os.ftruncate(dst_fd, 0)
+            try:
+                _reflink(src_fd, dst_fd)
+                return "reflink"
+            except (ImportError, OSError):
+                pass
+
+            method = "sparse"
+            if hasattr(os, "copy_file_range") and hasattr(os, "SEEK_DATA"):
+                try:
+                    _copy_ranges(src_fd, dst_fd, size)
+                    method = "copy_file_range"
+                except OSError:
+                    os.ftruncate(dst_fd, 0)
+            if method == "sparse":
+                _copy_sparse(src_fd, dst_fd, size)
+            # Trailing holes aren't written, so set the final size explicitly
+            os.ftruncate(dst_fd, size)
+            return method
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+def clone_and_provision(golden, dst, profile):
+    """Clones the golden image to dst and patches the boot files with a prepared profile."""
+    start = time.perf_counter()
+    method = clone_file(golden, dst)
+    clone_time = time.perf_counter() - start
+    result = apply_profile(dst, profile)
+    result["clone_method"] = method
+    result["timings"]["clone"] = clone_time
+    result["total"] += clone_time
+    return result
+
+def clone_images(golden, targets, workers=None):
+    """Builds one device image per (dst_path, profile) in targets.
+
+    Returns (results, stats) where stats holds the MB/s (logical image bytes) and images/minute.
+    """
+    for dst, _ in targets:
+        # Checked up front too, so no image is built when one target would fail this way
+        if os.path.exists(dst) and os.path.samefile(golden, dst):
+            raise ValueError(f"Destination {dst} is the golden image itself")
+    prepared = [(dst, prepare_profile(profile)) for dst, profile in targets]
+    size = os.path.getsize(golden)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or min(8, max(1, len(prepared)))) as executor:
+        futures = [executor.submit(clone_and_provision, golden, dst, profile) for dst, profile in prepared]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    return results, _stats(len(results), size, elapsed)
+
+def baseline_copy(golden, dst):
+    """Times a plain shutil.copyfile of the golden image for comparison."""
+    start = time.perf_counter()
+    shutil.copyfile(golden, dst)
+    elapsed = time.perf_counter() - start
+    return _stats(1, os.path.getsize(golden), elapsed)
+
+def _stats(count, size, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "images": count,
+        "seconds": elapsed,
+        "mb_per_sec": count * size / (1024 * 1024) / elapsed,
+        "images_per_min": count * 60 / elapsed,
+    }
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics
+
+SYS_DEV_BLOCK = "/sys/dev/block"
+
+# --- Grouping ---
+def _sysfs_device_path(st_dev):
+    """Resolved sysfs path of the block device holding st_dev, or None (not Linux, no sysfs)."""
+    link = os.path.join(SYS_DEV_BLOCK, f"{os.major(st_dev)}:{os.minor(st_dev)}")
+    try:
+        return os.path.realpath(link) if os.path.exists(link) else None
+    except OSError:
+        return None
+
+def device_group(boot_path):
+    """Returns (bus, device) keys for the card behind boot_path.
+
+    device is the whole disk (sdb for /media/.../sdb1); bus is the USB host controller the
+    disk hangs off (every reader on one root hub shares its bandwidth). Disks that aren't on
+    USB (SD slot, SATA, NVMe, image files on the local disk) are their own bus.
+    """
+    try:
+        st_dev = os.stat(boot_path).st_dev
+    except OSError:
+        return ("unknown", boot_path)
+    sys_path = _sysfs_device_path(st_dev)
+    if sys_path is None:
+        key = f"dev-{st_dev}"
+        return (key, key)
+    parts = sys_path.split(os.sep)
+    if "block" in parts:
+        block = parts.index("block")
+        disk = parts[block + 1]  # .../block/sdb/sdb1 -> sdb
+    else:
+        disk = parts[-1]
+    for i, part in enumerate(parts):
+        if part.startswith("usb") and part[3:].isdigit():
+            return (os.sep.join(parts[:i + 1]), disk)
+    return (disk, disk)
+
+# --- Controller ---
+class AimdController:
+    """Concurrency limit for one bus, tuned from the completion rate it achieves.
+
+    Each measurement window (about `limit` completed cards) gives a rate in cards/s:
+      - clearly better than the last window: one more card at a time (additive increase);
+      - clearly worse: cut the limit by `backoff` (multiplicative decrease), the bus is congested;
+      - no real change right after an increase: the bus is saturated, so undo that step and
+        hold; after `probe_after` steady windows, probe one step higher again.
+    """
+
+    def __init__(self, initial=1, maximum=8, tolerance=0.1, backoff=0.5, probe_after=3):
+        self.limit = initial
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.probe_after = probe_after
+        self.last_rate = None
+        self.last_action = None
+        self.steady = 0
+        self.history = [initial]
+
+    def observe(self, rate):
+        """Feeds one window's rate (cards/s); returns the new limit."""
+        previous = self.last_rate
+        self.last_rate = rate
+        if previous is None or rate > previous * (1 + self.tolerance):
+            self._set(self.limit + 1, "increase")
+        elif rate < previous * (1 - self.tolerance):
+            self._set(max(1, min(self.limit - 1, int(self.limit * self.backoff))), "decrease")
+        elif self.last_action == "increase":
+            self._set(self.limit - 1, "revert")
+        else:
+            self.steady += 1
+            if self.steady >= self.probe_after:
+                self._set(self.limit + 1, "increase")
+        return self.limit
+
+    def _set(self, limit, action):
+        self.limit = max(1, min(self.maximum, limit))
+        self.last_action = action
+        self.steady = 0
+        self.history.append(self.limit)
+
+class _Group:
+    def __init__(self, key, controller):
+        self.key = key
+        self.controller = controller
+        self.pending = deque()
+        self.in_flight = 0
+        self.done = 0
+        self.window_done = 0
+        self.window_start = None
+        self.bytes = 0
+        self.busy_s = 0.0
+        self.devices = {}  # device -> [bytes, seconds]
+
+# --- Scheduler ---
+class AdaptiveScheduler:
+    """Runs one job per target with a separate, self-tuning concurrency limit per bus.
+
+    Targets are grouped by group_of(target) -> (bus, device). Each job runs inside a metrics
+    span, so the bytes BootConfigManager writes during it are counted for its device; the
+    completion rate of each bus drives its AimdController.
+    """
+
+    def __init__(self, group_of=device_group, initial=1, max_per_group=8, min_window_s=0.5, **controller_args):
+        self.group_of = group_of
+        self.initial = initial
+        self.max_per_group = max_per_group
+        self.min_window_s = min_window_s
+        self.controller_args = controller_args
+        self.groups = {}
+
+    def run(self, targets, job):
+        """Calls job(target) for every target; returns the results in targets order.
+
+        A job that raises gets {"boot_path": target, "ok": False, "error": ...} as its result.
+        """
+        results = [None] * len(targets)
+        for index, target in enumerate(targets):
+            bus, device = self.group_of(target)
+            group = self.groups.get(bus)
+            if group is None:
+                controller = AimdController(self.initial, self.max_per_group, **self.controller_args)
+                group = self.groups[bus] = _Group(bus, controller)
+            group.pending.append((index, target, device))
+
+        cond = threading.Condition()
+        remaining = [len(targets)]
+        workers = max(1, min(len(targets), self.max_per_group * len(self.groups)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io") as pool:
+            with cond:
+                while remaining[0]:
+                    for group in self.groups.values():
+                        while group.pending and group.in_flight < group.controller.limit:
+                            index, target, device = group.pending.popleft()
+                            group.in_flight += 1
+                            if group.window_start is None:
+                                group.window_start = time.perf_counter()
+                            pool.submit(self._run_one, group, index, target, device, job, results, cond, remaining)
+                    cond.wait()
+        return results
+
+    def _run_one(self, group, index, target, device, job, results, cond, remaining):
+        start = time.perf_counter()
+        # Labelled by bus, not card: one series per card would grow without bound in long-running servers
+        with metrics.span("scheduled_job", group.key) as record:
+            try:
+                result = job(target)
+            except Exception as e:
+                result = {"boot_path": target, "ok": False, "error": str(e)}
+        elapsed = time.perf_counter() - start
+        with cond:
+            results[index] = result
+            group.in_flight -= 1
+            group.done += 1
+            group.window_done += 1
+            group.bytes += record["bytes_written"]
+            group.busy_s += elapsed
+            totals = group.devices.setdefault(device, [0, 0.0])
+            totals[0] += record["bytes_written"]
+            totals[1] += elapsed
+            self._maybe_adjust(group)
+            remaining[0] -= 1
+            cond.notify()
+
+    def _maybe_adjust(self, group):
+        # Called with the condition held
+        now = time.perf_counter()
+        window = now - group.window_start
+        if group.window_done < max(2, group.controller.limit) or window < self.min_window_s:
+            return
+        group.controller.observe(group.window_done / window)
+        group.window_done = 0
+        group.window_start = now
+
+    def report(self):
+        """Per-bus summary: cards done, final limit, limit history and MB/s per device."""
+        out = {}
+        for key, group in self.groups.items():
+            out[key] = {
+                "cards": group.done,
+                "limit": group.controller.limit,
+                "history": list(group.controller.history),
+                "devices": {device: (b / 1e6 / s if s else 0.0) for device, (b, s) in group.devices.items()},
+            }
+        return out
+
+def format_report(report):
+    """Formats AdaptiveScheduler.report() for the terminal."""
+    lines = []
+    for bus, info in sorted(report.items()):
+        history = " -> ".join(str(n) for n in info["history"][-12:])
+        lines.append(f"{bus}: {info['cards']} cards, concurrency {info['limit']} (history {history})")
+        rates = sorted(info["devices"].items())
+        if len(rates) <= 6:
+            lines.extend(f"    {device}: {mb_s:.2f} MB/s per card" for device, mb_s in rates)
+        else:
+            values = [mb_s for _, mb_s in rates]
+            lines.append(f"    {len(values)} devices: {min(values):.2f} / {sum(values) / len(values):.2f} / "
+                         f"{max(values):.2f} MB/s per card (min / avg / max)")
+    return "\n".join(lines)
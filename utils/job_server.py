@@ -0,0 +1,458 @@
+import asyncio
+import bisect
+import ipaddress
+import itertools
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics
+from utils.provision import apply_profile, prepare_profile, verify_written
+
+DEFAULT_PORT = 8787
+
+# Largest request body accepted (a profile with many networks is a few KB)
+MAX_BODY = 1 << 20
+
+# Finished jobs kept for GET /jobs before the oldest are dropped
+HISTORY = 1000
+
+# Events buffered per SSE client; a client that falls further behind misses events
+SUBSCRIBER_BUFFER = 256
+
+TERMINAL = ("done", "failed", "cancelled")
+
+# Host header values accepted: anything else is a DNS-rebinding attempt from a browser
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "[::1]"}
+
+# Where serve() leaves its access token for local clients (cli.py submit reads it from here)
+TOKEN_ENV = "BOOTCFG_JOB_TOKEN"
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+           404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+           415: "Unsupported Media Type", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+def default_token_path():
+    base = os.environ.get("BOOTCFG_STATE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "bootcfg")
+    return os.path.join(base, "job-server.token")
+
+def save_token(token, path=None):
+    """Writes the access token readable by this user only; returns the path."""
+    path = path or default_token_path()
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.replace(tmp_path, path)
+    return path
+
+def load_token(path=None):
+    """The token from $BOOTCFG_JOB_TOKEN or the token file, or None."""
+    if os.environ.get(TOKEN_ENV):
+        return os.environ[TOKEN_ENV]
+    try:
+        with open(path or default_token_path(), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+# --- Jobs ---
+def run_job(job, publish):
+    """Runs one job on a worker thread: hash/prepare, write, read back. Returns the result dict."""
+    publish(job, "preparing")
+    profile = prepare_profile(job["profile"])
+    publish(job, "writing")
+    result = apply_profile(job["boot_path"], profile)
+    if result["ok"] and job.get("verify", True):
+        publish(job, "verifying")
+        check = verify_written(job["boot_path"], result["written"])
+        if not check["ok"]:
+            result["ok"] = False
+            result["error"] = "read-back failed: " + (check["error"] or ", ".join(check["mismatches"]))
+    return result
+
+class JobServer:
+    """Localhost HTTP/JSON provisioning service.
+
+    POST /jobs queues a job ({"boot_path": ..., "profile": {...}}) and answers 202 right away.
+    A fixed number of worker coroutines take jobs off an asyncio.Queue and run them on a
+    thread pool of the same size, so at most `workers` cards are written at once.
+
+        GET  /jobs, /jobs/<id>        job state
+        DELETE /jobs/<id>             cancel a queued job
+        GET  /events, /jobs/<id>/events   progress as server-sent events
+        GET  /metrics                 queue depth, job latency and the BootConfigManager metrics
+        GET  /health
+
+    Listening on loopback isn't enough: any web page in the user's browser can reach it. So
+    every request except /health needs `Authorization: Bearer <token>`, requests carrying an
+    Origin header or a Host other than localhost are refused, and POST bodies must be JSON.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, workers=4, max_queue=1000, runner=run_job, token=None):
+        if host != "localhost" and not ipaddress.ip_address(host).is_loopback:
+            raise ValueError("The job server only listens on localhost")
+        self.token = token or secrets.token_urlsafe(24)
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_queue = max_queue
+        self.runner = runner
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._subscribers = set()
+        self._queue = None
+        self._loop = None
+        self._server = None
+        self._pool = None
+        self._tasks = []
+        self.queued = 0   # jobs waiting (cancelled ones still in the asyncio queue don't count)
+        self.running = 0
+        # Latency histograms (seconds): time waiting in the queue, and time being provisioned
+        self.latency = {name: {"buckets": [0] * len(metrics.BUCKETS), "count": 0, "sum": 0.0}
+                        for name in ("queue_wait", "run")}
+        self.finished = {state: 0 for state in TERMINAL}
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # port 0 picks a free one
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pool.shutdown(wait=True)
+
+    # --- Queue ---
+    def submit(self, payload):
+        """Validates and queues a job; returns its public state. Raises HttpError."""
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        boot_path = payload.get("boot_path")
+        profile = payload.get("profile")
+        if not isinstance(boot_path, str) or not boot_path:
+            raise HttpError(400, "boot_path is required")
+        if not isinstance(profile, dict):
+            raise HttpError(400, "profile must be a JSON object")
+        job = {
+            "id": str(next(self._ids)),
+            "boot_path": boot_path,
+            "profile": profile,
+            "verify": payload.get("verify", True) is not False,
+            "state": "queued",
+            "stage": None,
+            "error": None,
+            "result": None,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+        }
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HttpError(503, f"Queue is full ({self.max_queue} jobs)")
+        self.jobs[job["id"]] = job
+        self.queued += 1
+        self._trim_history()
+        self._publish(job, "queued")
+        return self._public(job)
+
+    def cancel(self, job_id):
+        job = self._get(job_id)
+        if job["state"] != "queued":
+            raise HttpError(409, f"Job {job_id} is {job['state']}")
+        job["state"] = "cancelled"  # the worker skips it when it comes off the queue
+        self.queued -= 1
+        job["finished"] = time.time()
+        self.finished["cancelled"] += 1
+        self._publish(job, "cancelled")
+        return self._public(job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job["state"] == "cancelled":
+                    continue
+                self.queued -= 1
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        job["state"] = "running"
+        job["started"] = time.time()
+        self._observe("queue_wait", job["started"] - job["submitted"])
+        self.running += 1
+        self._publish(job, "started")
+        start = time.perf_counter()
+        try:
+            result = await self._loop.run_in_executor(self._pool, self.runner, job, self._publish_threadsafe)
+            job["result"] = {k: result[k] for k in ("ok", "error", "timings", "total", "plan") if k in result}
+            job["state"] = "done" if result["ok"] else "failed"
+            job["error"] = result.get("error")
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = str(e)
+        finally:
+            self.running -= 1
+            job["finished"] = time.time()
+            self._observe("run", time.perf_counter() - start)
+        self.finished[job["state"]] += 1
+        self._publish(job, job["state"])
+
+    def _trim_history(self):
+        while len(self.jobs) > HISTORY:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest["state"] not in TERMINAL:
+                break  # never forget a job that is still queued or running
+            del self.jobs[oldest_id]
+
+    def _observe(self, name, seconds):
+        series = self.latency[name]
+        index = bisect.bisect_left(metrics.BUCKETS, seconds)
+        if index < len(metrics.BUCKETS):
+            series["buckets"][index] += 1
+        series["count"] += 1
+        series["sum"] += seconds
+
+    # --- Events ---
+    def _publish_threadsafe(self, job, stage):
+        self._loop.call_soon_threadsafe(self._publish, job, stage)
+
+    def _publish(self, job, stage):
+        job["stage"] = stage
+        event = {"id": job["id"], "stage": stage, "state": job["state"], "boot_path": job["boot_path"],
+                 "error": job["error"], "ts": time.time()}
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # slow client: drop rather than let it hold memory
+
+    # --- HTTP ---
+    def _get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, f"No job {job_id}")
+        return job
+
+    @staticmethod
+    def _public(job):
+        state = {k: v for k, v in job.items() if k != "profile"}  # profiles may hold passwords
+        return state
+
+    def metrics_text(self):
+        lines = [
+            "# HELP bootcfg_jobs_queued Jobs waiting for a worker.",
+            "# TYPE bootcfg_jobs_queued gauge",
+            f"bootcfg_jobs_queued {self.queued}",
+            "# HELP bootcfg_jobs_running Jobs being provisioned.",
+            "# TYPE bootcfg_jobs_running gauge",
+            f"bootcfg_jobs_running {self.running}",
+            "# HELP bootcfg_jobs_finished_total Finished jobs by outcome.",
+            "# TYPE bootcfg_jobs_finished_total counter",
+        ]
+        lines += [f'bootcfg_jobs_finished_total{{state="{state}"}} {count}' for state, count in self.finished.items()]
+        for name, series in self.latency.items():
+            metric = f"bootcfg_job_{name}_seconds"
+            lines += [f"# HELP {metric} Job {name.replace('_', ' ')} time.", f"# TYPE {metric} histogram"]
+            cumulative = 0
+            for bound, count in zip(metrics.BUCKETS, series["buckets"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {series["count"]}')
+            lines.append(f"{metric}_sum {series['sum']:.6f}")
+            lines.append(f"{metric}_count {series['count']}")
+        return "\n".join(lines) + "\n" + metrics.format_prometheus()
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            self._check_access(method, path, headers)
+            if method == "GET" and (path == "/events" or (path.startswith("/jobs/") and path.endswith("/events"))):
+                job_id = path[len("/jobs/"):-len("/events")] if path != "/events" else None
+                await self._stream(writer, job_id)
+                return
+            status, payload = self._route(method, path, body)
+        except HttpError as e:
+            status, payload = e.status, {"error": str(e)}
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(payload, str):
+            self._respond(writer, status, payload.encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._respond(writer, status, json.dumps(payload).encode("utf-8"), "application/json")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length")
+        if length < 0:
+            raise HttpError(400, "Malformed Content-Length")
+        if length > MAX_BODY:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0].rstrip("/") or "/", headers, body
+
+    def _check_access(self, method, path, headers):
+        """Refuses browser-originated requests (CSRF, DNS rebinding) and requests without the token."""
+        if "origin" in headers:
+            raise HttpError(403, "Cross-origin requests are not allowed")
+        host = headers.get("host", "")
+        hostname = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+        if hostname.lower() not in LOCAL_HOSTS:
+            raise HttpError(403, f"Host {host!r} is not allowed")
+        if path == "/health":
+            return
+        if not secrets.compare_digest(headers.get("authorization", ""), f"Bearer {self.token}"):
+            raise HttpError(401, "Missing or wrong token")
+        if method == "POST" and headers.get("content-type", "").split(";", 1)[0].strip().lower() != "application/json":
+            raise HttpError(415, "POST bodies must be application/json")
+
+    def _route(self, method, path, body):
+        if path == "/health":
+            return 200, {"ok": True, "queued": self.queued, "running": self.running}
+        if path == "/metrics":
+            return 200, self.metrics_text()
+        if path == "/jobs":
+            if method == "POST":
+                try:
+                    payload = json.loads(body or b"null")
+                except ValueError as e:
+                    raise HttpError(400, f"Invalid JSON: {e}")
+                return 202, self.submit(payload)
+            if method == "GET":
+                return 200, [self._public(job) for job in self.jobs.values()]
+            raise HttpError(405, f"{method} not allowed on /jobs")
+        if path.startswith("/jobs/"):
+            job_id = path[len("/jobs/"):]
+            if method == "GET":
+                return 200, self._public(self._get(job_id))
+            if method == "DELETE":
+                return 200, self.cancel(job_id)
+            raise HttpError(405, f"{method} not allowed on {path}")
+        raise HttpError(404, f"No route for {path}")
+
+    @staticmethod
+    def _respond(writer, status, body, content_type):
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+
+    async def _stream(self, writer, job_id):
+        """Server-sent events: one `data:` line per progress event. A per-job stream ends with the job."""
+        job = self._get(job_id) if job_id else None
+        subscriber = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self._subscribers.add(subscriber)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Connection: close\r\n\r\n")
+            if job is not None:
+                # Late subscribers first get the job's current stage
+                self._write_event(writer, {"id": job["id"], "stage": job["stage"], "state": job["state"],
+                                           "boot_path": job["boot_path"], "error": job["error"], "ts": time.time()})
+                if job["state"] in TERMINAL:
+                    await writer.drain()
+                    return
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")  # lets clients and proxies notice dead connections
+                    await writer.drain()
+                    continue
+                if job_id and event["id"] != job_id:
+                    continue
+                self._write_event(writer, event)
+                await writer.drain()
+                if job_id and event["state"] in TERMINAL:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            writer.close()
+
+    @staticmethod
+    def _write_event(writer, event):
+        writer.write(f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=4, max_queue=1000, on_ready=None, token=None):
+    server = await JobServer(host, port, workers, max_queue, token=token).start()
+    if on_ready:
+        on_ready(server)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
+
+# --- Client ---
+def submit_job(url, boot_path, profile, verify=True, timeout=10, token=None):
+    """POSTs a job and returns its state right away (the job runs on the server)."""
+    import urllib.request
+
+    body = json.dumps({"boot_path": boot_path, "profile": profile, "verify": verify}).encode("utf-8")
+    request = urllib.request.Request(f"{url.rstrip('/')}/jobs", data=body, method="POST",
+                                     headers={"Content-Type": "application/json",
+                                              "Authorization": f"Bearer {token or load_token()}"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def follow_job(url, job_id, timeout=None, token=None):
+    """Yields a job's progress events until it finishes."""
+    import urllib.request
+
+    request = urllib.request.Request(f"{url.rstrip('/')}/jobs/{job_id}/events",
+                                     headers={"Authorization": f"Bearer {token or load_token()}"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for raw in response:
+            line = raw.decode("utf-8").strip()
+            if line.startswith("data:"):
+                event = json.loads(line[len("data:"):])
+                yield event
+                if event["state"] in TERMINAL:
+                    return
@@ -0,0 +1,308 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.crypto import MIN_PARALLEL_BATCH, hash_passwords
+from utils.network_config import static_config
+from utils.provision import SECTION_FILES, apply_profile, prepare_profile, verify_written
+
+# Completed rows between checkpoint writes
+CHECKPOINT_EVERY = 100
+
+# --- Reading ---
+def read_manifest(path):
+    """Yields (row_number, record) from a CSV or JSONL manifest, one row in memory at a time.
+
+    Row numbers count data rows from 1 (the CSV header and blank lines don't count), so they
+    stay the same between runs and can be checkpointed.
+    """
+    jsonl = path.lower().endswith((".jsonl", ".ndjson"))
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if jsonl:
+            row = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                row += 1
+                try:
+                    yield row, json.loads(line)
+                except ValueError as e:
+                    # Keep the numbering; the row is reported as failed instead of stopping the run
+                    yield row, {"_error": f"invalid JSON: {e}"}
+        else:
+            reader = csv.DictReader(f)
+            row = 0
+            for record in reader:
+                if not any((value or "").strip() for value in record.values()):
+                    continue
+                row += 1
+                yield row, {k.strip(): (v or "").strip() for k, v in record.items() if k}
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [part for part in str(value).replace(";", " ").replace(",", " ").split() if part]
+
+class ProfileBuilder:
+    """Turns manifest records into prepared per-device profiles on top of a shared base profile.
+
+    Record fields: boot_path (required), hostname, username, password or password_hash, wifi
+    (a set name, or a wifi section in JSONL), address ("10.0.0.5/24"), gateway, dns, ssh.
+    JSONL rows may also hold whole profile sections (user, network_config, config_txt...).
+
+    The base profile is prepared once. Its "wifi_sets" ({name: wifi section}) let a row pick
+    a Wi-Fi set by name; each set is prepared (priorities, PSKs) the first time it is used and
+    then shared by every row naming it. "defaults" supplies gateway/dns/interface/username
+    for rows that leave them empty.
+    """
+
+    def __init__(self, base=None):
+        base = dict(base or {})
+        self.wifi_sets = base.pop("wifi_sets", {})
+        self.defaults = base.pop("defaults", {})
+        self.base = prepare_profile(base)
+        self._prepared_sets = {}
+        self._lock = threading.Lock()  # rows are built on the worker threads
+
+    def _wifi_set(self, name):
+        with self._lock:
+            prepared = self._prepared_sets.get(name)
+            if prepared is None:
+                if name not in self.wifi_sets:
+                    raise ValueError(f"Unknown Wi-Fi set '{name}'")
+                prepared = self._prepared_sets[name] = prepare_profile({"wifi": self.wifi_sets[name]})["wifi"]
+        return prepared
+
+    def build(self, record):
+        """Returns (boot_path, prepared profile) for one record. Raises ValueError on bad rows."""
+        if "_error" in record:
+            raise ValueError(record["_error"])
+        boot_path = record.get("boot_path")
+        if not boot_path:
+            raise ValueError("Row has no boot_path")
+        profile = dict(self.base)
+        row = {}  # sections that need preparing for this device only
+
+        # JSONL rows may carry whole profile sections; they replace the base's
+        for section in SECTION_FILES:
+            if section not in ("ssh", "wifi") and isinstance(record.get(section), dict):
+                if section == "user":
+                    row["user"] = record["user"]
+                else:
+                    profile[section] = record[section]
+
+        if record.get("ssh") not in (None, ""):
+            profile["ssh"] = _as_bool(record["ssh"])
+        wifi = record.get("wifi")
+        if isinstance(wifi, dict):
+            row["wifi"] = wifi
+        elif wifi:
+            profile["wifi"] = self._wifi_set(wifi)
+
+        if record.get("password") or record.get("password_hash"):
+            username = record.get("username") or self.defaults.get("username")
+            if not username:
+                raise ValueError("Row sets a password but no username")
+            user = dict(row.get("user", {}))
+            user.update({"username": username, "password": record.get("password"),
+                         "password_hash": record.get("password_hash")})
+            row["user"] = user
+
+        if record.get("hostname"):
+            # systemd takes the hostname from the kernel command line on first boot
+            cmdline = dict(profile.get("cmdline_txt", {}))
+            cmdline["systemd.hostname"] = record["hostname"]
+            profile["cmdline_txt"] = cmdline
+
+        if record.get("address"):
+            address = record["address"]
+            if "/" not in address:
+                raise ValueError(f"Address '{address}' needs a prefix length (e.g. /24)")
+            base_model = profile.get("network_config") if isinstance(profile.get("network_config"), dict) else None
+            profile["network_config"] = static_config(
+                address,
+                gateway=record.get("gateway") or self.defaults.get("gateway"),
+                dns=_as_list(record.get("dns") or self.defaults.get("dns", [])),
+                interface=self.defaults.get("interface", "eth0"),
+                base=base_model,
+            )
+
+        if row:
+            profile.update(prepare_profile(row))
+        return boot_path, profile
+
+# --- Checkpoint ---
+class Checkpoint:
+    """Which manifest rows are finished, in constant space.
+
+    Rows finish out of order on the worker pool, so the file keeps a watermark (every row below
+    it is done) plus the few finished rows above it, at most the in-flight window. Failed rows
+    count as finished and are listed separately so a later run can retry just those.
+    """
+
+    def __init__(self, path, manifest_path):
+        self.path = path
+        self.manifest = os.path.abspath(manifest_path)
+        self.next_row = 1
+        self.done = set()
+        self.failed = set()
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, path, manifest_path):
+        checkpoint = cls(path, manifest_path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return checkpoint
+        if data.get("manifest") != checkpoint.manifest:
+            raise ValueError(f"Checkpoint {path} belongs to {data.get('manifest')}, not {checkpoint.manifest}")
+        checkpoint.next_row = data["next_row"]
+        checkpoint.done = set(data["done"])
+        checkpoint.failed = set(data["failed"])
+        return checkpoint
+
+    def is_done(self, row):
+        return row < self.next_row or row in self.done
+
+    def mark(self, row, ok):
+        if ok:
+            self.failed.discard(row)
+        else:
+            self.failed.add(row)
+        if row >= self.next_row:
+            self.done.add(row)
+            while self.next_row in self.done:
+                self.done.remove(self.next_row)
+                self.next_row += 1
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_EVERY:
+            self.save()
+
+    def save(self):
+        """Writes the checkpoint atomically, so a crash mid-write keeps the previous one."""
+        data = {"manifest": self.manifest, "next_row": self.next_row,
+                "done": sorted(self.done), "failed": sorted(self.failed)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+# --- Running ---
+def prehash_passwords(records, executor=None):
+    """Hashes the plain-text passwords of many records with one hash_passwords call.
+
+    Each such record gains a password_hash; the password stays so a card whose hash already
+    matches keeps its userconf.txt. Bad rows are left for build() to report.
+    """
+    pending = [r for r in records if "_error" not in r and isinstance(r.get("password"), str)
+               and r["password"] and not r.get("password_hash")]
+    if pending:
+        for record, password_hash in zip(pending, hash_passwords([r["password"] for r in pending], executor=executor)):
+            record["password_hash"] = password_hash
+
+def provision_record(builder, row, record, golden=None, snapshots=None, verify=True):
+    """Builds and applies one device's profile; returns a small result dict (no file contents)."""
+    result = {"row": row, "boot_path": record.get("boot_path"), "ok": True, "error": None, "total": 0.0}
+    start = time.perf_counter()
+    try:
+        boot_path, profile = builder.build(record)
+        if golden:
+            from utils.image_clone import clone_and_provision
+            applied = clone_and_provision(golden, boot_path, profile)  # a fresh clone has nothing to back up
+        else:
+            applied = apply_profile(boot_path, profile, snapshots=snapshots)
+        if not applied["ok"]:
+            raise RuntimeError(applied["error"])
+        if verify:
+            check = verify_written(boot_path, applied["written"])
+            if not check["ok"]:
+                raise RuntimeError("read-back failed: " + (check["error"] or ", ".join(check["mismatches"])))
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["total"] = time.perf_counter() - start
+    return result
+
+def run_manifest(manifest_path, base=None, checkpoint_path=None, workers=8, window=None, golden=None,
+                 snapshots=None, verify=True, retry_failed=False, on_result=None):
+    """Provisions every device in a manifest, resuming from the checkpoint.
+
+    Rows are read in batches of `window` (4 x workers by default), whose passwords are hashed
+    together on a process pool; at most `window` more rows are in flight. Results are handed to
+    on_result instead of being collected, so memory stays flat however long the manifest is. Returns counts: {"ok", "failed", "skipped", "seconds"}.
+    """
+    checkpoint_path = checkpoint_path or f"{manifest_path}.checkpoint.json"
+    checkpoint = Checkpoint.load(checkpoint_path, manifest_path)
+    builder = ProfileBuilder(base)
+    window = window or workers * 4
+    retry = set(checkpoint.failed) if retry_failed else None
+    counts = {"ok": 0, "failed": 0, "skipped": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    in_flight = set()
+
+    def finish(futures):
+        for future in list(futures):
+            res = future.result()
+            checkpoint.mark(res["row"], res["ok"])
+            counts["ok" if res["ok"] else "failed"] += 1
+            # Handled: an interruption from here on must not count or report this row again
+            in_flight.discard(future)
+            if on_result:
+                on_result(res)
+
+    batch = []
+    hash_pool = None  # one process pool for every batch of passwords, created when first needed
+
+    def submit_batch(executor):
+        nonlocal hash_pool
+        # Hash the batch's passwords across processes: in the worker threads they'd share the GIL
+        records = [record for _, record in batch]
+        if hash_pool is None and sum(1 for r in records if r.get("password")) >= MIN_PARALLEL_BATCH:
+            from concurrent.futures import ProcessPoolExecutor
+            hash_pool = ProcessPoolExecutor()
+        prehash_passwords(records, hash_pool)
+        for row, record in batch:
+            if len(in_flight) >= window:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                finish(finished)
+            in_flight.add(executor.submit(provision_record, builder, row, record, golden, snapshots, verify))
+        batch.clear()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for row, record in read_manifest(manifest_path):
+                if retry is not None:
+                    if row not in retry:
+                        counts["skipped"] += 1
+                        continue
+                elif checkpoint.is_done(row):
+                    counts["skipped"] += 1
+                    continue
+                batch.append((row, record))
+                if len(batch) >= window:
+                    submit_batch(executor)
+            submit_batch(executor)
+            finish(in_flight)
+        finally:
+            # Interrupted (Ctrl+C) or not: rows already finished must survive into the checkpoint
+            for future in in_flight:
+                future.cancel()
+            finish([f for f in in_flight if f.done() and not f.cancelled()])
+            checkpoint.save()
+            if hash_pool is not None:
+                hash_pool.shutdown(cancel_futures=True)
+    counts["seconds"] = time.perf_counter() - start
+    return counts
@@ -0,0 +1,205 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram buckets in seconds (Prometheus "le" bounds)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Set BOOTCFG_TRACE to a file path to append one JSON line per finished span
+TRACE_ENV = "BOOTCFG_TRACE"
+
+# Distinct boot_path labels kept; later paths share OTHER_PATH so a manifest run over tens of
+# thousands of cards doesn't grow one series per card (memory, and Prometheus cardinality)
+MAX_BOOT_PATHS = 256
+OTHER_PATH = "(other)"
+
+_lock = threading.Lock()
+_local = threading.local()
+_series = {}  # {(op, boot_path): {"buckets": [...], "count", "sum", "bytes_read", "bytes_written", "fsync_s", "errors"}}
+_paths = set()
+_trace = {"path": os.environ.get(TRACE_ENV) or None, "file": None}
+
+# --- Spans ---
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+class span:
+    """Times one operation. Counters added while it runs (bytes, fsync time) are attributed to it
+    and to every enclosing span on the same thread.
+
+    A plain class rather than @contextmanager: it wraps every BootConfigManager call, so the
+    per-call overhead matters.
+    """
+    __slots__ = ("record", "start")
+
+    def __init__(self, op, boot_path=None):
+        self.record = {"op": op, "boot_path": boot_path or "", "bytes_read": 0, "bytes_written": 0, "fsync_s": 0.0}
+
+    def __enter__(self):
+        _stack().append(self.record)
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        record = self.record
+        record["duration_s"] = time.perf_counter() - self.start
+        _stack().pop()
+        record["ok"] = exc_type is None
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _record(record)
+        return False
+
+def add(field, amount):
+    """Adds to a counter ("bytes_read", "bytes_written", "fsync_s") of every active span."""
+    for record in _stack():
+        record[field] += amount
+
+@contextmanager
+def timed(field):
+    """Adds the time spent in the with-block to a counter of the active spans (e.g. "fsync_s")."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(field, time.perf_counter() - start)
+
+def traced(fn):
+    """Decorator for BootConfigManager methods: one span per call, labelled with the boot path."""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with span(fn.__name__, self.boot_path):
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+# --- Aggregation ---
+def _record(record):
+    boot_path = record["boot_path"]
+    with _lock:
+        if boot_path not in _paths:
+            if len(_paths) < MAX_BOOT_PATHS:
+                _paths.add(boot_path)
+            else:
+                boot_path = OTHER_PATH
+        key = (record["op"], boot_path)
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0,
+                                     "bytes_read": 0, "bytes_written": 0, "fsync_s": 0.0, "errors": 0}
+        duration = record["duration_s"]
+        index = bisect.bisect_left(BUCKETS, duration)
+        if index < len(BUCKETS):
+            series["buckets"][index] += 1  # above the last bound only counts towards +Inf
+        series["count"] += 1
+        series["sum"] += duration
+        series["bytes_read"] += record["bytes_read"]
+        series["bytes_written"] += record["bytes_written"]
+        series["fsync_s"] += record["fsync_s"]
+        if not record["ok"]:
+            series["errors"] += 1
+        if _trace["path"]:
+            _write_trace(record)
+
+def _write_trace(record):
+    # Called with _lock held
+    if _trace["file"] is None:
+        _trace["file"] = open(_trace["path"], "a", encoding="utf-8", buffering=1)
+    line = dict(record, ts=time.time(), thread=threading.current_thread().name)
+    _trace["file"].write(json.dumps(line) + "\n")
+
+def set_trace_file(path):
+    """Appends every finished span to path as JSON lines (None stops tracing)."""
+    with _lock:
+        if _trace["file"] is not None:
+            _trace["file"].close()
+        _trace["path"] = path
+        _trace["file"] = None
+
+def snapshot():
+    """Returns a copy of the aggregated series: {(op, boot_path): {...}}."""
+    with _lock:
+        return {key: dict(series, buckets=list(series["buckets"])) for key, series in _series.items()}
+
+def reset():
+    with _lock:
+        _series.clear()
+        _paths.clear()
+
+# --- Export ---
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_prometheus():
+    """Renders the aggregated series in the Prometheus text exposition format."""
+    lines = [
+        "# HELP bootcfg_op_duration_seconds Latency of boot file operations.",
+        "# TYPE bootcfg_op_duration_seconds histogram",
+    ]
+    counters = [
+        ("bytes_read", "bootcfg_op_bytes_read_total", "Bytes read from the card.", "counter"),
+        ("bytes_written", "bootcfg_op_bytes_written_total", "Bytes written to the card.", "counter"),
+        ("fsync_s", "bootcfg_op_fsync_seconds_total", "Time spent in fsync.", "counter"),
+        ("errors", "bootcfg_op_errors_total", "Operations that raised.", "counter"),
+    ]
+    data = sorted(snapshot().items())
+    for (op, boot_path), series in data:
+        labels = f'op="{_label(op)}",boot_path="{_label(boot_path)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, series["buckets"]):
+            cumulative += count
+            lines.append(f'bootcfg_op_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'bootcfg_op_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+        lines.append(f"bootcfg_op_duration_seconds_sum{{{labels}}} {series['sum']:.9f}")
+        lines.append(f"bootcfg_op_duration_seconds_count{{{labels}}} {series['count']}")
+    for field, name, help_text, kind in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (op, boot_path), series in data:
+            lines.append(f'{name}{{op="{_label(op)}",boot_path="{_label(boot_path)}"}} {series[field]}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """Writes the metrics file atomically, so a node_exporter textfile collector never reads half of it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(format_prometheus())
+    os.replace(tmp_path, path)
+
+def format_summary():
+    """Per-operation table (all boot paths combined) for printing at the end of a run."""
+    ops = {}
+    for (op, _), series in snapshot().items():
+        total = ops.setdefault(op, {"count": 0, "sum": 0.0, "bytes_read": 0, "bytes_written": 0, "fsync_s": 0.0})
+        for field in total:
+            total[field] += series[field]
+    lines = [f"{'Operation':<28} {'Calls':>6} {'Avg ms':>8} {'Read KB':>8} {'Written KB':>10} {'fsync ms':>9}"]
+    for op, t in sorted(ops.items(), key=lambda item: item[1]["sum"], reverse=True):
+        lines.append(f"{op:<28} {t['count']:>6} {t['sum'] / t['count'] * 1000:>8.2f} "
+                     f"{t['bytes_read'] / 1024:>8.1f} {t['bytes_written'] / 1024:>10.1f} {t['fsync_s'] * 1000:>9.1f}")
+    return "\n".join(lines)
+
+# --- Profiling ---
+@contextmanager
+def profiled(path=None, top=25):
+    """Runs the with-block under cProfile; saves the stats to path (if given) and prints the top entries."""
+    import cProfile
+    import pstats
+    import sys
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(top)
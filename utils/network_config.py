@@ -0,0 +1,177 @@
+import copy
+import ipaddress
+import yaml
+
+# LibYAML bindings when PyYAML was built with them, pure Python otherwise
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Largest pool the allocator will index (one flag byte per address)
+MAX_POOL_SIZE = 1 << 22
+
+# Placeholder rendered once into the template, then swapped for each device's address
+_ADDRESS_SLOT = "__BOOTCFG_ADDRESS__"
+
+# --- Model ---
+def parse_network_config(text):
+    """Parses network-config YAML into a dict (empty for a blank file). Raises ValueError on bad YAML."""
+    try:
+        model = yaml.load(text, Loader=SafeLoader) if text.strip() else {}
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid network-config YAML: {e}") from e
+    if model is None:
+        return {}
+    if not isinstance(model, dict):
+        raise ValueError("network-config must be a YAML mapping")
+    return model
+
+def dump_network_config(model):
+    """Serializes a network-config dict back to YAML, keeping key order."""
+    return yaml.dump(model, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+
+def static_config(address, gateway=None, dns=(), interface="eth0", search=(), base=None):
+    """Returns a netplan v2 model giving interface the static address ("10.0.0.5/24").
+
+    base is an existing model to extend (other interfaces and Wi-Fi sections are kept).
+    """
+    model = copy.deepcopy(base) if base else {}
+    model.setdefault("version", 2)
+    iface = model.setdefault("ethernets", {}).setdefault(interface, {})
+    iface["dhcp4"] = False
+    iface["addresses"] = [address]
+    if gateway:
+        iface["routes"] = [{"to": "default", "via": str(gateway)}]
+    if dns or search:
+        nameservers = {}
+        if dns:
+            nameservers["addresses"] = [str(d) for d in dns]
+        if search:
+            nameservers["search"] = list(search)
+        iface["nameservers"] = nameservers
+    return model
+
+def render_fleet(leases, gateway=None, dns=(), interface="eth0", search=(), base=None):
+    """Renders one network-config per device from {device: "addr/prefix"}.
+
+    The YAML is dumped once with a placeholder address and then specialised per device, so
+    rendering hundreds of configs costs one dump plus a string replace each.
+    """
+    template = dump_network_config(static_config(_ADDRESS_SLOT, gateway, dns, interface, search, base))
+    return {device: template.replace(_ADDRESS_SLOT, address) for device, address in leases.items()}
+
+# --- Address Pool ---
+def _parse_exclusions(network, exclude):
+    """Yields pool offsets for exclusions given as addresses, CIDRs or "first-last" ranges."""
+    base = int(network.network_address)
+    for item in exclude:
+        item = str(item).strip()
+        if "-" in item:
+            first, last = (int(ipaddress.ip_address(part.strip())) for part in item.split("-", 1))
+        elif "/" in item:
+            sub = ipaddress.ip_network(item, strict=False)
+            first, last = int(sub.network_address), int(sub.broadcast_address)
+        else:
+            first = last = int(ipaddress.ip_address(item))
+        for value in range(max(first, base), min(last, base + network.num_addresses - 1) + 1):
+            yield value - base
+
+class IPPool:
+    """Static address allocator for one subnet.
+
+    Every address has a flag in a bytearray indexed by its offset in the subnet. Released
+    addresses go onto a free-list that is reused first; otherwise a cursor hands out the next
+    never-used address. Allocate and release are O(1) amortised however large the pool is.
+    Leases are remembered per device name, so allocating the same device twice is idempotent.
+    """
+
+    def __init__(self, subnet, gateway=None, exclude=()):
+        self.network = ipaddress.ip_network(subnet, strict=False)
+        size = self.network.num_addresses
+        if size > MAX_POOL_SIZE:
+            raise ValueError(f"Subnet {self.network} is too large for an address pool")
+        self.prefix = self.network.prefixlen
+        self._base = int(self.network.network_address)
+        self._used = bytearray(size)
+        self._free = []      # released offsets, reused LIFO
+        self._cursor = 0     # every offset below this has been handed out or reserved at least once
+        self._reserved = 0
+        self.leases = {}     # device -> offset
+        self._owners = {}    # offset -> device
+
+        # Network and broadcast addresses can't be assigned (except on /31 and /32 point-to-point links)
+        if self.network.version == 4 and size > 2:
+            self._reserve_offset(0)
+            self._reserve_offset(size - 1)
+        self.gateway = ipaddress.ip_address(gateway) if gateway else None
+        if self.gateway:
+            self.reserve(self.gateway)
+        for offset in _parse_exclusions(self.network, exclude):
+            self._reserve_offset(offset)
+
+    def _offset(self, address):
+        offset = int(ipaddress.ip_address(address)) - self._base
+        if not 0 <= offset < len(self._used):
+            raise ValueError(f"{address} is outside {self.network}")
+        return offset
+
+    def _address(self, offset):
+        return str(ipaddress.ip_address(self._base + offset))
+
+    def _reserve_offset(self, offset):
+        if not self._used[offset]:
+            self._used[offset] = 1
+            self._reserved += 1
+
+    def reserve(self, address):
+        """Marks an address as taken without leasing it (e.g. a printer or an existing host)."""
+        self._reserve_offset(self._offset(address))
+
+    def _take(self):
+        while self._free:
+            offset = self._free.pop()
+            if not self._used[offset]:  # may have been reserved since it was released
+                return offset
+        used = self._used
+        size = len(used)
+        while self._cursor < size and used[self._cursor]:
+            self._cursor += 1
+        if self._cursor >= size:
+            raise ValueError(f"Address pool {self.network} is exhausted")
+        offset = self._cursor
+        self._cursor += 1
+        return offset
+
+    def allocate(self, device):
+        """Returns the device's address ("10.0.0.5"), leasing a free one if it has none yet."""
+        if device in self.leases:
+            return self._address(self.leases[device])
+        offset = self._take()
+        self._used[offset] = 1
+        self.leases[device] = offset
+        self._owners[offset] = device
+        return self._address(offset)
+
+    def allocate_many(self, devices):
+        """Leases an address for every device and returns {device: "addr/prefix"} in input order."""
+        return {device: f"{self.allocate(device)}/{self.prefix}" for device in devices}
+
+    def release(self, device):
+        """Frees the device's lease so the address can be handed out again."""
+        offset = self.leases.pop(device, None)
+        if offset is None:
+            return
+        del self._owners[offset]
+        self._used[offset] = 0
+        self._free.append(offset)
+
+    def owner(self, address):
+        return self._owners.get(self._offset(address))
+
+    def stats(self):
+        leased = len(self.leases)
+        return {
+            "size": len(self._used),
+            "leased": leased,
+            "reserved": self._reserved,
+            "free": len(self._used) - leased - self._reserved,
+        }
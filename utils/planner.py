@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.file_ops import BootConfigManager
+from utils.provision import SECTION_FILES, prepare_profile, stage_profile
+
+# Where the fingerprints of provisioned files are kept between runs
+STATE_ENV = "BOOTCFG_STATE_DIR"
+
+def default_state_path():
+    base = os.environ.get(STATE_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "bootcfg")
+    return os.path.join(base, "fingerprints.json")
+
+def section_digest(value):
+    """sha256 of a profile section, so a stored fingerprint is only trusted for the same desired state."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+# --- Fingerprint Store ---
+class StateStore:
+    """Remembers, per boot file, the stat stamp it had right after it was checked or written
+    and the digest of the profile section that produced it.
+
+    When both still match, the file provably holds what the profile wants and is skipped
+    without being opened. A stamp includes the inode and mtime in nanoseconds; only an
+    in-place edit that keeps the size and lands within the filesystem's mtime granularity
+    (2 s on FAT) could slip past it, which is why `check --no-state` re-reads everything.
+
+    The user section is never fast-pathed: its desired state holds a password, and a digest
+    of it would be a password hash kept in plain sight.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_state_path()
+        self._lock = threading.Lock()
+        self.hits = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def _entry_key(mgr, file_key):
+        # Stamps of image files are the image's own stamp, so include the file name
+        return f"{os.path.abspath(mgr.boot_path)}::{mgr.files[file_key]}"
+
+    def filter_unchanged(self, mgr, profile):
+        """Splits a prepared profile into (sections still to check, {file: "unchanged"} proven by stat)."""
+        pending = {}
+        plan = {}
+        for section, value in profile.items():
+            file_key = SECTION_FILES.get(section)
+            if file_key is None or section == "user":
+                pending[section] = value
+                continue
+            with self._lock:
+                entry = self.entries.get(self._entry_key(mgr, file_key))
+            if entry and entry["digest"] == section_digest(value) and entry["stamp"] == list(mgr.file_stamp(file_key)):
+                plan[file_key] = "unchanged"
+                with self._lock:
+                    self.hits += 1
+            else:
+                pending[section] = value
+        return pending, plan
+
+    def record(self, mgr, profile):
+        """Stores the current stamp of every file the (now applied) profile sections control."""
+        updates = {}
+        for section, value in profile.items():
+            file_key = SECTION_FILES.get(section)
+            if file_key is None or section == "user":
+                continue
+            updates[self._entry_key(mgr, file_key)] = {"stamp": list(mgr.file_stamp(file_key)),
+                                                       "digest": section_digest(value)}
+        with self._lock:
+            self.entries.update(updates)
+
+    def forget(self, mgr, sections):
+        with self._lock:
+            for section in sections:
+                file_key = SECTION_FILES.get(section)
+                if file_key is not None:
+                    self.entries.pop(self._entry_key(mgr, file_key), None)
+
+    def save(self):
+        """Writes the store atomically (temp file + os.replace)."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.entries)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+# --- Planning ---
+def plan_card(boot_path, profile, state=None):
+    """Returns what applying a prepared profile would do to one card, without writing anything.
+
+    result["plan"] is {file: "create" / "modify" / "delete" / "unchanged"}. Files the state
+    store vouches for are not read; the rest are staged in a dry-run transaction and compared
+    by size first and content hash second.
+    """
+    result = {"boot_path": boot_path, "ok": True, "error": None, "plan": {}}
+    try:
+        if not os.path.exists(boot_path):
+            raise FileNotFoundError(f"Boot folder or image not found: {boot_path}")
+        mgr = BootConfigManager(boot_path)
+        pending = profile
+        if state is not None:
+            pending, result["plan"] = state.filter_unchanged(mgr, profile)
+        with mgr.transaction(dry_run=True):
+            stage_profile(mgr, pending)
+        # Sections that staged nothing (config.txt edits already present, matching password) are unchanged
+        plan = {SECTION_FILES[s]: "unchanged" for s in pending if s in SECTION_FILES}
+        plan.update(mgr.last_plan)
+        result["plan"].update(plan)
+        if state is not None:
+            matching = {s: v for s, v in pending.items() if plan.get(SECTION_FILES.get(s)) == "unchanged"}
+            state.record(mgr, matching)
+            state.forget(mgr, [s for s in pending if s not in matching])
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    return result
+
+def has_drift(result):
+    return not result["ok"] or any(action != "unchanged" for action in result["plan"].values())
+
+def check_drift(boot_paths, profile, workers=None, state=None):
+    """Plans a profile against many cards in parallel; results come back in boot_paths order."""
+    prepared = prepare_profile(profile)
+    if not boot_paths:
+        return []
+    workers = workers or min(32, len(boot_paths))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(plan_card, path, prepared, state) for path in boot_paths]
+        return [f.result() for f in futures]
+
+def format_plan(results):
+    """One line per card, then one indented line per file that would change."""
+    lines = []
+    for res in results:
+        if not res["ok"]:
+            lines.append(f"{res['boot_path']}: FAILED: {res['error']}")
+            continue
+        changes = {k: v for k, v in res["plan"].items() if v != "unchanged"}
+        lines.append(f"{res['boot_path']}: {'in sync' if not changes else f'{len(changes)} file(s) differ'}")
+        for key, action in sorted(changes.items()):
+            lines.append(f"    {action:<9} {key}")
+    drifted = sum(1 for r in results if has_drift(r))
+    lines.append(f"\n{drifted}/{len(results)} cards differ from the profile.")
+    return "\n".join(lines)
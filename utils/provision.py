@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.file_ops import BootConfigManager
+from utils.boot_txt import edits_key, render_config_txt, render_cmdline_txt
+from utils.crypto import verify_password
+
+# Order in which profile sections are applied (and shown in the result table)
+STEPS = [
+    ("ssh", "SSH"),
+    ("wifi", "Wi-Fi"),
+    ("user", "User"),
+    ("network_config", "Net Config"),
+    ("config_txt", "config.txt"),
+    ("cmdline_txt", "cmdline.txt"),
+]
+
+# Boot file (BootConfigManager.files key) written by each profile section
+SECTION_FILES = {
+    "ssh": "ssh",
+    "wifi": "wpa_supplicant",
+    "user": "userconf",
+    "network_config": "network_config",
+    "config_txt": "config_txt",
+    "cmdline_txt": "cmdline_txt",
+}
+
+# Result table columns: the steps above plus the time spent writing staged files to the card
+COLUMNS = STEPS + [("commit", "Commit")]
+
+def load_profile(path):
+    """Loads a provisioning profile from a JSON file.
+
+    A profile may contain any of these sections; missing sections are left untouched on the card:
+        "ssh": true / false
+        "wifi": {"country": "US", "networks": [{"ssid": "...", "psk": "..."}], "precompute_psk": false, ...}
+        "user": {"username": "pi", "password": "...", "rounds": 5000} or {"username": "pi", "password_hash": "..."}
+        "network_config": "<network-config YAML text>" or a netplan v2 dict
+        "config_txt": {"all": {"enable_uart": 1, "dtoverlay": "disable-bt"}, "pi4": {"arm_boost": 1}}
+        "cmdline_txt": {"quiet": null, "cfg80211.ieee80211_regdom": "US"}
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def prepare_profile(profile):
+    """Returns a copy of the profile with per-run work (password hashing, priorities) done once."""
+    prepared = dict(profile)
+
+    user = profile.get("user")
+    if user is not None:
+        user = dict(user)
+        if not user.get("username"):
+            raise ValueError("Profile 'user' section needs a username")
+        if not user.get("password_hash"):
+            if not user.get("password"):
+                raise ValueError("Profile 'user' section needs a password or password_hash")
+            from utils.crypto import generate_password_hash
+            user["password_hash"] = generate_password_hash(user["password"], rounds=user.get("rounds"))
+        # The password stays so a card whose hash already matches it can be left untouched
+        prepared["user"] = user
+
+    wifi = profile.get("wifi")
+    if wifi is not None:
+        wifi = dict(wifi)
+        # Same rule as the Wi-Fi dialog: top of the list = highest priority
+        base_priority = 100
+        networks = []
+        for i, net in enumerate(wifi.get("networks", [])):
+            net = dict(net)
+            net.setdefault("priority", str(base_priority - i))
+            networks.append(net)
+        if wifi.pop("precompute_psk", False):
+            # Derive every PSK once here instead of on each card (or each Pi at first boot)
+            from utils.crypto import precompute_psks
+            with_psk = [net for net in networks if net.get("psk")]
+            for net, psk in zip(with_psk, precompute_psks([(n["ssid"], n["psk"]) for n in with_psk])):
+                net["psk"] = psk
+        wifi["networks"] = networks
+        prepared["wifi"] = wifi
+
+    return prepared
+
+def stage_profile(mgr, profile, timings=None):
+    """Stages the writes for every section of a prepared profile (call inside mgr.transaction())."""
+    for key, _ in STEPS:
+        if key not in profile:
+            continue
+        step_start = time.perf_counter()
+        value = profile[key]
+        if key == "ssh":
+            if value:
+                mgr.create_ssh()
+            else:
+                mgr.remove_ssh()
+        elif key == "wifi":
+            config = {k: v for k, v in value.items() if k != "networks"}
+            mgr.write_wpa_supplicant(config, value.get("networks", []))
+        elif key == "user":
+            username, password_hash = mgr.parse_userconf()
+            # A fresh salt would change the file on every run; keep a hash that already matches
+            if not (username == value["username"] and value.get("password")
+                    and verify_password(value["password"], password_hash)):
+                mgr.write_userconf(value["username"], value["password_hash"])
+        elif key == "network_config":
+            if isinstance(value, dict):
+                mgr.write_network_config_model(value)
+            else:
+                mgr.write_network_config(value)
+        elif key == "config_txt":
+            mgr.update_config_txt(value)
+        elif key == "cmdline_txt":
+            mgr.update_cmdline_txt(value)
+        if timings is not None:
+            timings[key] = time.perf_counter() - step_start
+
+def apply_profile(boot_path, profile, state=None, snapshots=None):
+    """Applies a prepared profile to one boot folder and returns a result dict with per-step timings.
+
+    Files that already hold the desired content are not rewritten; result["plan"] says what
+    happened to each file. With a planner.StateStore, sections it proves unchanged are skipped.
+    With a snapshots.SnapshotStore, the files are backed up before they are overwritten and
+    result["snapshot"] is the id to roll back to.
+    """
+    result = {"boot_path": boot_path, "ok": True, "error": None, "timings": {}, "total": 0.0, "plan": {},
+              "snapshot": None, "written": {}}
+    start = time.perf_counter()
+    try:
+        if not os.path.exists(boot_path):
+            raise FileNotFoundError(f"Boot folder or image not found: {boot_path}")
+        mgr = BootConfigManager(boot_path)
+        mgr.snapshots = snapshots
+        pending = profile
+        if state is not None:
+            pending, result["plan"] = state.filter_unchanged(mgr, profile)
+
+        # Stage every file, then write them all with one coalesced commit
+        with mgr.transaction():
+            stage_profile(mgr, pending, result["timings"])
+            commit_start = time.perf_counter()
+        result["timings"]["commit"] = time.perf_counter() - commit_start
+        result["plan"].update(mgr.last_plan)
+        result["snapshot"] = mgr.last_snapshot
+        result["written"] = mgr.last_written
+        if state is not None:
+            state.record(mgr, pending)
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = str(e)
+    result["total"] = time.perf_counter() - start
+    return result
+
+def verify_written(boot_path, written, direct=False):
+    """Re-reads every file a commit wrote straight from the card and compares checksums.
+
+    written is apply_profile's result["written"]. Returns {"boot_path", "ok", "mismatches",
+    "bytes", "seconds", "bypassed", "error"}; bypassed is False if the page cache couldn't be skipped.
+    """
+    result = {"boot_path": boot_path, "ok": True, "mismatches": [], "bytes": 0, "seconds": 0.0,
+              "bypassed": True, "error": None}
+    start = time.perf_counter()
+    try:
+        mgr = BootConfigManager(boot_path)
+        for key, expected in written.items():
+            data, bypassed = mgr.read_back(key, direct)
+            result["bypassed"] = result["bypassed"] and bypassed
+            if data is not None:
+                result["bytes"] += len(data)
+            if expected is None:
+                ok = data is None
+            else:
+                ok = data is not None and hashlib.sha256(data).hexdigest() == expected["sha256"]
+            if not ok:
+                result["mismatches"].append(key)
+    except Exception as e:
+        result["error"] = str(e)
+    result["ok"] = result["error"] is None and not result["mismatches"]
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def verify_batch(results, workers=None, direct=False, use_processes=False):
+    """Read-back verifies every successful apply result in parallel; same order as results."""
+    todo = [r for r in results if r["ok"]]
+    if not todo:
+        return []
+    workers = workers or min(32, len(todo))
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_cls(max_workers=workers) as executor:
+        futures = [executor.submit(verify_written, r["boot_path"], r["written"], direct) for r in todo]
+        return [f.result() for f in futures]
+
+def throughput(results, verifications, write_wall, verify_wall):
+    """Aggregate MB/s of the write phase and of the read-back phase, each over its own wall time."""
+    written = sum(entry["size"] for r in results for entry in r.get("written", {}).values() if entry)
+    verified = sum(v["bytes"] for v in verifications)
+    return {
+        "write_bytes": written, "write_s": write_wall,
+        "write_mb_s": written / 1e6 / write_wall if write_wall else 0.0,
+        "verify_bytes": verified, "verify_s": verify_wall,
+        "verify_mb_s": verified / 1e6 / verify_wall if verify_wall else 0.0,
+    }
+
+def verify_profile(boot_path, profile):
+    """Re-reads a provisioned card and returns a list of mismatches against a prepared profile."""
+    mgr = BootConfigManager(boot_path)
+    problems = []
+    if "ssh" in profile and mgr.check_files_status().get("ssh", False) != bool(profile["ssh"]):
+        problems.append("ssh")
+    if "wifi" in profile:
+        _, networks = mgr.parse_wpa_supplicant()
+        expected = [net["ssid"] for net in profile["wifi"].get("networks", [])]
+        if [net.get("ssid") for net in networks] != expected:
+            problems.append("wpa_supplicant")
+    if "user" in profile:
+        user = profile["user"]
+        username, password_hash = mgr.parse_userconf()
+        matches = password_hash == user["password_hash"] or (user.get("password") and verify_password(user["password"], password_hash))
+        if username != user["username"] or not matches:
+            problems.append("userconf")
+    if "network_config" in profile:
+        expected = profile["network_config"]
+        actual = mgr.parse_network_config() if isinstance(expected, dict) else mgr.read_network_config()
+        if actual != expected:
+            problems.append("network_config")
+    # Re-applying the edits to what is on the card must be a no-op
+    if "config_txt" in profile:
+        if render_config_txt(mgr.load_config_txt().serialize(), edits_key(profile["config_txt"])) is not None:
+            problems.append("config_txt")
+    if "cmdline_txt" in profile:
+        if render_cmdline_txt(mgr.load_cmdline_txt().serialize(), edits_key(profile["cmdline_txt"])) is not None:
+            problems.append("cmdline_txt")
+    return problems
+
+def batch_provision(boot_paths, profile, workers=None, use_processes=False, state=None, snapshots=None,
+                    scheduler=None):
+    """Applies one profile to many boot folders in parallel.
+
+    Results are returned in the same order as boot_paths. Threads are the default since the
+    work is almost entirely file I/O; use_processes=True switches to a process pool. A
+    planner.StateStore (threads only) lets cards that were already provisioned skip their reads.
+    An io_scheduler.AdaptiveScheduler replaces the fixed pool with a self-tuning limit per USB bus.
+    """
+    if use_processes and (state is not None or scheduler is not None):
+        raise ValueError("A state store or I/O scheduler can only be used with worker threads")
+    prepared = prepare_profile(profile)
+    if not boot_paths:
+        return []
+    if scheduler is not None:
+        return scheduler.run(list(boot_paths), lambda path: apply_profile(path, prepared, state, snapshots))
+    workers = workers or min(32, len(boot_paths))
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_cls(max_workers=workers) as executor:
+        futures = [executor.submit(apply_profile, path, prepared, state, snapshots) for path in boot_paths]
+        return [f.result() for f in futures]
+
+def format_results(results):
+    """Formats batch results as a plain-text table (times in milliseconds)."""
+    headers = ["Boot Path"] + [name for _, name in COLUMNS] + ["Total", "Status"]
+    rows = []
+    for res in results:
+        row = [res["boot_path"]]
+        for key, _ in COLUMNS:
+            t = res["timings"].get(key)
+            row.append(f"{t * 1000:.1f}" if t is not None else "-")
+        row.append(f"{res['total'] * 1000:.1f}")
+        row.append("OK" if res["ok"] else f"FAILED: {res['error']}")
+        rows.append(row)
+
+    widths = [len(h) for h in headers]
+    for row in rows:
+        for i, cell in enumerate(row[:-1]):
+            widths[i] = max(widths[i], len(cell))
+
+    def fmt(row):
+        cells = [cell.ljust(widths[i]) for i, cell in enumerate(row[:-1])]
+        return "  ".join(cells + [row[-1]])
+
+    lines = [fmt(headers), "  ".join("-" * w for w in widths)]
+    lines.extend(fmt(row) for row in rows)
+    ok = sum(1 for r in results if r["ok"])
+    lines.append(f"\n{ok}/{len(results)} cards provisioned successfully.")
+    return "\n".join(lines)
@@ -0,0 +1,62 @@
+import mmap
+import os
+
+# Reads through O_DIRECT go in page-aligned chunks of this size
+DIRECT_CHUNK = 1 << 20
+
+def can_bypass_cache():
+    """True where the kernel can be told to drop a file's cached pages (Linux and most BSDs)."""
+    return hasattr(os, "posix_fadvise")
+
+def drop_cached_pages(path):
+    """Evicts a file's clean pages from the page cache, so the next read comes from the device.
+
+    Only pages already written back are dropped, which is all of them after the commit's fsync.
+    Returns False where posix_fadvise isn't available (Windows, macOS): the read is then cached.
+    """
+    if not can_bypass_cache():
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+def read_direct(path):
+    """Reads a whole file with O_DIRECT, never touching the page cache.
+
+    O_DIRECT needs aligned buffers, so the data lands in an anonymous mmap (page aligned) and
+    is read in whole chunks; the short last read marks the end of the file. Raises OSError
+    where the filesystem refuses O_DIRECT (e.g. tmpfs) so callers can fall back.
+    """
+    flags = os.O_RDONLY | getattr(os, "O_DIRECT", 0)
+    if flags == os.O_RDONLY:
+        raise OSError("O_DIRECT is not supported on this platform")
+    fd = os.open(path, flags)
+    buf = mmap.mmap(-1, DIRECT_CHUNK)
+    try:
+        parts = []
+        while True:
+            n = os.readv(fd, [buf])
+            parts.append(buf[:n])
+            if n < DIRECT_CHUNK:
+                break
+        return b"".join(parts)
+    finally:
+        buf.close()
+        os.close(fd)
+
+def read_uncached(path, direct=False):
+    """Returns (data, bypassed): the file read from the device if the platform allows it.
+
+    bypassed is False when the data may have come from the page cache.
+    """
+    if direct:
+        try:
+            return read_direct(path), True
+        except OSError:
+            pass  # fall back to dropping the pages
+    bypassed = drop_cached_pages(path)
+    with open(path, "rb") as f:
+        return f.read(), bypassed
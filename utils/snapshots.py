@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import secrets
+import time
+import zlib
+
+# Snapshots live next to the planner's fingerprints unless a folder is given
+STATE_ENV = "BOOTCFG_STATE_DIR"
+
+# Blobs younger than this are never collected: a commit may have written them but not its manifest yet
+GC_GRACE_SECONDS = 3600
+
+def default_store_path():
+    base = os.environ.get(STATE_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "bootcfg")
+    return os.path.join(base, "snapshots")
+
+# --- Card identity ---
+def _linux_volume(st_dev):
+    """(serial, label) of the mounted block device st_dev, from udev's /dev/disk symlinks."""
+    found = {}
+    for kind in ("uuid", "label"):
+        folder = f"/dev/disk/by-{kind}"
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            continue
+        for name in names:
+            try:
+                if os.stat(os.path.join(folder, name)).st_rdev == st_dev:
+                    # udev escapes spaces and slashes in labels as \x20 etc.
+                    found[kind] = name.encode("ascii", "backslashreplace").decode("unicode_escape")
+                    break
+            except OSError:
+                continue
+    return found.get("uuid"), found.get("label")
+
+def _windows_volume(path):
+    import ctypes
+    drive = os.path.splitdrive(os.path.abspath(path))[0]
+    if not drive or drive.startswith("\\\\"):
+        return None, None
+    label = ctypes.create_unicode_buffer(261)
+    serial = ctypes.c_uint32()
+    if not ctypes.windll.kernel32.GetVolumeInformationW(drive + "\\", label, 261, ctypes.byref(serial), None, None, None, 0):
+        return None, None
+    return f"{serial.value >> 16:04X}-{serial.value & 0xFFFF:04X}", label.value
+
+def card_identity(boot_path):
+    """The FAT volume serial and label of the card behind boot_path, e.g. "1A2B-3C4D/bootfs", or None.
+
+    Cards mounted one after another at the same place (/media/boot, E:) get different ids.
+    None when the volume can't be identified (not FAT, or macOS), and the path is used instead.
+    """
+    try:
+        if os.path.isfile(boot_path):
+            from utils.fat_image import open_image
+            with open_image(boot_path) as volume:
+                serial, label = volume.volume_serial(), volume.volume_label()
+        elif os.name == "nt":
+            serial, label = _windows_volume(boot_path)
+        elif os.path.isdir("/dev/disk"):
+            serial, label = _linux_volume(os.stat(boot_path).st_dev)
+        else:
+            return None
+    except Exception:
+        return None
+    return f"{serial}/{label or ''}" if serial else None
+
+def card_id(boot_path):
+    """Stable folder name for a card's manifests: its volume identity, or its absolute path."""
+    identity = card_identity(boot_path)
+    key = f"volume:{identity}" if identity else os.path.abspath(boot_path)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+# Snapshots hold Wi-Fi passphrases and password hashes: owner-only folders and files
+def _makedirs(path):
+    if os.path.isdir(path):
+        return
+    parent = os.path.dirname(path)
+    if parent and parent != path:
+        _makedirs(parent)
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class SnapshotStore:
+    """Content-addressed store of boot files as they were before a commit overwrote them.
+
+    Layout under root:
+        objects/ab/abcdef....z           zlib-compressed file content, named by its sha256
+        manifests/<card id>/<id>.json    one per commit: {file key: {"sha256", "size"} or None if absent}
+
+    A blob is written once however many cards hold the same file, so a fleet cloned from one
+    image costs one copy of each file plus a small manifest per card. Attach a store to a
+    BootConfigManager (mgr.snapshots = store) and every commit is backed up first.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or default_store_path()
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+
+    # --- Blobs ---
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.z")
+
+    def put_blob(self, data):
+        """Stores data (once) and returns its sha256."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        try:
+            # Already stored: refresh its mtime so a concurrent gc's grace period covers the reuse
+            os.utime(path)
+        except FileNotFoundError:
+            _makedirs(os.path.dirname(path))
+            _write_atomic(path, zlib.compress(data, 6))
+        return digest
+
+    def get_blob(self, digest):
+        with open(self._blob_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Snapshot blob {digest} is corrupt")
+        return data
+
+    # --- Manifests ---
+    def save(self, boot_path, files, names=None, after=None):
+        """Records {key: bytes or None} for one card and returns the snapshot id.
+
+        after is {key: sha256 or None} of what the commit is about to write; rollback uses it to
+        check the card still holds that content.
+        """
+        entries = {}
+        for key, data in files.items():
+            entries[key] = None if data is None else {"sha256": self.put_blob(data), "size": len(data)}
+        created = time.time()
+        snapshot_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(created))}-{secrets.token_hex(3)}"
+        manifest = {
+            "id": snapshot_id,
+            "boot_path": os.path.abspath(boot_path),
+            "card": card_identity(boot_path),
+            "created": created,
+            "files": entries,
+            "names": names or {},
+            "after": after or {},
+        }
+        folder = os.path.join(self.manifests_dir, card_id(boot_path))
+        _makedirs(folder)
+        _write_atomic(os.path.join(folder, f"{snapshot_id}.json"), json.dumps(manifest).encode("utf-8"))
+        return snapshot_id
+
+    def _load_manifest(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_snapshots(self, boot_path=None):
+        """Manifests (newest first) for one card, or for every card when boot_path is None."""
+        if boot_path is not None:
+            folders = [os.path.join(self.manifests_dir, card_id(boot_path))]
+        elif os.path.isdir(self.manifests_dir):
+            folders = [e.path for e in os.scandir(self.manifests_dir) if e.is_dir()]
+        else:
+            folders = []
+        manifests = []
+        for folder in folders:
+            if not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                if entry.name.endswith(".json"):
+                    manifests.append(self._load_manifest(entry.path))
+        return sorted(manifests, key=lambda m: m["created"], reverse=True)
+
+    def get(self, boot_path, snapshot_id=None):
+        """A card's manifest by id (the newest one when snapshot_id is None)."""
+        manifests = self.list_snapshots(boot_path)
+        for manifest in manifests:
+            if snapshot_id is None or manifest["id"] == snapshot_id:
+                return manifest
+        raise KeyError(f"No snapshot {snapshot_id} for {boot_path}" if snapshot_id else f"No snapshots for {boot_path}")
+
+    def rollback(self, mgr, snapshot_id=None, force=False):
+        """Puts the card's files back the way the snapshot recorded them, in one transaction.
+
+        Returns the manifest used. Unless force is set, the newest snapshot is only restored if
+        the card still holds what that commit wrote: cloned cards can share a volume serial, and
+        a card changed since then would lose those changes. If the manager has a store attached,
+        the rollback itself is snapshotted first, so it can be undone the same way.
+        """
+        manifest = self.get(mgr.boot_path, snapshot_id)
+        if not force and snapshot_id is None:
+            for key, expected in manifest.get("after", {}).items():
+                data = mgr.read_file(key)
+                current = hashlib.sha256(data).hexdigest() if data is not None else None
+                if current != expected:
+                    raise ValueError(f"{mgr.files[key]} changed since snapshot {manifest['id']} "
+                                     "(another card, or edited since); use --force to restore anyway")
+        contents = {}
+        for key, entry in manifest["files"].items():
+            contents[key] = None if entry is None else self.get_blob(entry["sha256"])
+        mgr.restore_files(contents)
+        return manifest
+
+    # --- Maintenance ---
+    def gc(self, keep=10, max_age_days=None, dry_run=False):
+        """Applies the retention policy, then deletes blobs no remaining manifest refers to.
+
+        Per card, the newest `keep` snapshots are kept, plus any younger than max_age_days.
+        Returns counts of removed manifests and blobs and the bytes freed.
+        """
+        now = time.time()
+        removed_manifests = 0
+        live = set()
+        if os.path.isdir(self.manifests_dir):
+            for folder in os.scandir(self.manifests_dir):
+                if not folder.is_dir():
+                    continue
+                paths = [e.path for e in os.scandir(folder.path) if e.name.endswith(".json")]
+                manifests = sorted(((self._load_manifest(p), p) for p in paths), key=lambda mp: mp[0]["created"], reverse=True)
+                for i, (manifest, path) in enumerate(manifests):
+                    young = max_age_days is not None and now - manifest["created"] < max_age_days * 86400
+                    if i < keep or young:
+                        live.update(e["sha256"] for e in manifest["files"].values() if e)
+                        continue
+                    removed_manifests += 1
+                    if not dry_run:
+                        os.remove(path)
+
+        removed_blobs = 0
+        freed = 0
+        for path, digest, size, mtime in self._scan_blobs():
+            if digest in live or now - mtime < GC_GRACE_SECONDS:
+                continue
+            removed_blobs += 1
+            freed += size
+            if not dry_run:
+                os.remove(path)
+        return {"manifests_removed": removed_manifests, "blobs_removed": removed_blobs, "bytes_freed": freed}
+
+    def _scan_blobs(self):
+        if not os.path.isdir(self.objects_dir):
+            return
+        for bucket in os.scandir(self.objects_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".z"):
+                    st = entry.stat()
+                    yield entry.path, entry.name[:-2], st.st_size, st.st_mtime
+
+    def stats(self):
+        """Space used vs. what plain per-card copies would take.
+
+        logical_bytes: every file of every snapshot, uncompressed. unique_bytes: each distinct
+        file once. stored_bytes: the compressed blobs on disk.
+        """
+        manifests = self.list_snapshots()
+        logical = 0
+        unique = {}
+        for manifest in manifests:
+            for entry in manifest["files"].values():
+                if entry:
+                    logical += entry["size"]
+                    unique[entry["sha256"]] = entry["size"]
+        stored = 0
+        blobs = 0
+        for _, _, size, _ in self._scan_blobs():
+            stored += size
+            blobs += 1
+        return {
+            "cards": len({m["boot_path"] for m in manifests}),
+            "snapshots": len(manifests),
+            "blobs": blobs,
+            "logical_bytes": logical,
+            "unique_bytes": sum(unique.values()),
+            "stored_bytes": stored,
+            "dedup_ratio": logical / sum(unique.values()) if unique else 1.0,
+            "saved_bytes": logical - stored,
+        }
+
+def format_snapshots(manifests):
+    lines = []
+    for manifest in manifests:
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created"]))
+        files = ", ".join(sorted(manifest.get("names", {}).get(k, k) for k in manifest["files"]))
+        lines.append(f"{manifest['id']}  {created}  {manifest['boot_path']}  [{files}]")
+    return "\n".join(lines) if lines else "No snapshots."
+
+def _size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def format_stats(stats):
+    return "\n".join([
+        f"Cards: {stats['cards']}, snapshots: {stats['snapshots']}, blobs: {stats['blobs']}",
+        f"Files as copied per card: {_size(stats['logical_bytes'])}",
+        f"Distinct content:         {_size(stats['unique_bytes'])} (dedup {stats['dedup_ratio']:.1f}x)",
+        f"Stored (compressed):      {_size(stats['stored_bytes'])}, {_size(stats['saved_bytes'])} saved",
+    ])
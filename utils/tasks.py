@@ -0,0 +1,160 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    """Handle for a submitted job: lets the caller cancel it and the job report progress."""
+
+    def __init__(self, executor, owner=None):
+        self._executor = executor
+        self._cancelled = threading.Event()
+        self.owner = owner
+        self.submitted = time.perf_counter()
+
+    def cancel(self):
+        """Stops callbacks from running; a job that checks is_cancelled() can also stop early."""
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self.is_cancelled():
+            raise TaskCancelled()
+
+    def report(self, fraction, message=None):
+        """Called from the job to send progress (0.0 - 1.0) to the on_progress callback."""
+        self._executor._post(self, "progress", (fraction, message))
+
+class TaskExecutor:
+    """Runs slow work (card I/O, hashing, netsh) off the Tk main thread.
+
+    Jobs run on a worker pool (one worker by default, so card operations keep their order).
+    Results, errors and progress are queued and delivered on the main thread by polling with
+    root.after, so callbacks may touch widgets. A heartbeat measures main-thread stalls.
+    Failures of jobs submitted without on_error go to the executor's on_error, or else to Tk's
+    report_callback_exception like any other callback error.
+    """
+
+    def __init__(self, root, workers=1, poll_ms=30, heartbeat_ms=100, stall_threshold_ms=200,
+                 on_busy_change=None, on_error=None):
+        self.root = root
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        self.heartbeat_ms = heartbeat_ms
+        self.stall_threshold = stall_threshold_ms / 1000
+        self.on_busy_change = on_busy_change
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._queue = queue.Queue()
+        self._callbacks = {}
+        self._active = 0
+        self._closed = False
+
+        # Main-thread responsiveness stats
+        self.max_stall = 0.0
+        self.stalls = 0
+        self.completed = 0
+
+        self._last_beat = time.perf_counter()
+        self.root.after(self.poll_ms, self._drain)
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, owner=None, pass_task=False):
+        """Queues fn(*args) (or fn(task, *args) with pass_task) and returns its Task.
+
+        Callbacks are skipped if the task was cancelled or the owner widget has been destroyed.
+        """
+        task = Task(self, owner)
+        self._callbacks[task] = (on_done, on_error, on_progress)
+        self._set_active(self._active + 1)
+
+        def run():
+            try:
+                if task.is_cancelled():
+                    raise TaskCancelled()
+                result = fn(task, *args) if pass_task else fn(*args)
+                self._post(task, "done", result)
+            except TaskCancelled:
+                self._post(task, "cancelled", None)
+            except Exception as e:
+                self._post(task, "error", e)
+
+        self._pool.submit(run)
+        return task
+
+    def _post(self, task, kind, payload):
+        self._queue.put((task, kind, payload))
+
+    def _set_active(self, count):
+        was_busy = self._active > 0
+        self._active = count
+        if self.on_busy_change and was_busy != (count > 0):
+            self.on_busy_change(count > 0)
+
+    def _alive(self, task):
+        if task.is_cancelled():
+            return False
+        owner = task.owner
+        if owner is None:
+            return True
+        try:
+            return bool(owner.winfo_exists())
+        except Exception:
+            return False
+
+    def _drain(self):
+        if self._closed:
+            return
+        while True:
+            try:
+                task, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            on_done, on_error, on_progress = self._callbacks.get(task, (None, None, None))
+            if kind == "progress":
+                if on_progress and self._alive(task):
+                    on_progress(*payload)
+                continue
+
+            self._callbacks.pop(task, None)
+            self._set_active(self._active - 1)
+            self.completed += 1
+            if not self._alive(task):
+                continue
+            if kind == "done" and on_done:
+                on_done(payload)
+            elif kind == "error":
+                if on_error:
+                    on_error(payload)
+                elif self.on_error:
+                    self.on_error(payload)
+                else:
+                    self.root.report_callback_exception(type(payload), payload, payload.__traceback__)
+        self.root.after(self.poll_ms, self._drain)
+
+    def _heartbeat(self):
+        if self._closed:
+            return
+        now = time.perf_counter()
+        late = now - self._last_beat - self.heartbeat_ms / 1000
+        if late > self.stall_threshold:
+            self.stalls += 1
+        self.max_stall = max(self.max_stall, late)
+        self._last_beat = now
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "completed": self.completed,
+            "stalls": self.stalls,
+            "max_stall_ms": round(max(self.max_stall, 0.0) * 1000, 1),
+        }
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,174 @@
+import os
+import select
+import sys
+import threading
+from utils.file_ops import BootConfigManager
+
+# inotify event bits (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+def _load_inotify():
+    """Returns libc with inotify available, or None (non-Linux, or blocked by the platform)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+def snapshot(path):
+    """One os.scandir of the folder: {name: (size, mtime_ns)}, or None if it is gone."""
+    try:
+        with os.scandir(path) as it:
+            result = {}
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                result[entry.name] = (st.st_size, st.st_mtime_ns)
+            return result
+    except OSError:
+        return None
+
+class BootFolderWatcher:
+    """Watches a boot folder and reports file status changes from a background thread.
+
+    Uses inotify on Linux and falls back to polling with os.scandir elsewhere. Bursts of
+    events are debounced; after things settle, on_change(status) is called with the result
+    of BootConfigManager.check_files_status(). on_change runs on the watcher thread, so GUI
+    callers should hand the result to their event loop (e.g. Tk's after).
+    """
+
+    def __init__(self, path, on_change, debounce=0.3, poll_interval=1.0):
+        self.path = path
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._manager = BootConfigManager(path)
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = None, None
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        # The wake pipe exists before the thread does, so stop() can always reach it
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, args=(self._wake_r,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"x")
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2)
+            if thread.is_alive():
+                # Still inside on_change: it will see the stop flag and the pipe's byte later,
+                # so leave the pipe open rather than close fds it may still select on
+                self._thread = None
+                self._wake_r, self._wake_w = None, None
+                return
+        self._thread = None
+        if self._wake_w is not None:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r, self._wake_w = None, None
+
+    def _emit(self):
+        if not self._stop.is_set():
+            # The change that woke us may not have moved the folder's stamp (FAT's 2 s mtimes)
+            self._manager.invalidate_cache()
+            self.on_change(self._manager.check_files_status())
+
+    def _run(self, wake_r):
+        libc = _load_inotify()
+        if libc is not None and self._run_inotify(libc, wake_r):
+            return
+        self._run_polling()
+
+    # --- inotify backend ---
+    def _run_inotify(self, libc, wake_r):
+        """Runs until stopped. Returns False if inotify can't watch the folder (caller then polls)."""
+        fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if fd < 0:
+            return False
+        if libc.inotify_add_watch(fd, os.fsencode(self.path), WATCH_MASK) < 0:
+            os.close(fd)
+            return False
+
+        self.backend = "inotify"
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd, wake_r], [], [])
+                if wake_r in ready:
+                    break
+                gone = self._drain(fd)
+                # Debounce: keep swallowing events until the folder is quiet
+                while not gone and not self._stop.is_set():
+                    ready, _, _ = select.select([fd, wake_r], [], [], self.debounce)
+                    if not ready or wake_r in ready:
+                        break
+                    gone = self._drain(fd)
+                self._emit()
+                if gone:
+                    # Card removed or folder moved: the watch is dead, switch to polling
+                    break
+        finally:
+            os.close(fd)  # the wake pipe belongs to start()/stop()
+        if not self._stop.is_set():
+            self._run_polling()
+        return True
+
+    def _drain(self, fd):
+        """Reads all pending events. Returns True if the watched folder itself went away."""
+        gone = False
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                return gone
+            if not data:
+                return gone
+            offset = 0
+            while offset + 16 <= len(data):
+                mask = int.from_bytes(data[offset + 4:offset + 8], sys.byteorder)
+                name_len = int.from_bytes(data[offset + 12:offset + 16], sys.byteorder)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    gone = True
+                offset += 16 + name_len
+
+    # --- Polling backend ---
+    def _run_polling(self):
+        self.backend = "polling"
+        last = snapshot(self.path)
+        while not self._stop.wait(self.poll_interval):
+            current = snapshot(self.path)
+            if current == last:
+                continue
+            # Debounce: wait until two consecutive scans agree
+            while not self._stop.wait(self.debounce):
+                settled = snapshot(self.path)
+                if settled == current:
+                    break
+                current = settled
+            last = current
+            self._emit()
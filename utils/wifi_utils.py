@@ -1,28 +1,118 @@
-import subprocess
+import glob
+import os
 import re
+import subprocess
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+# How long fetched profiles are reused, so reopening the import dialog is instant
+CACHE_TTL = 60.0
+# Upper bound for the per-profile fallback
+MAX_WORKERS = 8
+
+_cache = {"time": 0.0, "profiles": None}
+_cache_lock = threading.Lock()
+
+def _run(command):
+    return subprocess.check_output(command, shell=True).decode("utf-8", errors="ignore")
+
+# --- Parsers (pure functions, usable on any OS) ---
+def parse_profile_names(output):
+    """Extracts profile names from `netsh wlan show profiles` output."""
+    return [name.strip() for name in re.findall(r"All User Profile\s*:\s*(.*)", output)]
+
+def parse_profile_key(output):
+    """Extracts the clear-text key from `netsh wlan show profile name=... key=clear` output."""
+    password_match = re.search(r"Key Content\s*:\s*(.*)", output)
+    return password_match.group(1).strip() if password_match else None
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def parse_profile_xml(content):
+    """Parses one exported WLAN profile XML into {"ssid", "psk"}, or None if it has no key."""
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    ssid = name = key = None
+    protected = None
+    for elem in root.iter():
+        tag = _local(elem.tag)
+        if tag == "name" and name is None:
+            name = (elem.text or "").strip()
+        elif tag == "SSID":
+            for child in elem:
+                if _local(child.tag) == "name" and child.text:
+                    ssid = child.text.strip()
+        elif tag == "keyMaterial":
+            key = elem.text or ""
+        elif tag == "protected":
+            protected = (elem.text or "").strip().lower()
+    if key is None or protected == "true":
+        return None  # Open network, or the key wasn't exported in clear text
+    return {"ssid": ssid or name, "psk": key}
 
-def get_windows_wifi_profiles():
+def parse_exported_profiles(folder):
+    """Parses every profile XML written by `netsh wlan export profile` into folder."""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.xml"))):
+        with open(path, "rb") as f:
+            profile = parse_profile_xml(f.read())
+        if profile:
+            profiles.append(profile)
+    return profiles
+
+# --- Fetching ---
+def _export_profiles():
+    """Exports all profiles with one netsh call and parses the XML files in bulk (None if nothing was exported)."""
+    with tempfile.TemporaryDirectory() as folder:
+        _run(f'netsh wlan export profile key=clear folder="{folder}"')
+        if not glob.glob(os.path.join(folder, "*.xml")):
+            return None
+        return parse_exported_profiles(folder)
+
+def _fetch_one(profile_name):
+    try:
+        password = parse_profile_key(_run(f'netsh wlan show profile name="{profile_name}" key=clear'))
+    except subprocess.CalledProcessError:
+        return None # Skip if cant get details for some reason
+    if password:
+        return {"ssid": profile_name, "psk": password}
+    return None
+
+def _fetch_per_profile():
+    """Fallback: one `netsh wlan show profile` per profile, on a bounded thread pool."""
+    names = parse_profile_names(_run("netsh wlan show profiles"))
+    if not names:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(names))) as executor:
+        return [p for p in executor.map(_fetch_one, names) if p]
+
+def get_windows_wifi_profiles(use_cache=True):
     """Retrieves saved Wi-Fi profiles and passwords from Windows using netsh."""
-    profiles_data = []
+    with _cache_lock:
+        if use_cache and _cache["profiles"] is not None and time.monotonic() - _cache["time"] < CACHE_TTL:
+            return [dict(p) for p in _cache["profiles"]]
+
     try:
-        # Get list of profiles
-        output = subprocess.check_output("netsh wlan show profiles", shell=True).decode("utf-8", errors="ignore")
-        profiles = re.findall(r"All User Profile\s*:\s*(.*)", output)
-        
-        for profile in profiles:
-            profile_name = profile.strip()
-            try:
-                # Get password for each profile
-                profile_info = subprocess.check_output(f'netsh wlan show profile name="{profile_name}" key=clear', shell=True).decode("utf-8", errors="ignore")
-                password_match = re.search(r"Key Content\s*:\s*(.*)", profile_info)
-                
-                if password_match:
-                    password = password_match.group(1).strip()
-                    profiles_data.append({"ssid": profile_name, "psk": password})
-            except subprocess.CalledProcessError:
-                continue # Skip if cant get details for some reason
-                
+        try:
+            profiles_data = _export_profiles()
+        except (subprocess.CalledProcessError, OSError):
+            profiles_data = None
+        if profiles_data is None:
+            profiles_data = _fetch_per_profile()
     except subprocess.CalledProcessError:
         return []
-        
-    return profiles_data
+
+    with _cache_lock:
+        _cache["profiles"] = profiles_data
+        _cache["time"] = time.monotonic()
+    return [dict(p) for p in profiles_data]
+
+def clear_cache():
+    with _cache_lock:
+        _cache["profiles"] = None
@@ -0,0 +1,292 @@
+import re
+
+# Values of these keys are written as "quoted strings" when they are created from scratch
+QUOTED_KEYS = {
+    "ssid", "psk", "id_str", "identity", "anonymous_identity", "password", "sae_password",
+    "ca_cert", "client_cert", "private_key", "private_key_passwd", "phase1", "phase2",
+}
+
+GLOBAL_DEFAULTS = {
+    "country": "US",
+    "ctrl_interface_dir": "/var/run/wpa_supplicant",
+    "ctrl_interface_group": "netdev",
+    "update_config": "1",
+}
+
+NETWORK_HEADER = re.compile(r'^\s*network\s*=\s*\{\s*$')
+HEX_PSK = re.compile(r'^[0-9a-fA-F]{64}$')
+
+class _Raw:
+    """A line kept verbatim (comment, blank line or anything we don't understand)."""
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+class _Entry:
+    """A key=value line. raw is None once the value changes and the line must be regenerated."""
+    __slots__ = ("key", "value", "quoted", "raw", "indent")
+
+    def __init__(self, key, value, quoted, raw=None, indent=""):
+        self.key = key
+        self.value = value
+        self.quoted = quoted
+        self.raw = raw
+        self.indent = indent
+
+    def set(self, value):
+        if value == self.value:
+            return
+        self.value = value
+        if self.key == "psk":
+            self.quoted = not HEX_PSK.match(value)
+        self.raw = None
+
+    def render(self, newline):
+        if self.raw is not None:
+            return self.raw
+        value = f'"{self.value}"' if self.quoted else self.value
+        return f"{self.indent}{self.key}={value}{newline}"
+
+class _Network:
+    """A network={...} block plus the comments/blank lines directly above it."""
+    __slots__ = ("leading", "header", "items", "footer")
+
+    def __init__(self, header, leading=None, footer=None):
+        self.leading = leading or []
+        self.header = header
+        self.items = []
+        self.footer = footer
+
+    def entries(self):
+        return [item for item in self.items if isinstance(item, _Entry)]
+
+    def to_dict(self):
+        return {e.key: e.value for e in self.entries()}
+
+    def update(self, values):
+        """Makes the block hold exactly the given key/values, keeping untouched lines as they were."""
+        entries = {e.key: e for e in self.entries()}
+        indent = next(iter(entries.values())).indent if entries else "    "
+
+        kept = []
+        for item in self.items:
+            if isinstance(item, _Entry) and item.key not in values:
+                continue  # key removed
+            kept.append(item)
+        self.items = kept
+
+        insert_at = max((i + 1 for i, item in enumerate(self.items) if isinstance(item, _Entry)), default=0)
+        for key, value in values.items():
+            value = str(value)
+            if key in entries:
+                entries[key].set(value)
+            else:
+                self.items.insert(insert_at, new_entry(key, value, indent))
+                insert_at += 1
+
+    def render(self, parts, newline):
+        parts.extend(item.raw for item in self.leading)
+        parts.append(self.header)
+        for item in self.items:
+            parts.append(item.render(newline) if isinstance(item, _Entry) else item.raw)
+        parts.append(self.footer if self.footer is not None else f"}}{newline}")
+
+def new_entry(key, value, indent=""):
+    if key == "psk":
+        quoted = not HEX_PSK.match(value)
+    else:
+        quoted = key in QUOTED_KEYS
+    return _Entry(key, value, quoted, None, indent)
+
+def _parse_entry(line):
+    stripped = line.strip()
+    key, _, value = stripped.partition("=")
+    key = key.strip()
+    value = value.strip()
+    quoted = len(value) >= 2 and value[0] == '"' and value[-1] == '"'
+    if quoted:
+        value = value[1:-1]
+    indent = line[:len(line) - len(line.lstrip())]
+    return _Entry(key, value, quoted, line, indent)
+
+class WpaSupplicantConf:
+    """Lossless model of a wpa_supplicant.conf file.
+
+    Comments, blank lines, key order, quoting, unknown keys and line endings are kept, so a
+    file that is parsed and serialized without changes comes back byte-for-byte identical.
+    """
+
+    def __init__(self, newline="\n"):
+        self.newline = newline
+        self.head = []       # globals, comments and blank lines before the first network
+        self.networks = []   # _Network blocks in file order
+        self.tail = []       # lines after the last network
+        self.exists = False
+
+    @classmethod
+    def parse(cls, text):
+        """Builds the model in a single pass over the lines of text."""
+        conf = cls("\r\n" if "\r\n" in text else "\n")
+        conf.exists = True
+        pending = []   # comments/blank lines not yet attached to anything
+        block = None
+
+        for line in text.splitlines(keepends=True):
+            stripped = line.strip()
+            if block is not None:
+                if stripped.startswith("}"):
+                    block.footer = line
+                    conf.networks.append(block)
+                    block = None
+                elif not stripped or stripped.startswith("#") or "=" not in stripped:
+                    block.items.append(_Raw(line))
+                else:
+                    block.items.append(_parse_entry(line))
+            elif NETWORK_HEADER.match(line):
+                block = _Network(line, pending)
+                pending = []
+            elif not stripped or stripped.startswith("#") or "=" not in stripped:
+                pending.append(_Raw(line))
+            elif not conf.networks:
+                conf.head.extend(pending)
+                pending = []
+                conf.head.append(_parse_entry(line))
+            else:
+                # Globals after a network block are unusual but legal; keep them in place
+                conf.tail.extend(pending)
+                pending = []
+                conf.tail.append(_parse_entry(line))
+
+        if block is not None:
+            # Unterminated block: keep it, the footer is added on write
+            conf.networks.append(block)
+        if conf.networks:
+            conf.tail.extend(pending)
+        else:
+            conf.head.extend(pending)
+        return conf
+
+    def _global_entries(self):
+        return [item for item in self.head + self.tail if isinstance(item, _Entry)]
+
+    def get_globals(self):
+        """Returns the global settings, filling in defaults for anything not in the file."""
+        config = dict(GLOBAL_DEFAULTS)
+        for entry in self._global_entries():
+            if entry.key == "ctrl_interface":
+                dir_value, group = _split_ctrl_interface(entry.value)
+                config["ctrl_interface_dir"] = dir_value
+                if group is not None:
+                    config["ctrl_interface_group"] = group
+            else:
+                config[entry.key] = entry.value
+        return config
+
+    def get_networks(self):
+        return [net.to_dict() for net in self.networks]
+
+    def update(self, config, networks):
+        """Applies the desired globals and network list.
+
+        Globals in config are set (others in the file are left alone). The network list is the
+        complete desired set, in order: blocks are matched to existing ones by SSID so their
+        comments and formatting survive, missing ones are dropped and new ones appended.
+        """
+        self._update_globals(config)
+        self._update_networks(networks)
+        self.exists = True
+
+    def _update_globals(self, config):
+        if not self.exists:
+            config = {**GLOBAL_DEFAULTS, **config}
+        current = self.get_globals()
+        entries = {}
+        for entry in self._global_entries():
+            entries.setdefault(entry.key, entry)
+
+        desired = {}
+        for key, value in config.items():
+            if key in ("ctrl_interface_dir", "ctrl_interface_group"):
+                continue
+            desired[key] = str(value)
+        if "ctrl_interface_dir" in config or "ctrl_interface_group" in config:
+            dir_value = config.get("ctrl_interface_dir", current["ctrl_interface_dir"])
+            group = config.get("ctrl_interface_group", current["ctrl_interface_group"])
+            if (dir_value, group) != (current["ctrl_interface_dir"], current["ctrl_interface_group"]) \
+                    or "ctrl_interface" not in entries:
+                desired["ctrl_interface"] = f"DIR={dir_value} GROUP={group}"
+
+        # Keep the original header order for a brand new file
+        order = ["country", "ctrl_interface", "update_config"]
+        keys = [k for k in order if k in desired] + [k for k in desired if k not in order]
+
+        insert_at = max((i + 1 for i, item in enumerate(self.head) if isinstance(item, _Entry)), default=0)
+        for key in keys:
+            value = desired[key]
+            if key in entries:
+                entries[key].set(value)
+                continue
+            # Don't add lines for defaults that an existing file simply leaves out
+            if self.exists and key in GLOBAL_DEFAULTS and current.get(key) == value:
+                continue
+            if self.exists and key == "ctrl_interface":
+                default = f"DIR={GLOBAL_DEFAULTS['ctrl_interface_dir']} GROUP={GLOBAL_DEFAULTS['ctrl_interface_group']}"
+                if value == default:
+                    continue
+            self.head.insert(insert_at, _Entry(key, value, False))
+            insert_at += 1
+
+    def _update_networks(self, networks):
+        by_ssid = {}
+        for block in self.networks:
+            ssid = block.to_dict().get("ssid")
+            by_ssid.setdefault(ssid, []).append(block)
+
+        result = []
+        for net in networks:
+            values = _network_values(net)
+            candidates = by_ssid.get(values.get("ssid"))
+            if candidates:
+                block = candidates.pop(0)
+            else:
+                block = _Network(f"network={{{self.newline}", [_Raw(self.newline)])
+            block.update(values)
+            result.append(block)
+        self.networks = result
+
+    def serialize(self):
+        parts = []
+        newline = self.newline
+        for item in self.head:
+            parts.append(item.render(newline) if isinstance(item, _Entry) else item.raw)
+        for block in self.networks:
+            block.render(parts, newline)
+        for item in self.tail:
+            parts.append(item.render(newline) if isinstance(item, _Entry) else item.raw)
+        return "".join(parts)
+
+def _split_ctrl_interface(value):
+    """Splits 'DIR=/path GROUP=netdev' (or a bare path) into (dir, group)."""
+    if "DIR=" not in value:
+        return value, None
+    dir_value, group = None, None
+    for token in value.split():
+        if token.startswith("DIR="):
+            dir_value = token[4:]
+        elif token.startswith("GROUP="):
+            group = token[6:]
+    return dir_value or "", group
+
+def _network_values(net):
+    """Normalises a network dict from the GUI/profile into the key/values of its block."""
+    values = {"ssid": net["ssid"]}
+    for key, value in net.items():
+        if key == "ssid" or value is None:
+            continue
+        if key == "psk" and value == "":
+            continue
+        values[key] = str(value)
+    if "psk" not in values and "key_mgmt" not in values:
+        values["key_mgmt"] = "NONE"  # open network
+    return values
@@ -1,16 +1,52 @@
+import asyncio
+import json
 import os
 import shutil
+import struct
+import subprocess
+import sys
+import tempfile
 from utils.file_ops import BootConfigManager
-from utils.crypto import generate_password_hash
+from utils.fat_image import open_image
+from utils.image_clone import clone_and_provision, clone_images
+from utils import crypto
+from utils.crypto import generate_password_hash, precompute_psks
+from utils.wifi_utils import parse_profile_names, parse_profile_key, parse_profile_xml
+from utils.network_config import IPPool, parse_network_config, render_fleet
+from utils.provision import prepare_profile, apply_profile, verify_written
+from utils.snapshots import SnapshotStore, card_id
+from utils.manifest import Checkpoint, run_manifest
+from utils.job_server import JobServer, submit_job, follow_job
+from utils.io_scheduler import AimdController, AdaptiveScheduler
+from utils.bundle import COPIED_FILES, export_bundle, load_bundle, apply_bundle
 
-TEST_DIR = "dummy_boot"
+TEST_DIR = None  # Set by setup(): a temporary folder standing in for a boot partition
 
 def setup():
-    if os.path.exists(TEST_DIR):
-        shutil.rmtree(TEST_DIR)
-    os.makedirs(TEST_DIR)
+    global TEST_DIR
+    TEST_DIR = tempfile.mkdtemp(prefix="bootcfg-test-")
     print(f"Created {TEST_DIR}")
 
+def teardown():
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+def make_fat_image(path, serial=0x1A2B3C4D, sectors=8192):
+    """Writes a small MBR disk image holding one empty FAT16 partition."""
+    fat_size = ((sectors + 2) * 2 + 511) // 512
+    bpb = bytearray(512)
+    bpb[0:11] = b"\xEB\x3C\x90MSWIN4.1"
+    struct.pack_into("<HBHBHHBHHHII", bpb, 11, 512, 1, 1, 2, 512, sectors, 0xF8, fat_size, 32, 2, 1, 0)
+    struct.pack_into("<BBBI11s8s", bpb, 36, 0x80, 0, 0x29, serial, b"bootfs     ", b"FAT16   ")
+    bpb[510:512] = b"\x55\xaa"
+    mbr = bytearray(512)
+    struct.pack_into("<B3sB3sII", mbr, 446, 0, b"\0\0\0", 0x0E, b"\0\0\0", 1, sectors)
+    mbr[510:512] = b"\x55\xaa"
+    fat = bytearray(fat_size * 512)
+    fat[0:4] = b"\xF8\xFF\xFF\xFF"
+    with open(path, "wb") as f:
+        f.write(mbr + bpb + fat + fat)
+        f.truncate(512 * (1 + sectors))
+
 def verify_ssh(mgr):
     print("Testing SSH...")
     mgr.create_ssh()
@@ -53,14 +89,705 @@ def verify_wifi(mgr):
     else:
         print(f"  [FAIL] Expected 2 networks, got {len(parsed_nets)}")
 
+WPA_FIXTURE = (
+    "# Managed by hand\r\n"
+    "ctrl_interface=DIR=/var/run/wpa_supplicant GROUP=netdev\r\n"
+    "update_config=1\r\n"
+    "country=DE\r\n"
+    "ap_scan=1\r\n"
+    "\r\n"
+    "# Office\r\n"
+    "network={\r\n"
+    "\tssid=\"Office\"\r\n"
+    "\tpsk=\"secret\"\r\n"
+    "\tid_str=\"office\"\r\n"
+    "\t# fallback only\r\n"
+    "\tpriority=5\r\n"
+    "}\r\n"
+    "network={\r\n"
+    "\tssid=\"Cafe\"\r\n"
+    "\tkey_mgmt=NONE\r\n"
+    "}\r\n"
+    "network={\r\n"
+    "\tssid=\"Hidden\"\r\n"
+    "\tscan_ssid=1\r\n"
+    "\tpsk=0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef\r\n"
+    "\tbgscan=\"simple:30:-45:300\"\r\n"
+    "}\r\n"
+)
+
+def verify_wifi_roundtrip(mgr):
+    print("Testing Wi-Fi round-trip...")
+    path = os.path.join(TEST_DIR, "wpa_supplicant.conf")
+    with open(path, 'w', newline='') as f:
+        f.write(WPA_FIXTURE)
+
+    global_conf, parsed_nets = mgr.parse_wpa_supplicant()
+    if [n['ssid'] for n in parsed_nets] == ["Office", "Cafe", "Hidden"] and parsed_nets[2].get('scan_ssid') == "1":
+        print("  [PASS] Open, hidden and unknown-key networks parsed")
+    else:
+        print(f"  [FAIL] Unexpected networks: {parsed_nets}")
+
+    mgr.write_wpa_supplicant(global_conf, parsed_nets)
+    with open(path, 'r', newline='') as f:
+        if f.read() == WPA_FIXTURE:
+            print("  [PASS] Unchanged file written back byte-identical")
+        else:
+            print("  [FAIL] Unchanged file was modified on write")
+
+NETSH_PROFILES_FIXTURE = """
+Profiles on interface Wi-Fi:
+
+Group policy profiles (read only)
+---------------------------------
+    <None>
+
+User profiles
+-------------
+    All User Profile     : HomeWifi
+    All User Profile     : Cafe Guest
+"""
+
+NETSH_PROFILE_FIXTURE = """
+Security settings
+-----------------
+    Authentication         : WPA2-Personal
+    Cipher                 : CCMP
+    Security key           : Present
+    Key Content            : secret123
+"""
+
+WLAN_XML_FIXTURE = """<?xml version="1.0"?>
+<WLANProfile xmlns="http://www.microsoft.com/networking/WLAN/profile/v1">
+    <name>HomeWifi</name>
+    <SSIDConfig>
+        <SSID>
+            <hex>486F6D6557696669</hex>
+            <name>HomeWifi</name>
+        </SSID>
+    </SSIDConfig>
+    <connectionType>ESS</connectionType>
+    <MSM>
+        <security>
+            <authEncryption>
+                <authentication>WPA2PSK</authentication>
+                <encryption>AES</encryption>
+                <useOneX>false</useOneX>
+            </authEncryption>
+            <sharedKey>
+                <keyType>passPhrase</keyType>
+                <protected>false</protected>
+                <keyMaterial>secret123</keyMaterial>
+            </sharedKey>
+        </security>
+    </MSM>
+</WLANProfile>
+"""
+
+WLAN_OPEN_XML_FIXTURE = """<?xml version="1.0"?>
+<WLANProfile xmlns="http://www.microsoft.com/networking/WLAN/profile/v1">
+    <name>Cafe Guest</name>
+    <SSIDConfig><SSID><name>Cafe Guest</name></SSID></SSIDConfig>
+    <MSM><security><authEncryption><authentication>open</authentication></authEncryption></security></MSM>
+</WLANProfile>
+"""
+
+def verify_wifi_import():
+    print("Testing Windows Wi-Fi import parsing...")
+    if parse_profile_names(NETSH_PROFILES_FIXTURE) == ["HomeWifi", "Cafe Guest"]:
+        print("  [PASS] Profile names parsed from netsh output")
+    else:
+        print(f"  [FAIL] Profile names: {parse_profile_names(NETSH_PROFILES_FIXTURE)}")
+
+    if parse_profile_key(NETSH_PROFILE_FIXTURE) == "secret123":
+        print("  [PASS] Key parsed from netsh output")
+    else:
+        print("  [FAIL] Key not parsed from netsh output")
+
+    if parse_profile_xml(WLAN_XML_FIXTURE) == {"ssid": "HomeWifi", "psk": "secret123"}:
+        print("  [PASS] Exported profile XML parsed")
+    else:
+        print(f"  [FAIL] Exported profile XML: {parse_profile_xml(WLAN_XML_FIXTURE)}")
+
+    if parse_profile_xml(WLAN_OPEN_XML_FIXTURE) is None:
+        print("  [PASS] Profile without key skipped")
+    else:
+        print("  [FAIL] Profile without key was imported")
+
+def verify_psk_cache():
+    print("Testing WPA PSK cache...")
+    # IEEE 802.11i test vector, as printed by wpa_passphrase
+    expected = "f42c6fc52df0ebef9ebb4b90b38a5f902e83fe1b135a70e23aed762e9710a12e"
+    pairs = [("IEEE", "password")] + [(f"ssid{i}", "password") for i in range(crypto.PSK_CACHE_SIZE + 8)]
+    psks = precompute_psks(pairs, workers=1)
+    stored = " ".join(str(entry) for entry in crypto._psk_cache.items())
+    if psks[0] == expected and len(crypto._psk_cache) == crypto.PSK_CACHE_SIZE and "password" not in stored:
+        print("  [PASS] PSKs derived, cache bounded and keyed without passphrases")
+    else:
+        print(f"  [FAIL] PSK {psks[0]}, cache holds {len(crypto._psk_cache)} entries")
+    crypto.clear_psk_cache()
+
+def verify_parse_cache(mgr):
+    print("Testing parse cache...")
+    mgr.write_userconf("pi", "hash1")
+    path = os.path.join(TEST_DIR, "userconf.txt")
+    old = os.stat(path).st_mtime_ns - 10 * 10**9
+    os.utime(path, ns=(old, old))  # Past the FAT mtime granularity, so the stamp is trusted
+    mgr.parse_userconf()
+    before = mgr.cache_stats()
+    mgr.parse_userconf()
+    if mgr.cache_stats()["hits"] == before["hits"] + 1:
+        print("  [PASS] Unchanged file served from cache")
+    else:
+        print(f"  [FAIL] Cache not hit: {mgr.cache_stats()}")
+
+    # Same size, same mtime tick: a fresh stamp isn't trusted, so the edit is still seen
+    mgr.write_userconf("pi", "hashA")
+    mgr.parse_userconf()
+    stamp = os.stat(path)
+    with open(path, "r+") as f:
+        f.write("pi:hashB\n")
+    os.utime(path, ns=(stamp.st_atime_ns, stamp.st_mtime_ns))
+    if mgr.parse_userconf() == ("pi", "hashB"):
+        print("  [PASS] Change within one mtime tick detected")
+    else:
+        print("  [FAIL] Stale userconf within one mtime tick")
+
+    # Same size, written by the manager itself: must not return the stale snapshot
+    mgr.write_userconf("pi", "hash2")
+    if mgr.parse_userconf() == ("pi", "hash2"):
+        print("  [PASS] Own write invalidates cache")
+    else:
+        print("  [FAIL] Stale userconf after write")
+
+    # External edit that changes the size
+    with open(os.path.join(TEST_DIR, "userconf.txt"), "w") as f:
+        f.write("admin:hash3\n")
+    if mgr.parse_userconf() == ("admin", "hash3"):
+        print("  [PASS] External change detected")
+    else:
+        print("  [FAIL] External change missed")
+
+    _, networks = mgr.parse_wpa_supplicant()
+    networks.append({"ssid": "Mutated"})
+    if all(n["ssid"] != "Mutated" for n in mgr.parse_wpa_supplicant()[1]):
+        print("  [PASS] Cached result is copied")
+    else:
+        print("  [FAIL] Caller mutation leaked into cache")
+
+def verify_network_config(mgr):
+    print("Testing network-config model and IP pool...")
+    pool = IPPool("192.168.50.0/29", gateway="192.168.50.1", exclude=["192.168.50.2-192.168.50.3"])
+    leases = pool.allocate_many(["a", "b", "c"])
+    if list(leases.values()) == ["192.168.50.4/29", "192.168.50.5/29", "192.168.50.6/29"]:
+        print("  [PASS] Addresses skip network, gateway and exclusions")
+    else:
+        print(f"  [FAIL] Leases: {leases}")
+
+    try:
+        pool.allocate("d")
+        print("  [FAIL] Exhausted pool handed out an address")
+    except ValueError:
+        print("  [PASS] Exhausted pool raises")
+
+    pool.release("b")
+    if pool.allocate("d") == "192.168.50.5" and pool.allocate("a") == "192.168.50.4":
+        print("  [PASS] Released address reused, leases idempotent")
+    else:
+        print("  [FAIL] Release/reuse")
+
+    config = render_fleet({"dev": "192.168.50.4/29"}, gateway="192.168.50.1", dns=["1.1.1.1"])["dev"]
+    mgr.write_network_config(config)
+    model = mgr.parse_network_config()
+    if model["ethernets"]["eth0"]["addresses"] == ["192.168.50.4/29"]:
+        print("  [PASS] Rendered config parses back")
+    else:
+        print(f"  [FAIL] Parsed model: {model}")
+
+    try:
+        parse_network_config("version: [2")
+        print("  [FAIL] Invalid YAML accepted")
+    except ValueError:
+        print("  [PASS] Invalid YAML rejected")
+
+CONFIG_TXT_FIXTURE = "# Pi settings\r\ndtparam=audio=on\r\n\r\n[pi4]\r\narm_boost=1\r\n\r\n[all]\r\ndtoverlay=vc4-kms-v3d\r\n"
+
+def verify_boot_txt(mgr):
+    print("Testing config.txt / cmdline.txt...")
+    with open(os.path.join(TEST_DIR, "config.txt"), "w", newline="") as f:
+        f.write(CONFIG_TXT_FIXTURE)
+    changed = mgr.update_config_txt({"all": {"enable_uart": 1, "dtoverlay": "disable-bt"}, "pi4": {"arm_boost": 0}})
+    with open(os.path.join(TEST_DIR, "config.txt"), "r", newline="") as f:
+        content = f.read()
+    expected = CONFIG_TXT_FIXTURE.replace("arm_boost=1", "arm_boost=0") + "enable_uart=1\r\ndtoverlay=disable-bt\r\n"
+    if changed and content == expected:
+        print("  [PASS] Only edited lines changed, CRLF kept")
+    else:
+        print(f"  [FAIL] config.txt: {content!r}")
+
+    conf = mgr.load_config_txt()
+    if conf.get("arm_boost", "pi4") == "0" and conf.get_all("dtoverlay") == ["vc4-kms-v3d", "disable-bt"]:
+        print("  [PASS] Keys indexed per section")
+    else:
+        print("  [FAIL] Section lookup")
+
+    if not mgr.update_config_txt({"all": {"enable_uart": 1}}):
+        print("  [PASS] No-op edit skips the write")
+    else:
+        print("  [FAIL] No-op edit rewrote config.txt")
+
+    with open(os.path.join(TEST_DIR, "cmdline.txt"), "w") as f:
+        f.write("console=serial0,115200 console=tty1 root=PARTUUID=abc rootwait quiet\n")
+    mgr.update_cmdline_txt({"quiet": None, "splash": True, "cfg80211.ieee80211_regdom": "US"})
+    cmdline = mgr.load_cmdline_txt()
+    if cmdline.get("splash") is True and cmdline.get("quiet") is None and cmdline.get_all("console") == ["serial0,115200", "tty1"]:
+        print("  [PASS] cmdline.txt arguments edited")
+    else:
+        print(f"  [FAIL] cmdline.txt: {cmdline.serialize()!r}")
+
+    mgr.update_config_txt({"all": {"enable_uart": True, "disable_splash": False}})
+    conf = mgr.load_config_txt()
+    mgr.update_config_txt({"all": {"disable_splash": None}})
+    try:
+        mgr.update_cmdline_txt({"splash": False})
+        refused = False
+    except ValueError:
+        refused = True
+    if conf.get("enable_uart") == "1" and conf.get("disable_splash") == "0" and refused:
+        print("  [PASS] JSON booleans written as 1/0, false cmdline flag refused")
+    else:
+        print(f"  [FAIL] booleans: enable_uart={conf.get('enable_uart')!r} "
+              f"disable_splash={conf.get('disable_splash')!r} refused={refused}")
+
+def verify_write_elision(mgr):
+    print("Testing dry-run planning and write elision...")
+    profile = prepare_profile({"ssh": True, "user": {"username": "pi", "password": "raspberry"},
+                               "wifi": {"country": "US", "networks": [{"ssid": "Home", "psk": "secret123"}]}})
+    apply_profile(TEST_DIR, profile)
+    stats = {name: os.stat(os.path.join(TEST_DIR, name)) for name in ["userconf.txt", "wpa_supplicant.conf"]}
+
+    result = apply_profile(TEST_DIR, prepare_profile(profile))
+    after = {name: os.stat(os.path.join(TEST_DIR, name)) for name in stats}
+    unchanged = all((a.st_mtime_ns, a.st_ino) == (b.st_mtime_ns, b.st_ino) for a, b in zip(stats.values(), after.values()))
+    if unchanged and set(result["plan"].values()) == {"unchanged"}:
+        print("  [PASS] Re-applying a profile rewrites nothing (password re-verified, not re-salted)")
+    else:
+        print(f"  [FAIL] Plan on re-apply: {result['plan']}")
+
+    with mgr.transaction(dry_run=True):
+        mgr.remove_ssh()
+        mgr.write_network_config(mgr.read_network_config())
+    if mgr.last_plan == {"ssh": "delete", "network_config": "unchanged"} and mgr.check_files_status()["ssh"]:
+        print("  [PASS] Dry run reports changes without writing")
+    else:
+        print(f"  [FAIL] Dry run: {mgr.last_plan}")
+
+    def card_contents():
+        contents = {}
+        for name in sorted(os.listdir(TEST_DIR)):
+            path = os.path.join(TEST_DIR, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    contents[name] = f.read()
+        return contents
+
+    before = card_contents()
+    try:
+        with mgr.transaction():
+            mgr.remove_ssh()
+            mgr.write_userconf("other", "hash")
+            mgr.update_config_txt({"all": {"enable_uart": 0}})
+            raise RuntimeError("interrupted")
+    except RuntimeError:
+        pass
+    after = card_contents()
+    if after == before and not any(name.endswith(".tmp") for name in after):
+        print("  [PASS] Transaction that raises partway leaves the card untouched")
+    else:
+        changed = sorted(set(before) ^ set(after) | {n for n in before if before[n] != after.get(n)})
+        print(f"  [FAIL] Failed transaction changed: {changed}")
+
+def verify_snapshots(mgr):
+    print("Testing snapshot store...")
+    store = SnapshotStore(tempfile.mkdtemp(prefix="bootcfg-snapshots-"))
+    try:
+        mgr.snapshots = store
+        mgr.write_userconf("pi", "before")
+        mgr.write_userconf("pi", "after")
+        store.rollback(mgr)
+        if mgr.parse_userconf() == ("pi", "before") and len(store.list_snapshots(TEST_DIR)) == 3:
+            print("  [PASS] Rollback restores the overwritten file (and is snapshotted itself)")
+        else:
+            print(f"  [FAIL] After rollback: {mgr.parse_userconf()}")
+
+        # A second card holding the same content adds a manifest, not another blob
+        blobs = store.stats()["blobs"]
+        store.save(os.path.join(TEST_DIR, "other-card"), {"userconf": b"pi:before\n"})
+        stats = store.stats()
+        if stats["blobs"] == blobs and stats["dedup_ratio"] > 1:
+            print("  [PASS] Identical files stored once")
+        else:
+            print(f"  [FAIL] Dedup stats: {stats}")
+
+        # Something else rewrote the file since the last snapshot: don't silently undo it
+        mgr.write_userconf("pi", "after")
+        with open(os.path.join(TEST_DIR, "userconf.txt"), "w") as f:
+            f.write("other:card\n")
+        try:
+            store.rollback(mgr)
+            print("  [FAIL] Rolled back over content the snapshot didn't write")
+        except ValueError:
+            print("  [PASS] Rollback refused when the card no longer holds what was written")
+
+        # Two cards mounted at the same place one after another keep separate histories
+        image = os.path.join(store.root, "card.img")
+        make_fat_image(image, serial=0x11111111)
+        first = card_id(image)
+        make_fat_image(image, serial=0x22222222)
+        if first != card_id(image):
+            print("  [PASS] Snapshot history keyed by volume serial, not mount path")
+        else:
+            print("  [FAIL] Different cards at one path share a snapshot history")
+    finally:
+        mgr.snapshots = None
+        shutil.rmtree(store.root, ignore_errors=True)
+
+def verify_readback(mgr):
+    print("Testing read-back verification...")
+    result = apply_profile(TEST_DIR, prepare_profile({"network_config": "version: 2\nethernets: {}\n"}))
+    check = verify_written(TEST_DIR, result["written"])
+    if check["ok"] and check["bytes"] > 0:
+        print("  [PASS] Written files read back intact")
+    else:
+        print(f"  [FAIL] Read-back: {check}")
+
+    with open(os.path.join(TEST_DIR, "network-config"), "w") as f:
+        f.write("version: 1\n")  # what a card that silently dropped the write would hand back
+    check = verify_written(TEST_DIR, result["written"], direct=True)
+    if not check["ok"] and check["mismatches"] == ["network_config"]:
+        print("  [PASS] Lost write detected")
+    else:
+        print(f"  [FAIL] Mismatch missed: {check}")
+
+def verify_fat_image():
+    print("Testing FAT image backend...")
+    workdir = tempfile.mkdtemp(prefix="bootcfg-image-")
+    try:
+        image = os.path.join(workdir, "card.img")
+        make_fat_image(image)
+        big = bytes(range(256)) * 20  # spans several clusters
+        with open_image(image, writable=True) as volume:
+            volume.write_file("config.txt", b"arm_64bit=1\n")
+            volume.write_file("wpa_supplicant.conf", big)
+            volume.write_file("scratch.txt", b"x")
+            volume.write_file("wpa_supplicant.conf", big[:700])
+            volume.delete_file("scratch.txt")
+        with open_image(image) as volume:
+            names = sorted(entry.name for entry in volume.list_root())
+            if names == ["config.txt", "wpa_supplicant.conf"] and volume.read_file("wpa_supplicant.conf") == big[:700]:
+                print("  [PASS] Files written, shrunk, deleted and long names read back")
+            else:
+                print(f"  [FAIL] Image root holds {names}")
+
+        mgr = BootConfigManager(image)
+        mgr.create_ssh()
+        mgr.write_userconf("pi", "hash")
+        mgr.write_network_config("version: 2\n")
+        mgr.update_config_txt({"all": {"enable_uart": 1}})
+        reopened = BootConfigManager(image)
+        status = reopened.check_files_status()
+        if (reopened.parse_userconf() == ("pi", "hash") and status["ssh"] and status["network_config"]
+                and reopened.load_config_txt().get("enable_uart") == "1"):
+            print("  [PASS] BootConfigManager edits a .img in place")
+        else:
+            print(f"  [FAIL] Image after edits: {status}, user {reopened.parse_userconf()}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def verify_image_clone():
+    print("Testing golden image clone and patch...")
+    workdir = tempfile.mkdtemp(prefix="bootcfg-clone-")
+    try:
+        golden = os.path.join(workdir, "golden.img")
+        make_fat_image(golden)
+        with open(golden, "rb") as f:
+            golden_bytes = f.read()
+        device = os.path.join(workdir, "pi-1.img")
+        result = clone_and_provision(golden, device, prepare_profile({"ssh": True}))
+        with open(golden, "rb") as f:
+            untouched = f.read() == golden_bytes
+        if result["ok"] and untouched and BootConfigManager(device).check_files_status()["ssh"]:
+            print(f"  [PASS] Clone patched ({result['clone_method']}), golden image unchanged")
+        else:
+            print(f"  [FAIL] Clone: ok={result['ok']} error={result['error']} golden unchanged={untouched}")
+
+        refused = 0
+        for clone in (lambda: clone_images(golden, [(golden, {"ssh": True})]),
+                      lambda: clone_and_provision(golden, golden, prepare_profile({"ssh": True}))):
+            try:
+                clone()
+            except ValueError:
+                refused += 1
+        refused = refused == 2
+        with open(golden, "rb") as f:
+            untouched = f.read() == golden_bytes
+        if refused and untouched:
+            print("  [PASS] Cloning the golden image onto itself refused")
+        else:
+            print(f"  [FAIL] Self-clone refused={refused}, golden unchanged={untouched}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def verify_manifest():
+    print("Testing manifest ingestion with checkpoint/resume...")
+    workdir = tempfile.mkdtemp(prefix="bootcfg-manifest-")
+    try:
+        manifest_path = os.path.join(workdir, "devices.csv")
+        with open(manifest_path, "w", newline="") as f:
+            f.write("boot_path,hostname,wifi,address\n")
+            for i in range(1, 6):
+                os.makedirs(os.path.join(workdir, f"card{i}"))
+                f.write(f"{os.path.join(workdir, f'card{i}')},pi-{i},office,10.0.0.{i + 10}/24\n")
+        base = {"ssh": True, "wifi_sets": {"office": {"country": "US", "networks": [{"ssid": "Office", "psk": "secret123"}]}},
+                "defaults": {"gateway": "10.0.0.1"}}
+        checkpoint_path = os.path.join(workdir, "devices.ckpt")
+
+        # Pretend an earlier run finished rows 1-2 and row 4 before it was interrupted
+        checkpoint = Checkpoint(checkpoint_path, manifest_path)
+        for row in (1, 2, 4):
+            checkpoint.mark(row, True)
+        checkpoint.save()
+        seen = []
+        counts = run_manifest(manifest_path, base, checkpoint_path, workers=2, on_result=lambda r: seen.append(r["row"]))
+        if sorted(seen) == [3, 5] and counts["skipped"] == 3 and counts["failed"] == 0:
+            print("  [PASS] Resume skips finished rows")
+        else:
+            print(f"  [FAIL] Rows run: {seen}, counts {counts}")
+
+        mgr = BootConfigManager(os.path.join(workdir, "card3"))
+        model = mgr.parse_network_config()
+        if mgr.load_cmdline_txt().get("systemd.hostname") == "pi-3" and model["ethernets"]["eth0"]["addresses"] == ["10.0.0.13/24"]:
+            print("  [PASS] Row fields written to the card")
+        else:
+            print(f"  [FAIL] card3: {mgr.load_cmdline_txt().serialize()!r} {model}")
+
+        if Checkpoint.load(checkpoint_path, manifest_path).next_row == 6:
+            print("  [PASS] Checkpoint watermark covers every row")
+        else:
+            print("  [FAIL] Checkpoint incomplete")
+
+        # on_result failing partway: rows already handled must not be counted or reported twice
+        reported = []
+        def fail_once(res):
+            reported.append(res["row"])
+            if len(reported) == 1:
+                raise RuntimeError("display closed")
+        try:
+            run_manifest(manifest_path, base, os.path.join(workdir, "again.ckpt"), workers=2, on_result=fail_once)
+        except RuntimeError:
+            pass
+        if reported and len(reported) == len(set(reported)):
+            print("  [PASS] Interrupted run reports each row once")
+        else:
+            print(f"  [FAIL] Rows reported: {reported}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def verify_job_server():
+    print("Testing job server...")
+
+    async def scenario():
+        server = await JobServer(port=0, workers=2).start()
+        try:
+            loop = asyncio.get_running_loop()
+            url = f"http://127.0.0.1:{server.port}"
+            # The blocking client runs off the loop, like a separate process would
+            job = await loop.run_in_executor(None, submit_job, url, TEST_DIR, {"ssh": True}, True, 10, server.token)
+            events = await loop.run_in_executor(
+                None, lambda: [e["stage"] for e in follow_job(url, job["id"], timeout=10, token=server.token)])
+            refused = await loop.run_in_executor(None, probe_refusals, server)
+            missing = server.submit({"boot_path": os.path.join(TEST_DIR, "no-such-card"), "profile": {"ssh": True}})
+            await server._queue.join()
+            return job, events, server.jobs[missing["id"]]["state"], server.metrics_text(), refused
+        finally:
+            await server.stop()
+
+    def probe_refusals(server):
+        import http.client
+        body = json.dumps({"boot_path": TEST_DIR, "profile": {"ssh": True}})
+        auth = {"Authorization": f"Bearer {server.token}"}
+        attempts = {
+            "no token": {"Content-Type": "application/json"},
+            "browser origin": {**auth, "Content-Type": "application/json", "Origin": "http://evil.example"},
+            "rebound host": {**auth, "Content-Type": "application/json", "Host": "evil.example"},
+            "text/plain": {**auth, "Content-Type": "text/plain"},
+            "bad length": {**auth, "Content-Type": "application/json", "Content-Length": "abc"},
+        }
+        statuses = {}
+        for name, headers in attempts.items():
+            conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+            conn.putrequest("POST", "/jobs", skip_host="Host" in headers)
+            for key, value in headers.items():
+                conn.putheader(key, value)
+            if "Content-Length" not in headers:
+                conn.putheader("Content-Length", str(len(body)))
+            conn.endheaders(body.encode("utf-8"))
+            statuses[name] = conn.getresponse().status
+            conn.close()
+        return statuses
+
+    job, events, missing_state, metrics_text, refused = asyncio.run(scenario())
+    if job["state"] == "queued" and events[-1] == "done" and os.path.exists(os.path.join(TEST_DIR, "ssh")):
+        print("  [PASS] Submitted job queued at once and ran to completion")
+    else:
+        print(f"  [FAIL] Job {job}, events {events}")
+    if missing_state == "failed" and 'bootcfg_jobs_finished_total{state="failed"} 1' in metrics_text:
+        print("  [PASS] Failed job reported in state and metrics")
+    else:
+        print(f"  [FAIL] Missing card job ended as {missing_state}")
+    if refused == {"no token": 401, "browser origin": 403, "rebound host": 403, "text/plain": 415, "bad length": 400}:
+        print("  [PASS] Requests without the token, from browsers or with bad headers refused")
+    else:
+        print(f"  [FAIL] Refusals {refused}")
+
+def verify_io_scheduler():
+    print("Testing adaptive I/O scheduler...")
+    controller = AimdController(initial=1, maximum=8)
+    for rate in (1.0, 2.0, 3.0, 3.0):  # faster, faster, then flat right after an increase
+        controller.observe(rate)
+    if controller.history == [1, 2, 3, 4, 3]:
+        print("  [PASS] Limit grows while the rate improves and steps back at the plateau")
+    else:
+        print(f"  [FAIL] Limit history {controller.history}")
+    controller.observe(1.0)  # congestion
+    if controller.limit == 1:
+        print("  [PASS] Limit cut multiplicatively when the rate drops")
+    else:
+        print(f"  [FAIL] Limit {controller.limit} after a drop")
+
+    scheduler = AdaptiveScheduler(group_of=lambda n: (f"bus{n % 2}", f"card{n}"), min_window_s=0)
+    results = scheduler.run(list(range(10)), lambda n: n * n if n != 3 else 1 / 0)
+    report = scheduler.report()
+    if results[:3] == [0, 1, 4] and results[3]["ok"] is False and sorted(report) == ["bus0", "bus1"] \
+            and sum(info["cards"] for info in report.values()) == 10:
+        print("  [PASS] Scheduler returns results in order, per-bus report complete")
+    else:
+        print(f"  [FAIL] Results {results}, report {report}")
+
+def verify_bundle(mgr):
+    print("Testing profile bundles...")
+    workdir = tempfile.mkdtemp(prefix="bootcfg-bundle-")
+    try:
+        bundle_path = os.path.join(workdir, "test.bcfg")
+        export_bundle(TEST_DIR, bundle_path)
+        bundle = load_bundle(bundle_path)
+        target = os.path.join(workdir, "target")
+        os.makedirs(target)
+        target_mgr = BootConfigManager(target)
+        with open(os.path.join(target, "cmdline.txt"), "w") as f:
+            f.write("console=tty1 root=PARTUUID=target-02 rootwait\n")
+        result = apply_bundle(target, bundle)
+        copied = all(target_mgr.read_file(key) == mgr.read_file(key) for key in COPIED_FILES)
+        if result["ok"] and copied and bundle["manifest"]["model"]["user"]["password_hash"] == mgr.parse_userconf()[1]:
+            print("  [PASS] Bundle copies the boot files and keeps the parsed model")
+        else:
+            print(f"  [FAIL] Bundle apply {result}")
+        if target_mgr.load_cmdline_txt().get("root") == "PARTUUID=target-02":
+            print("  [PASS] Bundle keeps the target's root= in cmdline.txt")
+        else:
+            print(f"  [FAIL] cmdline.txt became {target_mgr.read_file('cmdline_txt')}")
+
+        sparse = os.path.join(workdir, "sparse")
+        os.makedirs(sparse)
+        with open(os.path.join(sparse, "ssh"), "w"):
+            pass
+        export_bundle(sparse, bundle_path)
+        kept = apply_bundle(target, load_bundle(bundle_path))
+        if kept["ok"] and all(target_mgr.read_file(key) is not None for key in target_mgr.files):
+            print("  [PASS] Files missing from the source are kept on the target")
+        else:
+            print(f"  [FAIL] Sparse bundle plan {kept['plan']}")
+        export_bundle(TEST_DIR, bundle_path)
+        again = apply_bundle(target, bundle)
+        if set(again["plan"].values()) == {"unchanged"}:
+            print("  [PASS] Re-applying a bundle writes nothing")
+        else:
+            print(f"  [FAIL] Re-apply plan {again['plan']}")
+
+        with open(bundle_path, "r+b") as f:
+            data = f.read()
+            offset = data.index(mgr.read_file("wpa_supplicant"))  # entries are stored uncompressed
+            f.seek(offset)
+            f.write(bytes([data[offset] ^ 0xFF]))
+        try:
+            load_bundle(bundle_path)
+            print("  [FAIL] Corrupt bundle loaded")
+        except ValueError:
+            print("  [PASS] Corrupt bundle rejected")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# Runs main.py the way the exe does for a headless command and lists the GUI modules it loaded
+HEADLESS_PROBE = """
+import json, runpy, sys
+sys.argv = ["main.py"] + sys.argv[1:]
+try:
+    runpy.run_path("main.py", run_name="__main__")
+except SystemExit as e:
+    code = e.code
+print(json.dumps({"code": code, "gui": sorted(m for m in sys.modules if m.split(".")[0] in ("tkinter", "customtkinter"))}))
+"""
+
+def verify_headless_imports():
+    print("Testing headless startup...")
+    workdir = tempfile.mkdtemp(prefix="bootcfg-headless-")
+    try:
+        card = os.path.join(workdir, "card")
+        os.makedirs(card)
+        profile = os.path.join(workdir, "profile.json")
+        with open(profile, "w") as f:
+            json.dump({"ssh": True}, f)
+        env = dict(os.environ, BOOTCFG_STATE_DIR=workdir)
+        proc = subprocess.run([sys.executable, "-c", HEADLESS_PROBE, "batch", profile, card, "--no-snapshot"],
+                              capture_output=True, text=True, env=env, timeout=60)
+        try:
+            report = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            report = None
+        if report and report["code"] == 0 and not report["gui"] and os.path.exists(os.path.join(card, "ssh")):
+            print("  [PASS] main.py batch provisions without importing Tk")
+        else:
+            print(f"  [FAIL] Headless run: {report or proc.stderr.strip()[-300:]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
 def run_tests():
     setup()
-    mgr = BootConfigManager(TEST_DIR)
-    
-    verify_ssh(mgr)
-    verify_user(mgr)
-    verify_wifi(mgr)
-    
+    try:
+        mgr = BootConfigManager(TEST_DIR)
+
+        verify_ssh(mgr)
+        verify_user(mgr)
+        verify_wifi(mgr)
+        verify_wifi_roundtrip(mgr)
+        verify_wifi_import()
+        verify_psk_cache()
+        verify_parse_cache(mgr)
+        verify_network_config(mgr)
+        verify_boot_txt(mgr)
+        verify_write_elision(mgr)
+        verify_snapshots(mgr)
+        verify_readback(mgr)
+        verify_fat_image()
+        verify_image_clone()
+        verify_manifest()
+        verify_job_server()
+        verify_io_scheduler()
+        verify_bundle(mgr)
+        verify_headless_imports()
+    finally:
+        teardown()
+
     print("\nTests Completed.")
 
 if __name__ == "__main__":